@@ -17,6 +17,8 @@ SET client_min_messages = warning;
 SET search_path = public;
 SET row_security = off;
 
+DROP INDEX IF EXISTS public.unique_source_destination_stats_group;
+DROP INDEX IF EXISTS public.unique_account_stats_group;
 DROP INDEX IF EXISTS public.type;
 DROP INDEX IF EXISTS public.total_amount;
 DROP INDEX IF EXISTS public.source_account;
@@ -39,12 +41,10 @@ DROP INDEX IF EXISTS public.accounts_pending;
 DROP INDEX IF EXISTS public.accounts_modified_timestamp;
 DROP INDEX IF EXISTS public.accounts_balance;
 DROP INDEX IF EXISTS public.accounts_account;
-ALTER TABLE IF EXISTS ONLY public.source_destination_stats DROP CONSTRAINT IF EXISTS unique_source_destination_stats;
 ALTER TABLE IF EXISTS ONLY public.rollup_daily DROP CONSTRAINT IF EXISTS unique_rollup_daily;
 ALTER TABLE IF EXISTS ONLY public.historical_price DROP CONSTRAINT IF EXISTS unique_historical_price;
 ALTER TABLE IF EXISTS ONLY public.blocks_tags DROP CONSTRAINT IF EXISTS unique_blocks_tags;
 ALTER TABLE IF EXISTS ONLY public.accounts_tags DROP CONSTRAINT IF EXISTS unique_accounts_tags;
-ALTER TABLE IF EXISTS ONLY public.account_stats DROP CONSTRAINT IF EXISTS unique_account_stats_account;
 ALTER TABLE IF EXISTS ONLY public.stats_hourly DROP CONSTRAINT IF EXISTS stats_hourly_pkey;
 ALTER TABLE IF EXISTS ONLY public.blocks DROP CONSTRAINT IF EXISTS blocks_pkey;
 ALTER TABLE IF EXISTS ONLY public.accounts DROP CONSTRAINT IF EXISTS accounts_pkey;
@@ -83,15 +83,9 @@ CREATE TABLE public.account_blocks_summary (
 
 CREATE TABLE public.account_stats (
     account character varying(65) NOT NULL,
-    block_count integer NOT NULL,
-    account_count integer NOT NULL,
-    min_timestamp integer NOT NULL,
-    max_timestamp integer NOT NULL,
-    min_amount numeric(39,0) DEFAULT NULL::numeric,
-    max_amount numeric(39,0) DEFAULT NULL::numeric,
-    total_amount numeric(39,0) DEFAULT NULL::numeric,
-    max_account character varying(65) NOT NULL,
-    type integer NOT NULL
+    block_count bigint NOT NULL,
+    total_amount numeric NOT NULL,
+    blocktype text NOT NULL
 );
 
 
@@ -256,11 +250,10 @@ CREATE TABLE public.rollup_daily (
 
 CREATE TABLE public.source_destination_stats (
     source_account character varying(65) NOT NULL,
-    destination_account character varying(65) NOT NULL,
-    block_count integer,
-    total_amount numeric(39,0) DEFAULT NULL::numeric,
-    blocktype integer NOT NULL,
-    modified_timestamp integer NOT NULL
+    destination_account character varying(65),
+    block_count bigint NOT NULL,
+    total_amount numeric NOT NULL,
+    blocktype text NOT NULL
 );
 
 
@@ -362,14 +355,6 @@ ALTER TABLE ONLY public.stats_hourly
     ADD CONSTRAINT stats_hourly_pkey PRIMARY KEY (hour_timestamp);
 
 
---
--- Name: account_stats unique_account_stats_account; Type: CONSTRAINT; Schema: public; Owner: -
---
-
-ALTER TABLE ONLY public.account_stats
-    ADD CONSTRAINT unique_account_stats_account UNIQUE (account);
-
-
 --
 -- Name: accounts_tags unique_accounts_tags; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -402,14 +387,6 @@ ALTER TABLE ONLY public.rollup_daily
     ADD CONSTRAINT unique_rollup_daily UNIQUE ("timestamp");
 
 
---
--- Name: source_destination_stats unique_source_destination_stats; Type: CONSTRAINT; Schema: public; Owner: -
---
-
-ALTER TABLE ONLY public.source_destination_stats
-    ADD CONSTRAINT unique_source_destination_stats UNIQUE (source_account, destination_account);
-
-
 --
 -- Name: accounts_account; Type: INDEX; Schema: public; Owner: -
 --
@@ -564,6 +541,20 @@ CREATE INDEX total_amount ON public.source_destination_stats USING btree (total_
 CREATE INDEX type ON public.account_blocks_summary USING btree (type);
 
 
+--
+-- Name: unique_account_stats_group; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE UNIQUE INDEX unique_account_stats_group ON public.account_stats USING btree (account, blocktype);
+
+
+--
+-- Name: unique_source_destination_stats_group; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE UNIQUE INDEX unique_source_destination_stats_group ON public.source_destination_stats USING btree (source_account, COALESCE(destination_account, ''::character varying), blocktype);
+
+
 --
 -- Name: SCHEMA public; Type: ACL; Schema: -; Owner: -
 --
@@ -0,0 +1,184 @@
+# Dense uint32 ids for accounts, so the exports can store a 4 byte integer
+# instead of a 65 character nano_ address in every account column. Ids are
+# given in the order accounts are added and never change: the dictionary is
+# saved as a parquet file (id, account, public_key) and loaded again by the
+# next export, which only appends the accounts it has not seen.
+#
+# The first pass of an export adds the accounts table in key order, then the
+# representatives and send destinations of the blocks that are not accounts
+# (never opened), so every account column of the export can be looked up.
+
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import lmdb_shards
+import nanodb_batch
+import pipeline
+
+ID_TYPE = pa.uint32()
+
+schema = pa.schema(
+    [
+        pa.field("id", ID_TYPE),
+        pa.field("account", pa.string()),
+        pa.field("public_key", pa.binary(32)),
+    ]
+)
+
+
+def _prefixes(keys):
+    return np.ascontiguousarray(keys[:, :8]).view(">u8").ravel().astype(np.uint64)
+
+
+def referenced_accounts(items):
+    """Distinct accounts, representatives and send destinations of blocks entries."""
+    columns = nanodb_batch.decode_block_columns(items)
+    keys = np.concatenate(
+        [
+            columns["account"],
+            columns["representative"][columns["representative_valid"]],
+            columns["link"][nanodb_batch.is_send(columns)],
+        ]
+    )
+    unique, _ = nanodb_batch.unique_rows(keys)
+    return np.frombuffer(b"".join(unique), np.uint8).reshape(-1, 32)
+
+
+class AccountDictionary:
+    """Account public keys, the id of each one is its row."""
+
+    def __init__(self, keys=None):
+        self.keys = np.zeros((0, 32), np.uint8) if keys is None else keys
+        self._index()
+
+    def _index(self):
+        # Sorted by the first 8 bytes of the key like the ledger indexes, the
+        # few keys sharing a prefix are looked up in a dict instead.
+        prefixes = _prefixes(self.keys)
+        self.order = np.argsort(prefixes, kind="stable").astype(np.uint32)
+        self.prefixes = prefixes[self.order]
+        shared = np.zeros(len(self.prefixes), np.bool_)
+        shared[1:] |= self.prefixes[1:] == self.prefixes[:-1]
+        shared[:-1] |= self.prefixes[1:] == self.prefixes[:-1]
+        self.shared = {
+            self.keys[row].tobytes(): int(row) for row in self.order[shared].tolist()
+        }
+
+    @classmethod
+    def load(cls, path):
+        """Dictionary saved at path, an empty one if there is none."""
+        if not os.path.exists(path):
+            return cls()
+        table = pq.read_table(path, columns=["id", "public_key"])
+        ids = table.column("id").to_numpy()
+        keys = np.frombuffer(
+            b"".join(table.column("public_key").to_pylist()), np.uint8
+        ).reshape(-1, 32)
+        return cls(keys[np.argsort(ids)])
+
+    def save(self, path):
+        # Replace the file only once it is complete
+        table = pa.table(
+            [
+                pa.array(np.arange(len(self), dtype=np.uint32), ID_TYPE),
+                nanodb_batch.account_id_array(self.keys),
+                nanodb_batch.fixed_size_binary_array(self.keys),
+            ],
+            schema=schema,
+        )
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Ids for a (n, 32) uint8 key column and the found mask."""
+        ids = np.zeros(len(keys), np.uint32)
+        found = np.zeros(len(keys), np.bool_)
+        if not len(self) or not len(keys):
+            return ids, found
+        search = _prefixes(keys)
+        positions = np.minimum(np.searchsorted(self.prefixes, search), len(self) - 1)
+        ids = self.order[positions]
+        found = (self.prefixes[positions] == search) & np.all(
+            self.keys[ids] == keys, axis=1
+        )
+        if self.shared:
+            for row in np.flatnonzero(~found):
+                key_id = self.shared.get(keys[row].tobytes())
+                if key_id is not None:
+                    ids[row], found[row] = key_id, True
+        ids[~found] = 0
+        return ids, found
+
+    def get(self, key):
+        """Id of one 32 byte account key, KeyError if it was never added."""
+        ids, found = self.lookup(np.frombuffer(key, np.uint8).reshape(1, 32))
+        if not found[0]:
+            raise KeyError("account {} is not in the dictionary".format(key.hex()))
+        return int(ids[0])
+
+    def add(self, keys):
+        """Give the next ids to the keys of a (n, 32) column that have none yet."""
+        _, found = self.lookup(keys)
+        new, first = np.unique(
+            np.ascontiguousarray(keys[~found]).view(np.dtype((np.void, 32))).ravel(),
+            return_index=True,
+        )
+        if not len(new):
+            return 0
+        new = new[np.argsort(first)].view(np.uint8).reshape(-1, 32)
+        if len(self) + len(new) > np.iinfo(np.uint32).max:
+            raise ValueError("more accounts than uint32 ids")
+        self.keys = np.concatenate([self.keys, new])
+        self._index()
+        return len(new)
+
+    def add_ledger(self, filename, delta=None, blocks=True, batch_size=100000):
+        """Add the accounts of a ledger file and the accounts its blocks refer to.
+
+        With a lmdb_delta.Delta only the blocks of the delta are scanned, with
+        blocks=False none are.
+        """
+        env = lmdb_shards.open_env(filename)
+        accounts_db = env.open_db("accounts".encode())
+        blocks_db = env.open_db("blocks".encode())
+        count = 0
+        with env.begin() as txn:
+            cursor = txn.cursor(accounts_db)
+            keys = b"".join(cursor.iternext(values=False))
+            count += self.add(np.frombuffer(keys, np.uint8).reshape(-1, 32))
+            cursor.close()
+
+            # Accounts only referenced by blocks are few, they are collected
+            # and added at the end instead of indexing the dictionary per batch
+            cursor = txn.cursor(blocks_db)
+            entries = cursor if delta is None else delta.blocks(txn, blocks_db)
+            if not blocks:
+                entries = []
+            missing = set()
+            for items in pipeline.read_batches(entries, batch_size):
+                referenced = referenced_accounts(items)
+                _, found = self.lookup(referenced)
+                missing.update(key.tobytes() for key in referenced[~found])
+            cursor.close()
+        env.close()
+        if missing:
+            count += self.add(
+                np.frombuffer(b"".join(sorted(missing)), np.uint8).reshape(-1, 32)
+            )
+        return count
+
+    def array(self, raw, valid=None):
+        """uint32 id column for a (n, 32) uint8 key column, null where not valid."""
+        ids, found = self.lookup(raw)
+        if valid is not None:
+            found |= ~valid
+        if not found.all():
+            key = raw[np.flatnonzero(~found)[0]].tobytes()
+            raise KeyError("account {} is not in the dictionary".format(key.hex()))
+        return pa.array(ids, ID_TYPE, mask=None if valid is None else ~valid)
@@ -0,0 +1,49 @@
+# Compare nano_ address encoding throughput: nanolib per key, the memoized
+# nano_account.account_id and the vectorized nano_account.account_ids.
+#
+#   python benchmark-account-id.py --keys 100000 --accounts 5000
+
+import argparse
+import os
+import time
+
+import nanolib
+import numpy as np
+
+import nano_account
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--keys", type=int, default=100000, help="Number of keys to encode")
+parser.add_argument(
+    "--accounts",
+    type=int,
+    default=5000,
+    help="Number of distinct accounts the keys are drawn from",
+)
+args = parser.parse_args()
+
+accounts = [os.urandom(32) for _ in range(args.accounts)]
+keys = [accounts[i] for i in np.random.randint(0, args.accounts, args.keys)]
+raw = np.frombuffer(b"".join(keys), np.uint8).reshape(args.keys, 32)
+
+
+def run(name, encode):
+    start = time.perf_counter()
+    encode()
+    elapsed = time.perf_counter() - start
+    print("{:<12} {:>10.0f} keys/s".format(name, args.keys / elapsed))
+
+
+run(
+    "nanolib",
+    lambda: [
+        nanolib.accounts.get_account_id(
+            prefix=nanolib.AccountIDPrefix.NANO, public_key=key.hex()
+        )
+        for key in keys
+    ],
+)
+nano_account.account_id.cache_clear()
+run("memoized", lambda: [nano_account.account_id(key) for key in keys])
+print(nano_account.account_id.cache_info())
+run("vectorized", lambda: nano_account.account_ids(raw))
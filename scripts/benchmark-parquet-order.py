@@ -0,0 +1,58 @@
+# Compare blocks parquet files of export-lmdb-to-parquet.py written in lmdb
+# hash order and clustered by account (--order account): file size and the
+# time to read the blocks of one account with a filter on account, which can
+# skip the row groups whose account min/max statistics exclude it.
+#
+#   python benchmark-parquet-order.py hash/blocks.parquet account/blocks.parquet --lookups 200
+
+import argparse
+import os
+import random
+import time
+
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+parser = argparse.ArgumentParser()
+parser.add_argument("files", nargs="+", help="Blocks parquet files to compare")
+parser.add_argument(
+    "--lookups", type=int, default=100, help="Number of accounts looked up"
+)
+args = parser.parse_args()
+
+accounts = pc.unique(pq.read_table(args.files[0], columns=["account"])[0])
+accounts = random.sample(accounts.to_pylist(), min(args.lookups, len(accounts)))
+
+
+def row_groups_read(metadata, column, account):
+    """Row groups whose account statistics can hold the account."""
+    count = 0
+    for index in range(metadata.num_row_groups):
+        statistics = metadata.row_group(index).column(column).statistics
+        if statistics is None or statistics.min <= account <= statistics.max:
+            count += 1
+    return count
+
+
+print(
+    "{:<40} {:>10} {:>11} {:>14} {:>12}".format(
+        "file", "size MB", "row groups", "groups/lookup", "ms/lookup"
+    )
+)
+for path in args.files:
+    metadata = pq.ParquetFile(path).metadata
+    column = metadata.schema.names.index("account")
+    groups = sum(row_groups_read(metadata, column, account) for account in accounts)
+    start = time.perf_counter()
+    for account in accounts:
+        pq.read_table(path, filters=[("account", "=", account)])
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<40} {:>10.1f} {:>11} {:>14.1f} {:>12.2f}".format(
+            path,
+            os.path.getsize(path) / 1e6,
+            metadata.num_row_groups,
+            groups / len(accounts),
+            1000 * elapsed / len(accounts),
+        )
+    )
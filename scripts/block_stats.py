@@ -0,0 +1,192 @@
+# Streaming aggregate of the source_destination_stats and account_stats
+# tables, computed from the block rows while they are exported instead of a
+# GROUP BY over the whole blocks table. Each process adds its rows to a dict
+# keyed by (source, blocktype, destination); once it holds max_groups groups
+# it is sorted and spilled to a run file in spill_dir. The runs of all the
+# processes are merged at the end with equal keys summed, already sorted by
+# account, so the account totals come from a second merge without a dict.
+#
+# Groups follow create-postgresql-stats-tables.py: sends are legacy sends
+# and state sends, receives are legacy opens and receives and state opens
+# and receives, the destination is the block's link_account.
+
+import heapq
+import itertools
+import os
+import tempfile
+
+SEND = "SEND"
+RECEIVE = "RECEIVE"
+
+create_account_stats = (
+    "CREATE TABLE IF NOT EXISTS account_stats (account varchar(65) NOT NULL,"
+    "block_count bigint NOT NULL, total_amount numeric NOT NULL, blocktype text NOT NULL)"
+)
+create_account_stats_index = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS unique_account_stats_group "
+    "ON account_stats (account, blocktype)"
+)
+create_source_destination_stats = (
+    "CREATE TABLE IF NOT EXISTS source_destination_stats (source_account varchar(65) NOT NULL,"
+    "destination_account varchar(65), block_count bigint NOT NULL,"
+    "total_amount numeric NOT NULL, blocktype text NOT NULL)"
+)
+# NULL destinations (legacy opens) are one group like in a GROUP BY, the
+# COALESCE does that without NULLS NOT DISTINCT (PostgreSQL 15)
+create_source_destination_stats_index = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS unique_source_destination_stats_group "
+    "ON source_destination_stats (source_account, (COALESCE(destination_account, '')), blocktype)"
+)
+
+account_stats_conflict = (
+    "ON CONFLICT (account, blocktype) DO UPDATE SET "
+    "block_count=account_stats.block_count + excluded.block_count,"
+    "total_amount=account_stats.total_amount + excluded.total_amount"
+)
+source_destination_stats_conflict = (
+    "ON CONFLICT (source_account, (COALESCE(destination_account, '')), blocktype) DO UPDATE SET "
+    "block_count=source_destination_stats.block_count + excluded.block_count,"
+    "total_amount=source_destination_stats.total_amount + excluded.total_amount"
+)
+
+# Highest blocks.local_timestamp counted in each stats table by
+# create-postgresql-stats-tables.py, the next run only adds the blocks above it.
+# block_count is the number of blocks of the partition at or below the
+# watermark when it was saved, a different count on the next run means blocks
+# were inserted or removed behind it.
+create_stats_watermarks = (
+    "CREATE TABLE IF NOT EXISTS stats_watermarks (table_name text PRIMARY KEY,"
+    "local_timestamp bigint NOT NULL, block_count bigint)"
+)
+add_stats_watermarks_block_count = (
+    "ALTER TABLE stats_watermarks ADD COLUMN IF NOT EXISTS block_count bigint"
+)
+select_stats_watermark = (
+    "SELECT local_timestamp, block_count FROM stats_watermarks "
+    "WHERE table_name = %s FOR UPDATE"
+)
+save_stats_watermark = (
+    "INSERT INTO stats_watermarks (table_name, local_timestamp, block_count) VALUES (%s, %s, %s) "
+    "ON CONFLICT (table_name) DO UPDATE SET local_timestamp=excluded.local_timestamp, "
+    "block_count=excluded.block_count"
+)
+# Stats loaded by an export do not follow the watermark, the next run of the
+# script recomputes the tables
+delete_stats_watermarks = (
+    "DELETE FROM stats_watermarks WHERE table_name IN ('account_stats', 'source_destination_stats') "
+    "OR table_name LIKE 'account_stats %' OR table_name LIKE 'source_destination_stats %'"
+)
+
+
+# Accounts are nano_ followed by '1' or '3' and the base32 characters of a
+# random public key, ranges of their first characters split them evenly
+account_alphabet = "13456789abcdefghijkmnopqrstuwxyz"
+account_prefixes = [
+    "nano_" + first + second + third
+    for first in "13"
+    for second in account_alphabet
+    for third in account_alphabet
+]
+
+
+def account_ranges(partitions):
+    """partitions (low, high) ranges of nano_ accounts, None where unbounded."""
+    bounds = [
+        account_prefixes[len(account_prefixes) * partition // partitions]
+        for partition in range(1, partitions)
+    ]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def blocktype(block_type, subtype):
+    """SEND, RECEIVE or None for the type and subtype of a blocks row."""
+    if block_type in (1, 4) and subtype in (None, 3):
+        return SEND
+    if block_type in (1, 2, 3) and subtype in (None, 1, 2):
+        return RECEIVE
+    return None
+
+
+def read_run(path):
+    """Yield the (source, blocktype, destination, count, total) groups of a run."""
+    with open(path) as run:
+        for line in run:
+            source, direction, destination, count, total = line.rstrip("\n").split("\t")
+            yield source, direction, destination, int(count), int(total)
+
+
+def merge_runs(paths):
+    """Yield the groups of sorted runs in key order, summing equal keys.
+
+    A None destination is written as an empty string in the runs, so it sorts
+    first among the destinations of an account.
+    """
+    runs = heapq.merge(*(read_run(path) for path in paths), key=lambda group: group[:3])
+    for key, groups in itertools.groupby(runs, key=lambda group: group[:3]):
+        count = total = 0
+        for group in groups:
+            count += group[3]
+            total += group[4]
+        source, direction, destination = key
+        yield source, direction, destination or None, count, total
+
+
+def account_totals(groups):
+    """Yield (account, blocktype, count, total) for groups sorted by source."""
+    for key, rows in itertools.groupby(groups, key=lambda group: group[:2]):
+        count = total = 0
+        for row in rows:
+            count += row[3]
+            total += row[4]
+        yield key[0], key[1], count, total
+
+
+class StatsAggregate:
+    """Block count and amount sum per (source, blocktype, destination).
+
+    Forked processes keep adding to their own copy and spill it before they
+    exit; the runs of spill_dir are then merged by the parent.
+    """
+
+    def __init__(self, spill_dir, max_groups=1000000):
+        self.spill_dir = spill_dir
+        self.max_groups = max_groups
+        self.groups = {}
+
+    def add(self, source, direction, destination, amount):
+        key = source, direction, destination or ""
+        group = self.groups.get(key)
+        if group is None:
+            self.groups[key] = [1, amount]
+            if len(self.groups) >= self.max_groups:
+                self.spill()
+        else:
+            group[0] += 1
+            group[1] += amount
+
+    def spill(self):
+        if not self.groups:
+            return
+        handle, path = tempfile.mkstemp(suffix=".tsv", dir=self.spill_dir)
+        with os.fdopen(handle, "w") as run:
+            for (source, direction, destination), (count, total) in sorted(
+                self.groups.items()
+            ):
+                run.write(
+                    "{}\t{}\t{}\t{}\t{}\n".format(
+                        source, direction, destination, count, total
+                    )
+                )
+        self.groups = {}
+
+    def runs(self):
+        return sorted(
+            os.path.join(self.spill_dir, name)
+            for name in os.listdir(self.spill_dir)
+            if name.endswith(".tsv")
+        )
+
+    def merge(self):
+        """Spill what is left and yield the merged groups of all the runs."""
+        self.spill()
+        return merge_runs(self.runs())
@@ -0,0 +1,125 @@
+# Checkpoints of resumable database exports. The reader registers every batch
+# with the lmdb key of its last entry, in read order, and the loaders report
+# each batch once it is committed. The loaders commit out of order, so the
+# checkpoint only advances to the last key below which every batch has been
+# committed; restarting after it (with the idempotent upserts) loses nothing.
+#
+# The checkpoint stops advancing at the first batch whose load failed, a
+# resumed run exports it again with everything after it, as it does with a
+# batch still loading when the process dies.
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+def seek_after(cursor, key):
+    """Position cursor on the first entry after key, False past the end."""
+    if not cursor.set_range(key):
+        return False
+    if cursor.key() == key:
+        return cursor.next()
+    return True
+
+
+class Checkpoint:
+    """Last committed (table, key) of an export with its entry and row totals."""
+
+    def __init__(self, path, interval=10):
+        self.path = path
+        self.interval = interval
+        self.table = None
+        self.key = None
+        self.count = 0
+        self.loaded = 0
+        self.failed = False
+        self.pending = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.saved = time.monotonic()
+        self.watchers = []
+
+    @classmethod
+    def load(cls, path, interval=10):
+        """Checkpoint saved at path, None if there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path) as checkpoint_file:
+            saved = json.load(checkpoint_file)
+        checkpoint = cls(path, interval)
+        checkpoint.table = saved["table"]
+        checkpoint.key = bytes.fromhex(saved["key"])
+        checkpoint.count = saved["count"]
+        checkpoint.loaded = saved["loaded"]
+        return checkpoint
+
+    def add(self, tag, count):
+        """Register a (table, last key) batch of count entries, in read order."""
+        with self.lock:
+            if not self.failed:
+                self.pending[tag] = [count, None]
+
+    def done(self, tag, rows, errors):
+        with self.lock:
+            if self.failed:
+                return
+            self.pending[tag][1] = rows, errors
+            while self.pending:
+                first, (count, result) = next(iter(self.pending.items()))
+                if result is None:
+                    break
+                if result[1]:
+                    self.failed = True
+                    self.pending.clear()
+                    break
+                self.pending.popitem(last=False)
+                self.table, self.key = first
+                self.count += count
+                self.loaded += result[0]
+            if time.monotonic() - self.saved >= self.interval:
+                self.save()
+
+    def watch(self, stage):
+        """Follow the batches committed by a pipeline.Stage in a thread."""
+        watcher = threading.Thread(target=self._watch, args=(stage,), daemon=True)
+        watcher.start()
+        self.watchers.append((stage, watcher))
+
+    def _watch(self, stage):
+        while True:
+            item = stage.done.get()
+            if item is None:
+                return
+            self.done(*item)
+
+    def close(self):
+        """Stop watching (after the stages are closed) and save."""
+        for stage, watcher in self.watchers:
+            stage.done.put(None)
+            watcher.join()
+        self.watchers = []
+        self.save()
+
+    def save(self):
+        self.saved = time.monotonic()
+        if self.key is None:
+            # Nothing committed yet, a resumed run starts at the first key
+            self.remove()
+            return
+        with open(self.path + ".tmp", "w") as checkpoint_file:
+            json.dump(
+                {
+                    "table": self.table,
+                    "key": self.key.hex().upper(),
+                    "count": self.count,
+                    "loaded": self.loaded,
+                },
+                checkpoint_file,
+            )
+        os.replace(self.path + ".tmp", self.path)
+
+    def remove(self):
+        """Forget the checkpoint once the export has completed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,60 +1,260 @@
+import argparse
+import concurrent.futures
 import decimal
 import os
 import json
+import time
 import psycopg2
+import block_stats
 
-
-create_account_stats = (
-    "CREATE TABLE account_stats AS                                                                   "
-    "SELECT account, count(*) as block_count ,sum(amount) as total_amount ,'SEND' as blocktype       "
-    # "INTO account_stats                                                                              "
+# Only the blocks with local_timestamp in (since, until] and account in
+# [low, high) are added, since, low and high are NULL when unbounded. Blocks
+# without a local_timestamp count as 0, they are only added when since is NULL.
+account_stats = (
+    "INSERT INTO account_stats (account, block_count, total_amount, blocktype)                          "
+    "SELECT account, count(*) as block_count ,coalesce(sum(amount), 0) as total_amount ,'SEND' as blocktype "
     "FROM blocks b1                                                                                  "
-    "WHERE b1.type in (1,4) AND (b1.subtype ISNULL or b1.subtype = 3) group by account               "
+    "WHERE b1.type in (1,4) AND (b1.subtype ISNULL or b1.subtype = 3)                                "
+    "AND ((%(since)s::integer ISNULL AND b1.local_timestamp ISNULL) OR ((%(since)s::integer ISNULL or b1.local_timestamp > %(since)s) AND b1.local_timestamp <= %(until)s)) "
+    "AND (%(low)s::text ISNULL or b1.account >= %(low)s) AND (%(high)s::text ISNULL or b1.account < %(high)s) "
+    "group by account                                                                                "
     "UNION ALL                                                                                       "
-    "SELECT account, count(*) as block_count ,sum(amount) as total_amount,'RECEIVE' as blocktype     "
+    "SELECT account, count(*) as block_count ,coalesce(sum(amount), 0) as total_amount,'RECEIVE' as blocktype "
     "FROM blocks b1                                                                                  "
-    "WHERE b1.type in (1,2,3) AND (b1.subtype ISNULL or b1.subtype IN (1, 2)) group by account       "
+    "WHERE b1.type in (1,2,3) AND (b1.subtype ISNULL or b1.subtype IN (1, 2))                        "
+    "AND ((%(since)s::integer ISNULL AND b1.local_timestamp ISNULL) OR ((%(since)s::integer ISNULL or b1.local_timestamp > %(since)s) AND b1.local_timestamp <= %(until)s)) "
+    "AND (%(low)s::text ISNULL or b1.account >= %(low)s) AND (%(high)s::text ISNULL or b1.account < %(high)s) "
+    "group by account                                                                                "
+    + block_stats.account_stats_conflict
 )
 
 
 source_destination_stats = (
-    "CREATE TABLE source_destination_stats AS                                                                                    "
-    "SELECT source_account,destination_account, count(*) as block_count ,sum(amount) as total_amount,'SEND' as blocktype         "
-    # "INTO source_destination_stats                                                                                               "
+    "INSERT INTO source_destination_stats                                                                                        "
+    "(source_account, destination_account, block_count, total_amount, blocktype)                                                 "
+    "SELECT source_account,destination_account, count(*) as block_count ,coalesce(sum(amount), 0) as total_amount,'SEND' as blocktype "
     "FROM                                                                                                                        "
     "(  SELECT b1.account as source_account, b1.link_account as destination_account,b1.amount                                 "
     "   FROM blocks b1                                                                                                           "
-    "   WHERE b1.type in (1,4) AND (b1.subtype ISNULL or b1.subtype = 3)) as t1                                                  "
+    "   WHERE b1.type in (1,4) AND (b1.subtype ISNULL or b1.subtype = 3)                                                         "
+    "   AND ((%(since)s::integer ISNULL AND b1.local_timestamp ISNULL) OR ((%(since)s::integer ISNULL or b1.local_timestamp > %(since)s) AND b1.local_timestamp <= %(until)s)) "
+    "   AND (%(low)s::text ISNULL or b1.account >= %(low)s) AND (%(high)s::text ISNULL or b1.account < %(high)s)) as t1          "
     "GROUP BY source_account,destination_account                                                                                 "
     "UNION ALL                                                                                                                   "
-    "SELECT source_account,destination_account, count(*) as block_count ,sum(amount) as total_amount,'RECEIVE' as blocktype from "
-    "(  SELECT b1.account as source_account, b2.account as destination_account,b1.amount                                         "
+    "SELECT source_account,destination_account, count(*) as block_count ,coalesce(sum(amount), 0) as total_amount,'RECEIVE' as blocktype from "
+    "(  SELECT b1.account as source_account, b1.link_account as destination_account,b1.amount                                    "
     "   FROM blocks b1                                                                                                           "
-    "   LEFT JOIN blocks b2 on b2.hash = b1.link                                                                                 "
-    "   WHERE b1.type in (1,2,3) AND (b1.subtype ISNULL or b1.subtype IN (1, 2))) as t1                                          "
+    "   WHERE b1.type in (1,2,3) AND (b1.subtype ISNULL or b1.subtype IN (1, 2))                                                 "
+    "   AND ((%(since)s::integer ISNULL AND b1.local_timestamp ISNULL) OR ((%(since)s::integer ISNULL or b1.local_timestamp > %(since)s) AND b1.local_timestamp <= %(until)s)) "
+    "   AND (%(low)s::text ISNULL or b1.account >= %(low)s) AND (%(high)s::text ISNULL or b1.account < %(high)s)) as t1          "
     "GROUP BY source_account,destination_account                                                                                 "
+    + block_stats.source_destination_stats_conflict
+)
+
+delete_account_stats = (
+    "DELETE FROM account_stats WHERE (%(low)s::text ISNULL or account >= %(low)s) "
+    "AND (%(high)s::text ISNULL or account < %(high)s)"
+)
+
+delete_source_destination_stats = (
+    "DELETE FROM source_destination_stats WHERE (%(low)s::text ISNULL or source_account >= %(low)s) "
+    "AND (%(high)s::text ISNULL or source_account < %(high)s)"
+)
+
+# Watermarks of the partitions of another --partitions value (all with --full)
+# are dropped, their ranges are then recomputed
+delete_other_watermarks = (
+    "DELETE FROM stats_watermarks WHERE (table_name = %(table)s OR table_name LIKE %(pattern)s) "
+    "AND NOT table_name = ANY(%(names)s::text[])"
 )
 
+# Blocks of the range at or below since and until (NULL local_timestamp as 0),
+# compared with the block_count saved with the watermark
+count_blocks = (
+    "SELECT count(*) FILTER (WHERE local_timestamp ISNULL OR local_timestamp <= %(since)s), count(*) "
+    "FROM blocks WHERE (local_timestamp ISNULL OR local_timestamp <= %(until)s) "
+    "AND (%(low)s::text ISNULL or account >= %(low)s) AND (%(high)s::text ISNULL or account < %(high)s)"
+)
+
+# The last second is left to the next run, blocks of that second may still
+# be arriving
+select_until = "SELECT max(local_timestamp) - 1 FROM blocks"
+
+stats_queries = {
+    "account_stats": (account_stats, delete_account_stats),
+    "source_destination_stats": (
+        source_destination_stats,
+        delete_source_destination_stats,
+    ),
+}
+
+
+def watermark_name(table, partition):
+    if args.partitions == 1:
+        return table
+    return "{} {}/{}".format(table, partition + 1, args.partitions)
+
+
+def connect():
+    conn = psycopg2.connect(
+        "host={} port={} dbname={} user={} password={}".format(
+            postgresql_config["host"],
+            postgresql_config["port"],
+            postgresql_config["dbname"],
+            postgresql_config["user"],
+            postgresql_config["password"],
+        )
+    )
+    conn.set_session(autocommit=False)
+    return conn
+
+
+def update_stats(table, partition):
+    """Add the new blocks of one account range to a stats table.
+
+    Runs in a pool thread with its own connection. The rows and the watermark
+    of the partition are committed together, so the next run resumes a failed
+    partition at its last watermark. A partition whose block count at or below
+    the watermark changed since the last run (blocks imported with an older or
+    no local_timestamp) is recomputed.
+    """
+    t0 = time.time()
+    query, delete_query = stats_queries[table]
+    name = watermark_name(table, partition)
+    low, high = bounds[partition]
+    conn = connect()
+    # The blocks counted and the blocks added are read from the same snapshot
+    conn.set_session(isolation_level="REPEATABLE READ")
+    postgresql_cursor = conn.cursor()
+    postgresql_cursor.execute(block_stats.select_stats_watermark, (name,))
+    watermark = postgresql_cursor.fetchone()
+    since = None if watermark is None else watermark[0]
+    params = {
+        "since": since,
+        "until": until if since is None else max(since, until),
+        "low": low,
+        "high": high,
+    }
+    postgresql_cursor.execute(count_blocks, params)
+    below, block_count = postgresql_cursor.fetchone()
+    missed = None
+    if since is not None and watermark[1] is not None and below != watermark[1]:
+        missed = below - watermark[1]
+        since = params["since"] = None
+    if since is None:
+        if args.partitions == 1:
+            postgresql_cursor.execute("TRUNCATE {}".format(table))
+        else:
+            postgresql_cursor.execute(delete_query, params)
+    rows = 0
+    if since is None or until > since:
+        postgresql_cursor.execute(query, params)
+        rows = postgresql_cursor.rowcount
+    postgresql_cursor.execute(
+        block_stats.save_stats_watermark, (name, params["until"], block_count)
+    )
+    conn.commit()
+    conn.close()
+    return since, missed, rows, time.time() - t0
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--full",
+    action="store_true",
+    help="Recompute the stats from all the blocks instead of adding the blocks with a local_timestamp above the watermark of the last run.",
+)
+parser.add_argument(
+    "--partitions",
+    type=int,
+    default=1,
+    help="Split each stats table in this many account ranges, each aggregated by its own statement with its own watermark. A failed run is resumed by running again, only the partitions that did not commit are redone.",
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    help="Number of partitions aggregated at the same time, each on its own connection. The number of partitions if omitted.",
+)
+args = parser.parse_args()
+if not 1 <= args.partitions <= len(block_stats.account_prefixes):
+    parser.error(
+        "--partitions must be between 1 and {}".format(
+            len(block_stats.account_prefixes)
+        )
+    )
 
 with open("config.json") as json_data_file:
     config = json.load(json_data_file)
 
 postgresql_config = config["postgresql"]["connection"]
-conn = psycopg2.connect(
-    "host={} port={} dbname={} user={} password={}".format(
-        postgresql_config["host"],
-        postgresql_config["port"],
-        postgresql_config["dbname"],
-        postgresql_config["user"],
-        postgresql_config["password"],
-    )
-)
-conn.set_session(autocommit=True)
+conn = connect()
 postgresql_cursor = conn.cursor()
-print("Start Create 'account_stats' Table")
-postgresql_cursor.execute(create_account_stats)
-print("End Create 'account_stats' Table")
+postgresql_cursor.execute(block_stats.create_account_stats)
+postgresql_cursor.execute(block_stats.create_account_stats_index)
+postgresql_cursor.execute(block_stats.create_source_destination_stats)
+postgresql_cursor.execute(block_stats.create_source_destination_stats_index)
+postgresql_cursor.execute(block_stats.create_stats_watermarks)
+postgresql_cursor.execute(block_stats.add_stats_watermarks_block_count)
+for table in stats_queries:
+    names = [watermark_name(table, partition) for partition in range(args.partitions)]
+    postgresql_cursor.execute(
+        delete_other_watermarks,
+        {"table": table, "pattern": table + " %", "names": [] if args.full else names},
+    )
+postgresql_cursor.execute(select_until)
+until = postgresql_cursor.fetchone()[0]
+conn.commit()
+conn.close()
 
-print("Start Create 'source_destination_stats' Table")
-postgresql_cursor.execute(source_destination_stats)
-print("End Create 'source_destination_stats' Table")
+bounds = block_stats.account_ranges(args.partitions)
+if until is None:
+    print("No blocks")
+else:
+    t0 = time.time()
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(
+        args.threads or args.partitions
+    ) as executor:
+        futures = {
+            executor.submit(update_stats, table, partition): (table, partition)
+            for table in stats_queries
+            for partition in range(args.partitions)
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            table, partition = futures[future]
+            try:
+                since, missed, rows, seconds = future.result()
+            except Exception as ex:
+                print(
+                    "'{}' partition {}/{} failed: {}".format(
+                        table, partition + 1, args.partitions, ex
+                    )
+                )
+                failed += 1
+                continue
+            if missed is not None:
+                print(
+                    "'{}' partition {}/{}: block count at or below the watermark changed by [{:+d}], recomputed".format(
+                        table, partition + 1, args.partitions, missed
+                    )
+                )
+            print(
+                "[{}/{}] '{}' partition {}/{}: [{}] rows {} up to [{}] in [{:.1f}] s".format(
+                    done,
+                    len(futures),
+                    table,
+                    partition + 1,
+                    args.partitions,
+                    rows,
+                    "created" if since is None else "added after [{}]".format(since),
+                    until,
+                    seconds,
+                )
+            )
+    print(
+        "updated: [{}] partition(s) with [{}] failed in [{:.1f}] s".format(
+            len(futures), failed, time.time() - t0
+        )
+    )
+    if failed:
+        print("Run again to resume the failed partitions")
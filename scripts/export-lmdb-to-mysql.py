@@ -1,25 +1,41 @@
-import io
 import sys
 import os.path
-import datetime
 import argparse
 import ipaddress
 import lmdb
-import nanolib
+import nano_account
 import json
 import math
-from nanodb import Nanodb
-from kaitaistruct import KaitaiStream
+import tempfile
+import checkpoint
+import ledger_index
+import lmdb_delta
+import lmdb_shards
+import pipeline
+import nanodb_fast
 import mysql.connector
 import multiprocessing
-from joblib import Parallel, delayed
-import dill as pickle
 
 with open("config.json") as json_data_file:
     config = json.load(json_data_file)
 
 mysql_config = config["mysql"]["connection"]
 
+blocks_duplicate = (
+    "ON DUPLICATE KEY UPDATE amount=amount, balance=balance, height=height,"
+    "local_timestamp=local_timestamp, confirmed=confirmed, type=type, account=account,"
+    "previous=previous, representative=representative, link=link,"
+    "link_account=link_account, signature=signature, work=work, subtype=subtype"
+)
+
+accounts_duplicate = (
+    "ON DUPLICATE KEY UPDATE frontier=frontier,"
+    "open_block=open_block, representative_block=representative_block, balance=balance,"
+    "modified_timestamp=modified_timestamp, block_count=block_count,"
+    "confirmation_height=confirmation_height,"
+    "confirmation_height_frontier=confirmation_height_frontier"
+)
+
 add_block = (
     "INSERT INTO blocks "
     "(hash, amount, balance, height, local_timestamp, confirmed,"
@@ -27,10 +43,7 @@ add_block = (
     "work, subtype) VALUES (%(hash)s, %(amount)s, %(balance)s, %(height)s,"
     "%(local_timestamp)s, %(confirmed)s, %(type)s, %(account)s, %(previous)s,"
     "%(representative)s, %(link)s, %(link_account)s, %(signature)s, %(work)s,"
-    "%(subtype)s) ON DUPLICATE KEY UPDATE amount=amount, balance=balance, height=height,"
-    "local_timestamp=local_timestamp, confirmed=confirmed, type=type, account=account,"
-    "previous=previous, representative=representative, link=link,"
-    "link_account=link_account, signature=signature, work=work, subtype=subtype"
+    "%(subtype)s) " + blocks_duplicate
 )
 
 add_account = (
@@ -39,83 +52,372 @@ add_account = (
     "block_count, confirmation_height, confirmation_height_frontier) VALUES (%(account)s,"
     "%(frontier)s, %(open_block)s, %(representative_block)s, %(balance)s,"
     "%(modified_timestamp)s, %(block_count)s, %(confirmation_height)s,"
-    "%(confirmation_height_frontier)s) ON DUPLICATE KEY UPDATE frontier=frontier,"
-    "open_block=open_block, representative_block=representative_block, balance=balance,"
-    "modified_timestamp=modified_timestamp, block_count=block_count,"
-    "confirmation_height=confirmation_height,"
-    "confirmation_height_frontier=confirmation_height_frontier"
+    "%(confirmation_height_frontier)s) " + accounts_duplicate
 )
 
+block_columns = [
+    "hash",
+    "amount",
+    "balance",
+    "height",
+    "local_timestamp",
+    "confirmed",
+    "type",
+    "account",
+    "previous",
+    "representative",
+    "link",
+    "link_account",
+    "signature",
+    "work",
+    "subtype",
+]
+
+account_columns = [
+    "account",
+    "frontier",
+    "open_block",
+    "representative_block",
+    "balance",
+    "modified_timestamp",
+    "block_count",
+    "confirmation_height",
+    "confirmation_height_frontier",
+]
+
+# LOAD DATA keeps the existing row on a duplicate key, like the no-op
+# ON DUPLICATE KEY UPDATE clauses above.
+load_infile = (
+    "LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {} CHARACTER SET utf8mb4 ({})"
+)
+
+
+block_types = {
+    nanodb_fast.BLOCK_TYPE_STATE: "1",
+    nanodb_fast.BLOCK_TYPE_OPEN: "2",
+    nanodb_fast.BLOCK_TYPE_RECEIVE: "3",
+    nanodb_fast.BLOCK_TYPE_SEND: "4",
+    nanodb_fast.BLOCK_TYPE_CHANGE: "5",
+}
+
 
 def get_state_block(block):
-    if block.sideband.height == 1 and block.sideband.is_receive:
+    if block.height == 1 and block.is_receive:
         subtype = 1  # open
-    elif block.sideband.is_receive:
+    elif block.is_receive:
         subtype = 2  # receive
-    elif block.sideband.is_send:
+    elif block.is_send:
         subtype = 3  # send
-    elif block.sideband.is_epoch:
+    elif block.is_epoch:
         subtype = 5  # epoch
     else:
         subtype = 4  # change
 
     return {
-        "height": block.sideband.height,
-        "local_timestamp": datetime.datetime.utcfromtimestamp(
-            block.sideband.timestamp
-        ).strftime("%s"),
+        "height": block.height,
+        "local_timestamp": block.timestamp,
         "subtype": subtype,
     }
 
 
 def get_legacy_block(block):
     return {
-        "height": getattr(block.sideband, "height", 1),
-        "local_timestamp": datetime.datetime.utcfromtimestamp(
-            block.sideband.timestamp
-        ).strftime("%s"),
+        "height": block.height,
+        "local_timestamp": block.timestamp,
         "subtype": None,
     }
 
 
-def processAccounts(data_in):
-    export_counter = 0
+def insert_values(mysql_cursor, table, columns, data_in, on_duplicate):
+    # One INSERT with up to --rows-per-statement rows in its VALUES list
+    placeholders = "({})".format(", ".join(["%s"] * len(columns)))
+    affected = 0
+    for start in range(0, len(data_in), args.rows_per_statement):
+        rows = data_in[start : start + args.rows_per_statement]
+        statement = "INSERT INTO {} ({}) VALUES {} {}".format(
+            table,
+            ", ".join(columns),
+            ", ".join([placeholders] * len(rows)),
+            on_duplicate,
+        )
+        mysql_cursor.execute(
+            statement, [row[column] for row in rows for column in columns]
+        )
+        affected += mysql_cursor.rowcount
+    return affected
+
+
+def tsv_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def insert_infile(mysql_cursor, table, columns, data_in):
+    # Write the batch to a temporary TSV and load it with one statement
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".tsv", delete=False, encoding="utf-8"
+    ) as tsv:
+        for row in data_in:
+            tsv.write("\t".join(tsv_value(row[column]) for column in columns) + "\n")
+    try:
+        mysql_cursor.execute(load_infile.format(table, ", ".join(columns)), (tsv.name,))
+    finally:
+        os.remove(tsv.name)
+    return mysql_cursor.rowcount
+
+
+def connect():
     conn = mysql.connector.connect(
         user=mysql_config["user"],
         host=mysql_config["host"],
         password=mysql_config["password"],
         database=mysql_config["database"],
+        allow_local_infile=args.load == "infile",
     )
     conn.autocommit = False
     mysql_cursor = conn.cursor()
     mysql_cursor.execute("SET foreign_key_checks = 0")
     mysql_cursor.execute("SET unique_checks = 0")
-    for data_account in data_in:
-        mysql_cursor.execute(add_account, data_account)
-        export_counter += 1
-        # print("import_count : [{}]".format(export_counter))
+    mysql_cursor.close()
+    return conn
+
+
+def load_accounts(conn, data_in):
+    export_counter = 0
+    mysql_cursor = conn.cursor()
+    if args.load == "values":
+        export_counter = insert_values(
+            mysql_cursor, "accounts", account_columns, data_in, accounts_duplicate
+        )
+        print("loaded: [{}] accounts".format(export_counter))
+    elif args.load == "infile":
+        export_counter = insert_infile(
+            mysql_cursor, "accounts", account_columns, data_in
+        )
+        print("loaded: [{}] accounts".format(export_counter))
+    else:
+        for data_account in data_in:
+            mysql_cursor.execute(add_account, data_account)
+            export_counter += 1
+            # print("import_count : [{}]".format(export_counter))
     conn.commit()
-    conn.close()
+    return len(data_in)
 
 
-def processBlocks(data_in):
+def load_blocks(conn, data_in):
     export_counter = 0
-    conn = mysql.connector.connect(
-        user=mysql_config["user"],
-        host=mysql_config["host"],
-        password=mysql_config["password"],
-        database=mysql_config["database"],
-    )
-    conn.autocommit = False
     mysql_cursor = conn.cursor()
-    mysql_cursor.execute("SET foreign_key_checks = 0")
-    mysql_cursor.execute("SET unique_checks = 0")
-    for data_blocks in data_in:
-        mysql_cursor.execute(add_block, data_blocks)
-        export_counter += 1
-        # print("import_count : [{}]".format(export_counter))
+    if args.load == "values":
+        export_counter = insert_values(
+            mysql_cursor, "blocks", block_columns, data_in, blocks_duplicate
+        )
+        print("loaded: [{}] blocks".format(export_counter))
+    elif args.load == "infile":
+        export_counter = insert_infile(mysql_cursor, "blocks", block_columns, data_in)
+        print("loaded: [{}] blocks".format(export_counter))
+    else:
+        for data_blocks in data_in:
+            mysql_cursor.execute(add_block, data_blocks)
+            export_counter += 1
+            # print("import_count : [{}]".format(export_counter))
     conn.commit()
+    return len(data_in)
+
+
+def get_confirmation_height(txn, account):
+    if confirmed_heights is not None:
+        height = confirmed_heights.get(account)
+        if height is not None:
+            return height
+    confirmation_value = txn.get(account, default=None, db=confirmation_db)
+    return decode_confirmation_height(confirmation_value).height
+
+
+def get_previous_balance(txn, previous):
+    if block_balances is not None:
+        balance = block_balances.get(previous)
+        if balance is not None:
+            return balance
+    value = txn.get(previous, default=None, db=blocks_db)
+    if value is None:
+        return None
+    try:
+        return int.from_bytes(decode_block(value).balance, "big")
+    except Exception as ex:
+        print(ex)
+        return None
+
+
+def get_source_account(txn, source):
+    """nano_ account of the send block with hash source, None if it is not in the ledger or can not be decoded."""
+    account = None
+    if source_accounts is not None:
+        account = source_accounts.get(source)
+    if account is None:
+        value = txn.get(source, default=None, db=blocks_db)
+        if value is None:
+            return None
+        try:
+            account = decode_block(value).account
+        except Exception as ex:
+            print(ex)
+            return None
+    return nano_account.account_id(account)
+
+
+def get_block_row(txn, key, block):
+    btype = block.block_type
+
+    if btype == nanodb_fast.BLOCK_TYPE_STATE:
+        data_block = get_state_block(block)
+    else:
+        data_block = get_legacy_block(block)
+    data_block["type"] = block_types[btype]
+
+    data_block["hash"] = key.hex().upper()
+    balance = int.from_bytes(block.balance, "big")
+
+    data_block["balance"] = balance
+    data_block["confirmed"] = "1"
+    data_block["account"] = nano_account.account_id(block.account)
+
+    if btype == nanodb_fast.BLOCK_TYPE_OPEN:
+        data_block[
+            "previous"
+        ] = "0000000000000000000000000000000000000000000000000000000000000000"
+    else:
+        data_block["previous"] = block.previous.hex().upper()
+
+    if block.representative is None:
+        data_block["representative"] = None
+    else:
+        data_block["representative"] = nano_account.account_id(block.representative)
+
+    if btype == nanodb_fast.BLOCK_TYPE_STATE:
+        data_block["link"] = block.link.hex().upper()
+
+        if data_block["subtype"] == 4:  # change
+            data_block["link_account"] = nano_account.account_id(block.representative)
+        elif data_block["subtype"] == 3:  # send
+            data_block["link_account"] = nano_account.account_id(block.link)
+        elif (
+            data_block["subtype"] == 2 or data_block["subtype"] == 1
+        ):  # receive or open
+            data_block["link_account"] = get_source_account(txn, block.link)
+        else:
+            data_block["link_account"] = None
+
+    elif btype == nanodb_fast.BLOCK_TYPE_SEND:
+        data_block["link"] = block.link.hex().upper()
+        data_block["link_account"] = nano_account.account_id(block.link)
+    elif btype == nanodb_fast.BLOCK_TYPE_RECEIVE:
+        data_block["link"] = block.link.hex().upper()
+        data_block["link_account"] = get_source_account(txn, block.link)
+
+    else:
+        data_block["link"] = None
+        data_block["link_account"] = None
+
+    data_block["signature"] = block.signature.hex().upper()
+    data_block["work"] = hex(block.work)[2:]
+
+    try:
+        height = get_confirmation_height(txn, block.account)
+    except Exception as ex:
+        print(ex)
+        height = 0
+
+    if data_block["height"] > 1:
+        previous_balance = get_previous_balance(txn, block.previous)
+
+        if previous_balance is None:
+            data_block["amount"] = None
+        else:
+            data_block["amount"] = abs(previous_balance - balance)
+    else:
+        data_block["amount"] = balance
+
+    data_block["confirmed"] = "1" if height >= data_block["height"] else "0"
+
+    return data_block
+
+
+def get_block_rows(txn, items):
+    data_blocks = []
+    for key, value in items:
+        try:
+            block = decode_block(value)
+        except Exception as ex:
+            print(ex)
+            continue
+
+        data_blocks.append(get_block_row(txn, key, block))
+    return data_blocks
+
+
+def export_blocks(txn, entries, load_blocks):
+    count = 0
+    for items in pipeline.read_batches(entries, 10000, args.count):
+        load_blocks(get_block_rows(txn, items), items)
+        reader.add(len(items))
+        count += len(items)
+        print("count: {}, hash {}".format(count, items[-1][0].hex().upper()), end="\r")
+    return count
+
+
+def put_batch(load, data, table, last_key, count):
+    """Queue a batch for the loaders, recorded by the checkpoint when there is one."""
+    tag = None
+    if progress is not None and count:
+        tag = table, last_key
+        progress.add(tag, count)
+    loaders.put(load, data, tag)
+
+
+def resume_entries(cursor, table):
+    """The cursor, moved after the checkpointed key when resuming table."""
+    if resume is None or resume[0] != table:
+        return cursor
+    if not checkpoint.seek_after(cursor, resume[1]):
+        return []
+    return cursor
+
+
+def open_decoder():
+    global blocks_db, confirmation_db
+    env = lmdb_shards.open_env(filename)
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+    return lmdb_shards.ReadTransaction(env)
+
+
+def decode_blocks(reader, items):
+    # Runs in a decoder process, the rows go straight to the loader queue
+    tag = None if progress is None else ("blocks", items[-1][0])
+    loaders.put(load_blocks, get_block_rows(reader.txn, items), tag)
+    return len(items)
+
+
+def export_blocks_shard(shard, start, end):
+    global blocks_db, confirmation_db
+    env = lmdb_shards.open_env(filename)
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+
+    # Each shard loads its own batches over one connection
+    conn = connect()
+    with env.begin() as txn:
+        cursor = txn.cursor(blocks_db)
+        count = export_blocks(
+            txn,
+            lmdb_shards.iter_range(cursor, start, end),
+            lambda data_blocks, items: load_blocks(conn, data_blocks),
+        )
+        cursor.close()
     conn.close()
+    env.close()
+    return count
 
 
 # Parse arguments
@@ -142,7 +444,120 @@ parser.add_argument(
     type=str,
     help="Start iterating at this exact key. This must be a byte array in hex representation.",
 )
+parser.add_argument(
+    "--decoder",
+    type=str,
+    default="struct",
+    choices=["struct", "kaitai"],
+    help="Decoder of the blocks, accounts and confirmation heights: fixed-offset struct layouts (fast) or the generated Kaitai classes.",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Scan the blocks table in this many key ranges in parallel, each worker loads its own rows.",
+)
+parser.add_argument(
+    "--load",
+    type=str,
+    default="insert",
+    choices=["insert", "values", "infile"],
+    help="Load each batch with one INSERT per row, multi-row INSERT ... VALUES statements or LOAD DATA LOCAL INFILE from a temporary TSV (needs local_infile enabled on the server).",
+)
+parser.add_argument(
+    "--rows-per-statement",
+    type=int,
+    default=1000,
+    help="Number of rows per INSERT statement with --load values.",
+)
+parser.add_argument(
+    "--loaders",
+    type=int,
+    default=multiprocessing.cpu_count(),
+    help="Number of loader processes, each keeps one database connection for the whole run.",
+)
+parser.add_argument(
+    "--queue-size",
+    type=int,
+    help="Number of 10000 row batches waiting for each stage before reading blocks, twice the number of its processes if omitted.",
+)
+parser.add_argument(
+    "--decoders",
+    type=int,
+    default=0,
+    help="Decode blocks in this many processes between the reader and the loaders. 0 decodes in the reading process.",
+)
+parser.add_argument(
+    "--report-interval",
+    type=float,
+    default=10,
+    help="Seconds between throughput and queue depth reports of the read, decode and load stages, 0 to disable.",
+)
+parser.add_argument(
+    "--amount",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Take the balance of the previous block from the ledger for each block (lookup) or from a hash to balance index built with one sequential scan first (index, about 24 bytes of memory per block, no random reads).",
+)
+parser.add_argument(
+    "--confirmation-height",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Read the confirmation height of the account of each block from the ledger (lookup) or from an account to height index loaded with one scan of the confirmation_height table first (index, about 16 bytes of memory per account).",
+)
+parser.add_argument(
+    "--link-account",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Take the sending account of receive blocks (link_account) from the send block read from the ledger (lookup) or from a send hash to account index built with one sequential scan first (index, about 40 bytes of memory per send block, no random reads).",
+)
+parser.add_argument(
+    "--state",
+    type=str,
+    help="Incremental export: only the accounts changed since the run that saved this state file and their new blocks, then save the new state. A missing file exports everything and creates it.",
+)
+parser.add_argument(
+    "--checkpoint",
+    type=str,
+    default="lmdb-to-mysql.checkpoint.json",
+    help="File recording the last lmdb key below which every batch is committed, with the entry and row totals. A failed batch holds it back, --resume exports it again. Saved every --checkpoint-interval seconds and removed once the export completes without errors.",
+)
+parser.add_argument(
+    "--checkpoint-interval",
+    type=float,
+    default=10,
+    help="Minimum number of seconds between two saves of the checkpoint file.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Restart after the key recorded in the --checkpoint file of an interrupted run instead of at the first key.",
+)
 args = parser.parse_args()
+if args.workers > 1 and (args.key or args.count != math.inf):
+    parser.error("--key and --count can not be combined with --workers")
+if args.workers > 1 and args.decoders:
+    parser.error("--decoders can not be combined with --workers")
+if args.state and (
+    args.table != "all" or args.workers > 1 or args.key or args.count != math.inf
+):
+    parser.error(
+        "--state exports all tables and can not be combined with --workers, --key or --count"
+    )
+if args.resume and (args.workers > 1 or args.state or args.key):
+    parser.error("--resume can not be combined with --workers, --state or --key")
+
+if args.decoder == "kaitai":
+    decode_block = nanodb_fast.decode_block_kaitai
+    decode_confirmation_height = nanodb_fast.decode_confirmation_height_kaitai
+    decode_account_info = nanodb_fast.decode_account_info_kaitai
+else:
+    decode_block = nanodb_fast.decode_block
+    decode_confirmation_height = nanodb_fast.decode_confirmation_height
+    decode_account_info = nanodb_fast.decode_account_info
 
 
 try:
@@ -153,11 +568,82 @@ try:
     if not os.path.isfile(filename):
         raise Exception("Database doesn't exist")
 
+    # Built before the stages are forked, the workers share them copy-on-write
+    block_balances = None
+    if args.amount == "index" and (args.table == "all" or args.table == "blocks"):
+        print("Indexing block balances")
+        block_balances = ledger_index.BalanceIndex.from_ledger(filename)
+        print("indexed: [{}] blocks".format(len(block_balances)))
+    confirmed_heights = None
+    if args.confirmation_height == "index" and (
+        args.table == "all" or args.table == "blocks"
+    ):
+        print("Indexing confirmation heights")
+        confirmed_heights = ledger_index.ConfirmationHeightIndex.from_ledger(filename)
+        print("indexed: [{}] accounts".format(len(confirmed_heights)))
+    source_accounts = None
+    if args.link_account == "index" and (args.table == "all" or args.table == "blocks"):
+        print("Indexing send accounts")
+        source_accounts = ledger_index.SourceAccountIndex.from_ledger(filename)
+        print("indexed: [{}] sends".format(len(source_accounts)))
+
+    delta = None
+    error_count = 0
+    if args.state:
+        state = lmdb_delta.ExportState.load(args.state)
+        delta = lmdb_delta.Delta.from_ledger(filename, state)
+        print(
+            "changed: [{}] of [{}] accounts since [{}]".format(
+                len(delta.accounts), len(delta.state), state.modified
+            )
+        )
+
+    # Batches are only checkpointed in read order from a single reader
+    progress = None
+    resume = None
+    if args.workers == 1 and delta is None:
+        if args.resume:
+            progress = checkpoint.Checkpoint.load(
+                args.checkpoint, args.checkpoint_interval
+            )
+            if progress is None:
+                print(
+                    "No checkpoint in [{}], starting at the first key".format(
+                        args.checkpoint
+                    )
+                )
+            else:
+                resume = progress.table, progress.key
+                print(
+                    "resuming: {} after [{}], [{}] entries exported before".format(
+                        progress.table, progress.key.hex().upper(), progress.count
+                    )
+                )
+        if progress is None:
+            progress = checkpoint.Checkpoint(args.checkpoint, args.checkpoint_interval)
+
+    # The stages are forked before this process opens the environment, lmdb
+    # does not allow a child to use or reopen an environment open in its parent.
+    reader = pipeline.Counter("read")
+    loaders = pipeline.Stage("load", connect, args.loaders, args.queue_size)
+    stages = [reader, loaders]
+    if args.decoders and (args.table == "all" or args.table == "blocks"):
+        decoders = pipeline.Stage(
+            "decode", open_decoder, args.decoders, args.queue_size
+        )
+        stages.insert(1, decoders)
+    if progress is not None:
+        progress.watch(loaders)
+    monitor = pipeline.Monitor(stages, args.report_interval)
+    if args.report_interval > 0:
+        monitor.start()
+
     env = lmdb.open(filename, subdir=False, readonly=True, lock=False, max_dbs=100)
-    num_cores = multiprocessing.cpu_count()
 
     # Accounts table
-    if args.table == "all" or args.table == "accounts":
+    if resume is not None and resume[0] == "blocks":
+        print("Accounts already exported, resuming at the blocks")
+    elif args.table == "all" or args.table == "accounts":
         print("Importing Accounts")
         accounts_db = env.open_db("accounts".encode())
         confirmation_db = env.open_db("confirmation_height".encode())
@@ -167,57 +653,40 @@ try:
             cursor = txn.cursor(accounts_db)
             if args.key:
                 cursor.set_key(bytearray.fromhex(args.key))
-            mem_cache = []
             tmp = []
-            for key, value in cursor:
-                keystream = KaitaiStream(io.BytesIO(key))
-                valstream = KaitaiStream(io.BytesIO(value))
-
-                account_key = Nanodb.AccountsKey(keystream)
-                account_info = Nanodb.AccountsValue(valstream)
+            key = None
+            batch_start = 0
+            entries = (
+                resume_entries(cursor, "accounts") if delta is None else delta.accounts
+            )
+            for key, value in entries:
+                account_info = decode_account_info(value)
 
-                balance = nanolib.blocks.parse_hex_balance(
-                    account_info.balance.hex().upper()
-                )
+                balance = int.from_bytes(account_info.balance, "big")
 
                 print(
-                    "count: {}, account {}".format(
-                        count, account_key.account.hex().upper()
-                    ),
+                    "count: {}, account {}".format(count, key.hex().upper()),
                     end="\r",
                 )
 
                 data_account = {
-                    "account": nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO,
-                        public_key=account_key.account.hex(),
-                    ),
+                    "account": nano_account.account_id(key),
                     "frontier": account_info.head.hex().upper(),
                     "open_block": account_info.open_block.hex().upper(),
-                    "representative": nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO,
-                        public_key=account_info.representative.hex(),
+                    "representative": nano_account.account_id(
+                        account_info.representative
                     ),
                     "representative_block": None,  # TODO
                     "balance": balance,
-                    "modified_timestamp": datetime.datetime.utcfromtimestamp(
-                        account_info.modified
-                    ).strftime("%s"),
+                    "modified_timestamp": account_info.modified,
                     "block_count": account_info.block_count,
                     "confirmation_height": None,
                     "confirmation_height_frontier": None,
                 }
 
                 try:
-                    confirmation_value = txn.get(
-                        account_key.account, default=None, db=confirmation_db
-                    )
-                    confirmation_valstream = KaitaiStream(
-                        io.BytesIO(confirmation_value)
-                    )
-                    height_info = Nanodb.ConfirmationHeightValue(
-                        confirmation_valstream, None, Nanodb(None)
-                    )
+                    confirmation_value = txn.get(key, default=None, db=confirmation_db)
+                    height_info = decode_confirmation_height(confirmation_value)
                     data_account["confirmation_height"] = height_info.height
                     data_account[
                         "confirmation_height_frontier"
@@ -231,21 +700,13 @@ try:
                 if count >= args.count:
                     break
                 if count % 10000 == 0:
-                    mem_cache.append(tmp)
+                    put_batch(load_accounts, tmp, "accounts", key, count - batch_start)
                     tmp = []
-                if count % 500000 == 0:
-                    Parallel(n_jobs=num_cores)(
-                        delayed(processAccounts)(data_accounts)
-                        for data_accounts in mem_cache
-                    )
-                    mem_cache = []
+                    batch_start = count
 
             cursor.close()
             # add the last batch of accounts to mysql
-            mem_cache.append(tmp)
-            Parallel(n_jobs=num_cores)(
-                delayed(processAccounts)(data_accounts) for data_accounts in mem_cache
-            )
+            put_batch(load_accounts, tmp, "accounts", key, count - batch_start)
         if count == 0:
             print("(empty)\n")
 
@@ -253,264 +714,87 @@ try:
     if args.table == "all" or args.table == "blocks":
 
         print("Importing State Blocks")
-        blocks_db = env.open_db("blocks".encode())
-        confirmation_db = env.open_db("confirmation_height".encode())
-
-        with env.begin() as txn:
-            cursor = txn.cursor(blocks_db)
-            if args.key:
-                cursor.set_key(bytearray.fromhex(args.key))
-
-            count = 0
-            mem_cache2 = []
-            tmp = []
-            for key, value in cursor:
-                keystream = KaitaiStream(io.BytesIO(key))
-                valstream = KaitaiStream(io.BytesIO(value))
-
-                try:
-                    block_key = Nanodb.BlocksKey(keystream)
-                    block = Nanodb.BlocksValue(valstream, None, Nanodb(None))
-                except Exception as ex:
-                    print(ex)
-                    continue
-
-                print(
-                    "count: {}, hash {}".format(count, block_key.hash.hex().upper()),
-                    end="\r",
+        if args.workers > 1:
+            # lmdb does not allow opening an environment twice in a process,
+            # the forked workers open their own and load their batches.
+            env.close()
+            counts = lmdb_shards.map_shards(export_blocks_shard, args.workers)
+            count = sum(counts)
+            print("exported: [{}] blocks in [{}] shards".format(count, len(counts)))
+        elif args.decoders:
+            blocks_db = env.open_db("blocks".encode())
+
+            with env.begin() as txn:
+                cursor = txn.cursor(blocks_db)
+                if args.key:
+                    cursor.set_key(bytearray.fromhex(args.key))
+                entries = (
+                    resume_entries(cursor, "blocks")
+                    if delta is None
+                    else delta.blocks(txn, blocks_db)
                 )
-
-                btype = block.block_type
-
-                if btype == Nanodb.EnumBlocktype.change:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = "5"
-                elif btype == Nanodb.EnumBlocktype.send:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = "4"
-                elif btype == Nanodb.EnumBlocktype.receive:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = "3"
-                elif btype == Nanodb.EnumBlocktype.state:
-                    data_block = get_state_block(block.block_value)
-                    data_block["type"] = "1"
-                elif btype == Nanodb.EnumBlocktype.open:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = "2"
-
-                data_block["hash"] = block_key.hash.hex().upper()
-                if (
-                    btype == Nanodb.EnumBlocktype.state
-                    or btype == Nanodb.EnumBlocktype.send
-                ):
-                    balance = nanolib.blocks.parse_hex_balance(
-                        block.block_value.block.balance.hex().upper()
-                    )
-                else:
-                    balance = nanolib.blocks.parse_hex_balance(
-                        block.block_value.sideband.balance.hex().upper()
-                    )
-
-                data_block["balance"] = balance
-                data_block["confirmed"] = "1"
-                if (
-                    btype == Nanodb.EnumBlocktype.send
-                    or btype == Nanodb.EnumBlocktype.receive
-                    or btype == Nanodb.EnumBlocktype.change
-                ):
-                    account = block.block_value.sideband.account
-                else:
-                    account = block.block_value.block.account
-
-                data_block["account"] = nanolib.accounts.get_account_id(
-                    prefix=nanolib.AccountIDPrefix.NANO, public_key=account.hex()
+                for items in pipeline.read_batches(entries, 10000, args.count):
+                    if progress is not None:
+                        progress.add(("blocks", items[-1][0]), len(items))
+                    decoders.put(decode_blocks, items)
+                    reader.add(len(items))
+                cursor.close()
+            count, failed_batches = decoders.close()
+            error_count += failed_batches
+            print(
+                "exported: [{}] blocks, [{}] failed batch(es)".format(
+                    count, failed_batches
                 )
-
-                if btype == Nanodb.EnumBlocktype.open:
-                    data_block[
-                        "previous"
-                    ] = "0000000000000000000000000000000000000000000000000000000000000000"
-                else:
-                    data_block[
-                        "previous"
-                    ] = block.block_value.block.previous.hex().upper()
-
-                if (
-                    btype == Nanodb.EnumBlocktype.receive
-                    or btype == Nanodb.EnumBlocktype.send
-                ):
-                    data_block["representative"] = None
-                else:
-                    data_block["representative"] = nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO,
-                        public_key=block.block_value.block.representative.hex(),
-                    )
-
-                if btype == Nanodb.EnumBlocktype.state:
-                    data_block["link"] = block.block_value.block.link.hex().upper()
-
-                    if data_block["subtype"] == 4:  # change
-                        data_block["link_account"] = nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=block.block_value.block.representative.hex(),
-                        )
-                    elif data_block["subtype"] == 3:  # send
-                        data_block["link_account"] = nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=block.block_value.block.link.hex(),
-                        )
-                    elif (
-                        data_block["subtype"] == 2 or data_block["subtype"] == 1
-                    ):  # receive or open
-                        try:
-                            linked_block = txn.get(
-                                block.block_value.block.link, default=None, db=blocks_db
-                            )
-                            linked_block_valstream = KaitaiStream(
-                                io.BytesIO(linked_block)
-                            )
-                            linked_block_value = Nanodb.BlocksValue(
-                                linked_block_valstream, None, Nanodb(None)
-                            )
-                            ltype = linked_block_value.block_type
-                            if ltype == Nanodb.EnumBlocktype.send:
-                                linked_account = (
-                                    linked_block_value.block_value.sideband.account
-                                )
-                            else:
-                                linked_account = (
-                                    linked_block_value.block_value.block.account
-                                )
-
-                            data_block[
-                                "link_account"
-                            ] = nanolib.accounts.get_account_id(
-                                prefix=nanolib.AccountIDPrefix.NANO,
-                                public_key=linked_account.hex(),
-                            )
-                        except Exception as ex:
-                            print(ex)
-                            data_block["link_account"] = None
-                    else:
-                        data_block["link_account"] = None
-
-                elif btype == Nanodb.EnumBlocktype.send:
-                    data_block[
-                        "link"
-                    ] = block.block_value.block.destination.hex().upper()
-                    data_block["link_account"] = nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO,
-                        public_key=block.block_value.block.destination.hex(),
-                    )
-                elif btype == Nanodb.EnumBlocktype.receive:
-                    data_block["link"] = block.block_value.block.source.hex().upper()
-
-                    try:
-                        linked_block = txn.get(
-                            block.block_value.block.source, default=None, db=blocks_db
-                        )
-                        linked_block_valstream = KaitaiStream(io.BytesIO(linked_block))
-                        linked_block_value = Nanodb.BlocksValue(
-                            linked_block_valstream, None, Nanodb(None)
-                        )
-                        ltype = linked_block_value.block_type
-                        if ltype == Nanodb.EnumBlocktype.send:
-                            linked_account = (
-                                linked_block_value.block_value.sideband.account
-                            )
-                        else:
-                            linked_account = (
-                                linked_block_value.block_value.block.account
-                            )
-
-                        data_block["link_account"] = nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=linked_account.hex(),
-                        )
-                    except Exception as ex:
-                        print(ex)
-                        data_block["link_account"] = None
-
-                else:
-                    data_block["link"] = None
-                    data_block["link_account"] = None
-
-                data_block[
-                    "signature"
-                ] = block.block_value.block.signature.hex().upper()
-                data_block["work"] = hex(block.block_value.block.work)[2:]
-
-                try:
-                    confirmation_value = txn.get(
-                        account, default=None, db=confirmation_db
-                    )
-                    confirmation_valstream = KaitaiStream(
-                        io.BytesIO(confirmation_value)
-                    )
-                    height_info = Nanodb.ConfirmationHeightValue(
-                        confirmation_valstream, None, Nanodb(None)
-                    )
-                    height = height_info.height
-                except Exception as ex:
-                    print(ex)
-                    height = 0
-
-                if data_block["height"] > 1:
-                    previous = txn.get(
-                        block.block_value.block.previous, default=None, db=blocks_db
-                    )
-                    previous_valstream = KaitaiStream(io.BytesIO(previous))
-                    previous_block = Nanodb.BlocksValue(
-                        previous_valstream, None, Nanodb(None)
-                    )
-                    ptype = previous_block.block_type
-                    if (
-                        ptype == Nanodb.EnumBlocktype.state
-                        or ptype == Nanodb.EnumBlocktype.send
-                    ):
-                        previous_balance = nanolib.blocks.parse_hex_balance(
-                            previous_block.block_value.block.balance.hex().upper()
-                        )
-                    else:
-                        previous_balance = nanolib.blocks.parse_hex_balance(
-                            previous_block.block_value.sideband.balance.hex().upper()
-                        )
-
-                    data_block["amount"] = str(
-                        abs(int(previous_balance) - int(balance))
-                    )
-                else:
-                    data_block["amount"] = balance
-
-                data_block["confirmed"] = "1" if height >= data_block["height"] else "0"
-
-                tmp.append(data_block)
-                count += 1
-
-                if count >= args.count:
-                    break
-                if count % 10000 == 0:
-                    mem_cache2.append(tmp)
-                    tmp = []
-                if count % 500000 == 0:
-                    try:
-                        Parallel(n_jobs=num_cores)(
-                            delayed(processBlocks)(data_blocks)
-                            for data_blocks in mem_cache2
-                        )
-                    except Exception as ex:
-                        print(ex)
-
-                    mem_cache2 = []
-
-            cursor.close()
-            mem_cache2.append(tmp)
-            Parallel(n_jobs=num_cores)(
-                delayed(processBlocks)(data_blocks) for data_blocks in mem_cache2
             )
+        else:
+            blocks_db = env.open_db("blocks".encode())
+            confirmation_db = env.open_db("confirmation_height".encode())
+
+            with env.begin() as txn:
+                cursor = txn.cursor(blocks_db)
+                if args.key:
+                    cursor.set_key(bytearray.fromhex(args.key))
+                entries = (
+                    resume_entries(cursor, "blocks")
+                    if delta is None
+                    else delta.blocks(txn, blocks_db)
+                )
+                count = export_blocks(
+                    txn,
+                    entries,
+                    lambda data_blocks, items: put_batch(
+                        load_blocks, data_blocks, "blocks", items[-1][0], len(items)
+                    ),
+                )
+                cursor.close()
         if count == 0:
             print("(empty)\n")
 
     env.close()
+    loaded, failed = loaders.close()
+    monitor.stop()
+    print("loaded: [{}] rows, [{}] failed batch(es)".format(loaded, failed))
+    if progress is not None:
+        progress.close()
+        if resume is not None:
+            print(
+                "since the first run: [{}] entries, [{}] rows".format(
+                    progress.count, progress.loaded
+                )
+            )
+        if failed or error_count:
+            print(
+                "Checkpoint kept in [{}], --resume exports the failed batches again".format(
+                    args.checkpoint
+                )
+            )
+        else:
+            progress.remove()
+    if delta is not None:
+        if failed or error_count:
+            print("State not saved, the next run exports these changes again")
+        else:
+            delta.state.save(args.state)
+            print("saved: [{}] accounts to [{}]".format(len(delta.state), args.state))
 except Exception as ex:
     print(ex)
@@ -1,53 +1,421 @@
-import io
 import sys
 import os.path
 import datetime
 import argparse
 import ipaddress
 import lmdb
-import nanolib
+import nano_account
 import json
 import math
-import decimal
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
 
-from nanodb import Nanodb
-from kaitaistruct import KaitaiStream
+import numpy as np
+import account_dictionary
+import external_sort
+import ledger_index
+import lmdb_delta
+import lmdb_shards
+import parquet_dataset
+import pipeline
+import nanodb_batch
+import nanodb_fast
+
+
+block_types = {
+    nanodb_fast.BLOCK_TYPE_STATE: 1,
+    nanodb_fast.BLOCK_TYPE_OPEN: 2,
+    nanodb_fast.BLOCK_TYPE_RECEIVE: 3,
+    nanodb_fast.BLOCK_TYPE_SEND: 4,
+    nanodb_fast.BLOCK_TYPE_CHANGE: 5,
+}
+output_types = np.zeros(256, np.int8)
+for btype, output_type in block_types.items():
+    output_types[btype] = output_type
+
+
+def get_blocks_batch(txn, items, schema):
+    columns = nanodb_batch.decode_block_columns(items)
+    block_type = columns["block_type"]
+    height = columns["height"]
+
+    balance = nanodb_batch.balance_parts(columns["balance"])
+    amount_high, amount_low = balance[0].copy(), balance[1].copy()
+    # The amount is null when the previous block is not in the ledger
+    has_amount = np.ones(len(height), np.bool_)
+    rows = np.flatnonzero(height > 1)
+    if len(rows):
+        previous_hashes = columns["previous"][rows]
+        if block_balances is not None:
+            previous_high, previous_low, found = block_balances.lookup(previous_hashes)
+        else:
+            previous_high = np.zeros(len(rows), np.uint64)
+            previous_low = np.zeros(len(rows), np.uint64)
+            found = np.zeros(len(rows), np.bool_)
+        read, previous_items = [], []
+        for index in np.flatnonzero(~found):
+            previous = previous_hashes[index].tobytes()
+            value = txn.get(previous, default=None, db=blocks_db)
+            if value is None:
+                has_amount[rows[index]] = False
+            else:
+                read.append(index)
+                previous_items.append((previous, value))
+        if previous_items:
+            previous_high[read], previous_low[read] = nanodb_batch.balance_parts(
+                nanodb_batch.decode_balance_columns(previous_items)[1]
+            )
+        previous_balance = previous_high, previous_low
+        amount_high[rows], amount_low[rows] = nanodb_batch.absolute_difference(
+            (balance[0][rows], balance[1][rows]), previous_balance
+        )
+
+    accounts, inverse = nanodb_batch.unique_rows(columns["account"])
+    if confirmed_heights is not None:
+        account_keys = np.frombuffer(b"".join(accounts), np.uint8).reshape(-1, 32)
+        confirmation_heights, found = confirmed_heights.lookup(account_keys)
+    else:
+        confirmation_heights = np.zeros(len(accounts), np.uint64)
+        found = np.zeros(len(accounts), np.bool_)
+    for index in np.flatnonzero(~found):
+        account = accounts[index]
+        try:
+            confirmation_value = txn.get(account, default=None, db=confirmation_db)
+            confirmation_heights[index] = decode_confirmation_height(
+                confirmation_value
+            ).height
+        except Exception as ex:
+            print(ex)
+
+    # link_account is the destination of sends and the sender of receives
+    link_account = columns["link"].copy()
+    has_link_account = nanodb_batch.is_send(columns)
+    receives = np.flatnonzero(nanodb_batch.is_receive(columns))
+    if len(receives):
+        link_account[receives], has_link_account[receives] = get_source_accounts(
+            txn, columns["link"][receives]
+        )
+
+    has_link = columns["link_valid"] & (block_type != nanodb_fast.BLOCK_TYPE_OPEN)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(height, pa.int64()),
+            pa.array(columns["timestamp"], pa.int64()),
+            pa.array(columns["subtype"], pa.int8(), mask=columns["subtype"] == 0),
+            pa.array(output_types[block_type], pa.int8()),
+            hash_array(columns["hash"]),
+            nanodb_batch.balance_array(balance),
+            account_array(columns["account"]),
+            hash_array(columns["previous"]),
+            account_array(columns["representative"], columns["representative_valid"]),
+            hash_array(columns["link"], has_link),
+            account_array(link_account, has_link_account),
+            hash_array(columns["signature"]),
+            work_array(columns["work"]),
+            nanodb_batch.balance_array((amount_high, amount_low), has_amount),
+            pa.array(confirmation_heights[inverse] >= height),
+        ],
+        schema=schema,
+    )
+
+
+def get_source_accounts(txn, sources):
+    """Accounts of the send blocks of a (n, 32) hash column and the found mask."""
+    if source_accounts is not None:
+        accounts, found = source_accounts.lookup(sources)
+    else:
+        accounts = np.zeros((len(sources), 32), np.uint8)
+        found = np.zeros(len(sources), np.bool_)
+    rows, items = [], []
+    for row in np.flatnonzero(~found):
+        source = sources[row].tobytes()
+        value = txn.get(source, default=None, db=blocks_db)
+        if value is not None:
+            rows.append(row)
+            items.append((source, value))
+    if items:
+        accounts[rows] = nanodb_batch.decode_block_columns(items)["account"]
+        found[rows] = True
+    return accounts, found
+
+
+def get_source_account(txn, source):
+    """Encoded account of the send block with hash source, None if it is not in the ledger or can not be decoded."""
+    account = None
+    if source_accounts is not None:
+        account = source_accounts.get(source)
+    if account is None:
+        value = txn.get(source, default=None, db=blocks_db)
+        if value is None:
+            return None
+        try:
+            account = decode_block(value).account
+        except Exception as ex:
+            print(ex)
+            return None
+    return encode_account(account)
+
+
+def hash_array(raw, valid=None):
+    if args.schema == "binary":
+        return nanodb_batch.fixed_size_binary_array(raw, valid)
+    return nanodb_batch.hex_string_array(raw, valid)
+
+
+def account_array(raw, valid=None):
+    if account_ids is not None:
+        return account_ids.array(raw, valid)
+    return nanodb_batch.account_id_array(raw, valid)
+
+
+def work_array(work):
+    if args.schema == "binary":
+        return pa.array(work, pa.uint64())
+    return pa.array([format(value, "x") for value in work.tolist()])
+
+
+def encode_hash(value):
+    if args.schema == "binary":
+        return value
+    return value.hex().upper()
+
+
+def encode_account(account):
+    if account_ids is not None:
+        return account_ids.get(account)
+    return nano_account.account_id(account)
+
+
+def encode_work(work):
+    if args.schema == "binary":
+        return work
+    return hex(work)[2:]
 
 
 def get_state_block(block):
-    if block.sideband.height == 1 and block.sideband.is_receive:
+    if block.height == 1 and block.is_receive:
         subtype = 1  # open
-    elif block.sideband.is_receive:
+    elif block.is_receive:
         subtype = 2  # receive
-    elif block.sideband.is_send:
+    elif block.is_send:
         subtype = 3  # send
-    elif block.sideband.is_epoch:
+    elif block.is_epoch:
         subtype = 5  # epoch
     else:
         subtype = 4  # change
 
     return {
-        "height": block.sideband.height,
-        "local_timestamp": int(
-            datetime.datetime.utcfromtimestamp(block.sideband.timestamp).strftime("%s")
-        ),
+        "height": block.height,
+        "local_timestamp": block.timestamp,
         "subtype": subtype,
     }
 
 
 def get_legacy_block(block):
     return {
-        "height": getattr(block.sideband, "height", 1),
-        "local_timestamp": int(
-            datetime.datetime.utcfromtimestamp(block.sideband.timestamp).strftime("%s")
-        ),
+        "height": block.height,
+        "local_timestamp": block.timestamp,
         "subtype": None,
     }
 
 
+def get_confirmation_height(txn, account):
+    if confirmed_heights is not None:
+        height = confirmed_heights.get(account)
+        if height is not None:
+            return height
+    confirmation_value = txn.get(account, default=None, db=confirmation_db)
+    return decode_confirmation_height(confirmation_value).height
+
+
+def get_previous_balance(txn, previous):
+    if block_balances is not None:
+        balance = block_balances.get(previous)
+        if balance is not None:
+            return balance
+    value = txn.get(previous, default=None, db=blocks_db)
+    if value is None:
+        return None
+    try:
+        return int.from_bytes(decode_block(value).balance, "big")
+    except Exception as ex:
+        print(ex)
+        return None
+
+
+def get_blocks_table(txn, items):
+    if args.decoder == "columnar":
+        try:
+            return pa.Table.from_batches([get_blocks_batch(txn, items, blocks_schema)])
+        except Exception as ex:
+            # A value that is truncated or of an unknown block type, the row
+            # decoder skips the blocks it can not decode
+            print("{}, decoding the batch row by row".format(ex))
+
+    data_blocks = []
+    for key, value in items:
+        try:
+            block = decode_block(value)
+        except Exception as ex:
+            print(ex)
+            continue
+
+        btype = block.block_type
+
+        if btype == nanodb_fast.BLOCK_TYPE_STATE:
+            data_block = get_state_block(block)
+        else:
+            data_block = get_legacy_block(block)
+        data_block["type"] = block_types[btype]
+
+        data_block["hash"] = encode_hash(key)
+        balance = int.from_bytes(block.balance, "big")
+
+        data_block["balance"] = balance
+        data_block["account"] = encode_account(block.account)
+
+        if btype == nanodb_fast.BLOCK_TYPE_OPEN:
+            data_block["previous"] = encode_hash(bytes(32))
+        else:
+            data_block["previous"] = encode_hash(block.previous)
+
+        if block.representative is None:
+            data_block["representative"] = None
+        else:
+            data_block["representative"] = encode_account(block.representative)
+
+        if btype == nanodb_fast.BLOCK_TYPE_STATE:
+            data_block["link"] = encode_hash(block.link)
+            if block.is_send:
+                data_block["link_account"] = encode_account(block.link)
+            elif block.is_receive:
+                data_block["link_account"] = get_source_account(txn, block.link)
+            else:
+                data_block["link_account"] = None
+        elif btype == nanodb_fast.BLOCK_TYPE_SEND:
+            data_block["link"] = encode_hash(block.link)
+            data_block["link_account"] = encode_account(block.link)
+        elif btype == nanodb_fast.BLOCK_TYPE_RECEIVE:
+            data_block["link"] = encode_hash(block.link)
+            data_block["link_account"] = get_source_account(txn, block.link)
+        else:
+            data_block["link"] = None
+            data_block["link_account"] = None
+
+        data_block["signature"] = encode_hash(block.signature)
+        data_block["work"] = encode_work(block.work)
+
+        try:
+            height = get_confirmation_height(txn, block.account)
+        except Exception as ex:
+            print(ex)
+            height = 0
+
+        if data_block["height"] > 1:
+            previous_balance = get_previous_balance(txn, block.previous)
+            if previous_balance is None:
+                data_block["amount"] = None
+            else:
+                data_block["amount"] = abs(previous_balance - balance)
+        else:
+            data_block["amount"] = balance
+
+        data_block["confirmed"] = True if height >= data_block["height"] else False
+
+        data_blocks.append(data_block)
+
+    if not data_blocks:
+        return blocks_schema.empty_table()
+    # Arrow converts the balance ints, pandas must not narrow them to int64
+    df_raw = pd.DataFrame(data_blocks).astype({"balance": object, "amount": object})
+    return pa.Table.from_pandas(df_raw, schema=blocks_schema, preserve_index=False)
+
+
+def export_blocks(txn, entries, write_table):
+    count = 0
+    for items in pipeline.read_batches(entries, batch_size, args.count):
+        write_table(get_blocks_table(txn, items))
+        reader.add(len(items))
+        count += len(items)
+        print("count: {}".format(count), end="\r")
+    return count
+
+
+def open_decoder():
+    global blocks_db, confirmation_db
+    env = lmdb_shards.open_env(filename)
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+    return lmdb_shards.ReadTransaction(env)
+
+
+def decode_blocks(reader, items):
+    # Runs in a decoder process, the table goes straight to the writer queue
+    writer.put(write_blocks, get_blocks_table(reader.txn, items))
+    return len(items)
+
+
+def open_blocks_writer(path, shard=0):
+    """ParquetWriter of a blocks file, or a writer into the dataset at path with --partition-by."""
+    sort_by = ["account", "height"] if args.order == "account" else ["local_timestamp"]
+    if partition_by:
+        pqwriter = parquet_dataset.DatasetWriter(
+            path,
+            blocks_schema,
+            partition_by,
+            "{}-{}-{{i}}.parquet".format(blocks_run, shard),
+            args.row_group_size,
+            args.compression,
+            args.compression_level,
+            sort_by,
+        )
+    else:
+        pqwriter = pq.ParquetWriter(
+            path,
+            blocks_schema,
+            compression=args.compression,
+            compression_level=args.compression_level,
+        )
+    if args.order == "account":
+        return external_sort.SortedWriter(
+            pqwriter,
+            sort_by,
+            args.sort_buffer,
+            args.spill_dir,
+            row_group_size=args.row_group_size or batch_size,
+        )
+    return pqwriter
+
+
+def write_blocks(pqwriter, table):
+    pqwriter.write_table(table, row_group_size=args.row_group_size)
+    return table.num_rows
+
+
+def export_blocks_shard(shard, start, end):
+    global blocks_db, confirmation_db
+    env = lmdb_shards.open_env(filename)
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+
+    path = blocks_path
+    if not partition_by:
+        path = os.path.join("blocks", "part-{:03d}.parquet".format(shard))
+    pqwriter = open_blocks_writer(path, shard)
+    with env.begin() as txn:
+        cursor = txn.cursor(blocks_db)
+        count = export_blocks(
+            txn,
+            lmdb_shards.iter_range(cursor, start, end),
+            lambda table: write_blocks(pqwriter, table),
+        )
+        cursor.close()
+    pqwriter.close()
+    env.close()
+    return count
+
+
 # Parse arguments
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -72,7 +440,179 @@ parser.add_argument(
     type=str,
     help="Start iterating at this exact key. This must be a byte array in hex representation.",
 )
+parser.add_argument(
+    "--decoder",
+    type=str,
+    default="columnar",
+    choices=["columnar", "struct", "kaitai"],
+    help="Block decoder: columnar batches straight to Arrow (fast), fixed-offset struct layouts per row or the generated Kaitai classes. Accounts and confirmation heights use the struct layouts unless kaitai is chosen.",
+)
+parser.add_argument(
+    "--schema",
+    type=str,
+    default="hex",
+    choices=["hex", "binary"],
+    help="Store hashes, keys and signatures as uppercase hex strings or as fixed size binary (with work as uint64).",
+)
+parser.add_argument(
+    "--account-dictionary",
+    type=str,
+    help="Store account, representative and link_account as uint32 ids instead of nano_ addresses. The ids are kept in this parquet file (id, account, public_key), built with a first scan of the accounts and blocks tables. An existing file is extended, so the ids stay the same across exports sharing it, for example accounts_dictionary.parquet.",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Scan the blocks table in this many key ranges in parallel, each worker writes blocks/part-NNN.parquet. The blocks directory must be empty.",
+)
+parser.add_argument(
+    "--decoders",
+    type=int,
+    default=0,
+    help="Decode blocks in this many processes between the reader and a writer process. 0 decodes and writes in the reading process.",
+)
+parser.add_argument(
+    "--queue-size",
+    type=int,
+    help="Number of 100000 block batches waiting for each stage before reading blocks, twice the number of its processes if omitted.",
+)
+parser.add_argument(
+    "--report-interval",
+    type=float,
+    default=10,
+    help="Seconds between throughput and queue depth reports of the read, decode and write stages, 0 to disable.",
+)
+parser.add_argument(
+    "--amount",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Take the balance of the previous block from the ledger for each block (lookup) or from a hash to balance index built with one sequential scan first (index, about 24 bytes of memory per block, no random reads).",
+)
+parser.add_argument(
+    "--confirmation-height",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Read the confirmation height of the account of each block from the ledger (lookup) or from an account to height index loaded with one scan of the confirmation_height table first (index, about 16 bytes of memory per account).",
+)
+parser.add_argument(
+    "--link-account",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Take the sending account of receive blocks (link_account) from the send block read from the ledger (lookup) or from a send hash to account index built with one sequential scan first (index, about 40 bytes of memory per send block, no random reads).",
+)
+parser.add_argument(
+    "--state",
+    type=str,
+    help="Incremental export: only the accounts changed since the run that saved this state file and their new blocks, then save the new state. A missing file exports everything and creates it.",
+)
+parser.add_argument(
+    "--partition-by",
+    type=str,
+    help="Write the blocks as a hive partitioned dataset in the blocks directory, partitioned by these comma separated columns: day (UTC day of local_timestamp), type and subtype. For example day,type.",
+)
+parser.add_argument(
+    "--row-group-size",
+    type=int,
+    help="Maximum number of rows in a row group of the blocks files. With --partition-by, also the number of rows buffered per partition before a row group is written.",
+)
+parser.add_argument(
+    "--compression",
+    type=str,
+    default="snappy",
+    choices=["snappy", "zstd", "gzip", "brotli", "lz4", "none"],
+    help="Compression codec of the parquet files.",
+)
+parser.add_argument(
+    "--compression-level",
+    type=int,
+    help="Level of the compression codec, for example 1 (fast) to 22 (small) for zstd.",
+)
+parser.add_argument(
+    "--order",
+    type=str,
+    default="hash",
+    choices=["hash", "account"],
+    help="Order of the blocks: lmdb key order (hash, essentially random) or clustered by account and height with an external sort (account). Clustered files compress better and the row group statistics of account let per-account queries skip most row groups.",
+)
+parser.add_argument(
+    "--sort-buffer",
+    type=int,
+    default=1000000,
+    help="Number of blocks sorted in memory at a time with --order account. Each sorted run is spilled to a file and the runs are merged once all blocks are read.",
+)
+parser.add_argument(
+    "--spill-dir",
+    type=str,
+    help="Directory of the sorted run files of --order account, the system temporary directory if omitted. It needs about the size of the exported blocks.",
+)
 args = parser.parse_args()
+if args.workers > 1 and (args.key or args.count != math.inf):
+    parser.error("--key and --count can not be combined with --workers")
+if args.workers > 1 and args.decoders:
+    parser.error("--decoders can not be combined with --workers")
+if args.state and (
+    args.table != "all" or args.workers > 1 or args.key or args.count != math.inf
+):
+    parser.error(
+        "--state exports all tables and can not be combined with --workers, --key or --count"
+    )
+
+partition_by = []
+if args.partition_by:
+    partition_by = args.partition_by.split(",")
+    for name in partition_by:
+        if name not in parquet_dataset.PARTITION_COLUMNS:
+            parser.error(
+                "--partition-by columns must be among {}".format(
+                    ", ".join(parquet_dataset.PARTITION_COLUMNS)
+                )
+            )
+
+batch_size = 100000
+
+if args.schema == "binary":
+    hash_type = pa.binary(32)
+    signature_type = pa.binary(64)
+    work_type = pa.uint64()
+else:
+    hash_type = pa.string()
+    signature_type = pa.string()
+    work_type = pa.string()
+account_type = pa.string()
+if args.account_dictionary:
+    account_type = account_dictionary.ID_TYPE
+
+blocks_schema = pa.schema(
+    [
+        pa.field("height", pa.int64()),
+        pa.field("local_timestamp", pa.int64()),
+        pa.field("subtype", pa.int8()),
+        pa.field("type", pa.int8()),
+        pa.field("hash", hash_type),
+        pa.field("balance", nanodb_batch.BALANCE_TYPE),
+        pa.field("account", account_type),
+        pa.field("previous", hash_type),
+        pa.field("representative", account_type),
+        pa.field("link", hash_type),
+        pa.field("link_account", account_type),
+        pa.field("signature", signature_type),
+        pa.field("work", work_type),
+        pa.field("amount", nanodb_batch.BALANCE_TYPE),
+        pa.field("confirmed", pa.bool_()),
+    ]
+)
+
+if args.decoder == "kaitai":
+    decode_block = nanodb_fast.decode_block_kaitai
+    decode_confirmation_height = nanodb_fast.decode_confirmation_height_kaitai
+    decode_account_info = nanodb_fast.decode_account_info_kaitai
+else:
+    decode_block = nanodb_fast.decode_block
+    decode_confirmation_height = nanodb_fast.decode_confirmation_height
+    decode_account_info = nanodb_fast.decode_account_info
 
 try:
     # Override database filename
@@ -82,6 +622,86 @@ try:
     if not os.path.isfile(filename):
         raise Exception("Database doesn't exist")
 
+    # Built before the stages are forked, the workers share them copy-on-write
+    block_balances = None
+    if args.amount == "index" and (args.table == "all" or args.table == "blocks"):
+        print("Indexing block balances")
+        block_balances = ledger_index.BalanceIndex.from_ledger(filename)
+        print("indexed: [{}] blocks".format(len(block_balances)))
+    confirmed_heights = None
+    if args.confirmation_height == "index" and (
+        args.table == "all" or args.table == "blocks"
+    ):
+        print("Indexing confirmation heights")
+        confirmed_heights = ledger_index.ConfirmationHeightIndex.from_ledger(filename)
+        print("indexed: [{}] accounts".format(len(confirmed_heights)))
+    source_accounts = None
+    if args.link_account == "index" and (args.table == "all" or args.table == "blocks"):
+        print("Indexing send accounts")
+        source_accounts = ledger_index.SourceAccountIndex.from_ledger(filename)
+        print("indexed: [{}] sends".format(len(source_accounts)))
+
+    delta = None
+    error_count = 0
+    if args.state:
+        state = lmdb_delta.ExportState.load(args.state)
+        delta = lmdb_delta.Delta.from_ledger(filename, state)
+        print(
+            "changed: [{}] of [{}] accounts since [{}]".format(
+                len(delta.accounts), len(delta.state), state.modified
+            )
+        )
+    account_ids = None
+    if args.account_dictionary:
+        print("Assigning account ids")
+        account_ids = account_dictionary.AccountDictionary.load(args.account_dictionary)
+        added = account_ids.add_ledger(
+            filename, delta, args.table == "all" or args.table == "blocks"
+        )
+        account_ids.save(args.account_dictionary)
+        print("ids: [{}] accounts, [{}] new".format(len(account_ids), added))
+    accounts_path, blocks_path = "accounts.parquet", "blocks.parquet"
+    blocks_run = "part"
+    if delta is not None:
+        # Each run writes the rows changed since the previous run to new files
+        run = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        accounts_path = "accounts-delta-{}.parquet".format(run)
+        blocks_path = "blocks-delta-{}.parquet".format(run)
+        blocks_run = "delta-{}".format(run)
+    if partition_by:
+        # Delta runs add their files to the dataset of the full export
+        blocks_path = "blocks"
+    # Files of an earlier export would be read as part of the new one
+    if (
+        (partition_by or args.workers > 1)
+        and delta is None
+        and (args.table == "all" or args.table == "blocks")
+        and os.path.isdir("blocks")
+        and os.listdir("blocks")
+    ):
+        raise Exception(
+            "The blocks directory is not empty, remove it before a full export"
+        )
+
+    # The stages are forked before this process opens the environment, lmdb
+    # does not allow a child to use or reopen an environment open in its parent.
+    reader = pipeline.Counter("read")
+    stages = [reader]
+    if args.decoders and (args.table == "all" or args.table == "blocks"):
+        writer = pipeline.Stage(
+            "write",
+            lambda: open_blocks_writer(blocks_path),
+            1,
+            args.queue_size,
+        )
+        decoders = pipeline.Stage(
+            "decode", open_decoder, args.decoders, args.queue_size
+        )
+        stages += [decoders, writer]
+    monitor = pipeline.Monitor(stages, args.report_interval)
+    if args.report_interval > 0:
+        monitor.start()
+
     env = lmdb.open(filename, subdir=False, max_dbs=100)
 
     pqwriter = None
@@ -92,78 +712,61 @@ try:
         confirmation_db = env.open_db("confirmation_height".encode())
 
         count = 0
-        batch_size = 100000
         data_accounts = []
 
         fields = [
-            pa.field("balance", pa.decimal128(39, 0)),
-            pa.field("account", pa.string()),
-            pa.field("frontier", pa.string()),
-            pa.field("open_block", pa.string()),
-            pa.field("representative_block", pa.string()),
+            pa.field("balance", nanodb_batch.BALANCE_TYPE),
+            pa.field("account", account_type),
+            pa.field("frontier", hash_type),
+            pa.field("open_block", hash_type),
+            pa.field("representative_block", hash_type),
             pa.field("modified_timestamp", pa.int64()),
             pa.field("block_count", pa.int64()),
             pa.field("confirmation_height", pa.int64()),
-            pa.field("confirmation_height_frontier", pa.string()),
+            pa.field("confirmation_height_frontier", hash_type),
         ]
         schema = pa.schema(fields)
-        pqwriter = pq.ParquetWriter("accounts.parquet", schema)
+        pqwriter = pq.ParquetWriter(
+            accounts_path,
+            schema,
+            compression=args.compression,
+            compression_level=args.compression_level,
+        )
 
         with env.begin() as txn:
             cursor = txn.cursor(accounts_db)
             if args.key:
                 cursor.set_key(bytearray.fromhex(args.key))
 
-            for key, value in cursor:
-
-                keystream = KaitaiStream(io.BytesIO(key))
-                valstream = KaitaiStream(io.BytesIO(value))
+            entries = cursor if delta is None else delta.accounts
+            for key, value in entries:
 
-                account_key = Nanodb.AccountsKey(keystream)
-                account_info = Nanodb.AccountsValue(valstream)
+                account_info = decode_account_info(value)
 
                 print(
-                    "count: {}, account {}".format(
-                        count, account_key.account.hex().upper()
-                    ),
+                    "count: {}, account {}".format(count, key.hex().upper()),
                     end="\r",
                 )
 
                 try:
-                    confirmation_value = txn.get(
-                        account_key.account, default=None, db=confirmation_db
-                    )
-                    confirmation_valstream = KaitaiStream(
-                        io.BytesIO(confirmation_value)
-                    )
-                    height_info = Nanodb.ConfirmationHeightValue(
-                        confirmation_valstream, None, Nanodb(None)
-                    )
+                    confirmation_value = txn.get(key, default=None, db=confirmation_db)
+                    height_info = decode_confirmation_height(confirmation_value)
                     height = height_info.height
-                    height_frontier = height_info.frontier.hex().upper()
+                    height_frontier = encode_hash(height_info.frontier)
                 except Exception as ex:
                     print(ex)
                     height = 0
                     height_frontier = None
 
                 data_account = {}
-                balance = nanolib.blocks.parse_hex_balance(
-                    account_info.balance.hex().upper()
-                )
+                data_account["balance"] = int.from_bytes(account_info.balance, "big")
+                data_account["account"] = encode_account(key)
 
-                data_account["balance"] = decimal.Decimal(balance)
-                data_account["account"] = nanolib.accounts.get_account_id(
-                    prefix=nanolib.AccountIDPrefix.NANO,
-                    public_key=account_key.account.hex(),
-                )
-
-                data_account["frontier"] = account_info.head.hex().upper()
-                data_account["open_block"] = account_info.open_block.hex().upper()
+                data_account["frontier"] = encode_hash(account_info.head)
+                data_account["open_block"] = encode_hash(account_info.open_block)
                 # TODO
                 data_account["representative_block"] = None
-                data_account["modified_timestamp"] = datetime.datetime.utcfromtimestamp(
-                    account_info.modified
-                ).strftime("%s")
+                data_account["modified_timestamp"] = account_info.modified
 
                 data_account["block_count"] = account_info.block_count
                 data_account["confirmation_height"] = height
@@ -173,7 +776,7 @@ try:
 
                 if len(data_accounts) == batch_size:
                     df_raw = pd.DataFrame(data_accounts)
-                    df_raw = df_raw.astype({"modified_timestamp": int})
+                    df_raw = df_raw.astype({"balance": object})
                     table = pa.Table.from_pandas(
                         df_raw, schema=schema, preserve_index=False
                     )
@@ -182,230 +785,76 @@ try:
 
                 count += 1
                 if count >= args.count:
-                    df_raw = pd.DataFrame(data_accounts)
-                    df_raw = df_raw.astype({"modified_timestamp": int})
-                    table = pa.Table.from_pandas(
-                        df_raw, schema=schema, preserve_index=False
-                    )
-                    pqwriter.write_table(table)
                     break
 
+            if data_accounts:
+                df_raw = pd.DataFrame(data_accounts)
+                df_raw = df_raw.astype({"balance": object})
+                table = pa.Table.from_pandas(
+                    df_raw, schema=schema, preserve_index=False
+                )
+                pqwriter.write_table(table)
             cursor.close()
+        pqwriter.close()
         if count == 0:
             print("(empty)\n")
 
     # blocks table
     if args.table == "all" or args.table == "blocks":
         print("Importing State Blocks")
-        blocks_db = env.open_db("blocks".encode())
-        confirmation_db = env.open_db("confirmation_height".encode())
-
-        with env.begin() as txn:
-            cursor = txn.cursor(blocks_db)
-            if args.key:
-                cursor.set_key(bytearray.fromhex(args.key))
-
-            count = 0
-            index = 0
-            append = False
-            batch_size = 100000
-            data_blocks = []
-
-            fields = [
-                pa.field("height", pa.int64()),
-                pa.field("local_timestamp", pa.int64()),
-                pa.field("subtype", pa.int8()),
-                pa.field("type", pa.int8()),
-                pa.field("hash", pa.string()),
-                pa.field("balance", pa.decimal128(39, 0)),
-                pa.field("account", pa.string()),
-                pa.field("previous", pa.string()),
-                pa.field("representative", pa.string()),
-                pa.field("link", pa.string()),
-                pa.field("link_account", pa.string()),
-                pa.field("signature", pa.string()),
-                pa.field("work", pa.string()),
-                pa.field("amount", pa.decimal128(39, 0)),
-                pa.field("confirmed", pa.bool_()),
-            ]
-            schema = pa.schema(fields)
-            pqwriter = pq.ParquetWriter("blocks.parquet", schema)
-
-            for key, value in cursor:
-                keystream = KaitaiStream(io.BytesIO(key))
-                valstream = KaitaiStream(io.BytesIO(value))
-
-                try:
-                    block_key = Nanodb.BlocksKey(keystream)
-                    block = Nanodb.BlocksValue(valstream, None, Nanodb(None))
-                except Exception as ex:
-                    print(ex)
-                    continue
-
-                print(
-                    "count: {}, hash {}".format(count, block_key.hash.hex().upper()),
-                    end="\r",
+        if args.workers > 1:
+            # lmdb does not allow opening an environment twice in a process,
+            # the forked workers open their own.
+            env.close()
+            os.makedirs("blocks", exist_ok=True)
+            counts = lmdb_shards.map_shards(export_blocks_shard, args.workers)
+            count = sum(counts)
+            print("exported: [{}] blocks in [{}] parts".format(count, len(counts)))
+        elif args.decoders:
+            blocks_db = env.open_db("blocks".encode())
+
+            with env.begin() as txn:
+                cursor = txn.cursor(blocks_db)
+                if args.key:
+                    cursor.set_key(bytearray.fromhex(args.key))
+                entries = cursor if delta is None else delta.blocks(txn, blocks_db)
+                for items in pipeline.read_batches(entries, batch_size, args.count):
+                    decoders.put(decode_blocks, items)
+                    reader.add(len(items))
+                cursor.close()
+            count, error_count = decoders.close()
+            written, write_failed = writer.close()
+            error_count += write_failed
+            print(
+                "exported: [{}] blocks, [{}] written, [{}] failed batch(es)".format(
+                    count, written, error_count
                 )
-
-                btype = block.block_type
-
-                if btype == Nanodb.EnumBlocktype.change:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = 5
-                elif btype == Nanodb.EnumBlocktype.send:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = 4
-                elif btype == Nanodb.EnumBlocktype.receive:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = 3
-                elif btype == Nanodb.EnumBlocktype.state:
-                    data_block = get_state_block(block.block_value)
-                    data_block["type"] = 1
-                elif btype == Nanodb.EnumBlocktype.open:
-                    data_block = get_legacy_block(block.block_value)
-                    data_block["type"] = 2
-
-                data_block["hash"] = block_key.hash.hex().upper()
-                if (
-                    btype == Nanodb.EnumBlocktype.state
-                    or btype == Nanodb.EnumBlocktype.send
-                ):
-                    balance = nanolib.blocks.parse_hex_balance(
-                        block.block_value.block.balance.hex().upper()
-                    )
-                else:
-                    balance = nanolib.blocks.parse_hex_balance(
-                        block.block_value.sideband.balance.hex().upper()
-                    )
-
-                data_block["balance"] = decimal.Decimal(balance)
-                if (
-                    btype == Nanodb.EnumBlocktype.send
-                    or btype == Nanodb.EnumBlocktype.receive
-                    or btype == Nanodb.EnumBlocktype.change
-                ):
-                    account = block.block_value.sideband.account
-                else:
-                    account = block.block_value.block.account
-
-                data_block["account"] = nanolib.accounts.get_account_id(
-                    prefix=nanolib.AccountIDPrefix.NANO, public_key=account.hex()
+            )
+        else:
+            blocks_db = env.open_db("blocks".encode())
+            confirmation_db = env.open_db("confirmation_height".encode())
+
+            pqwriter = open_blocks_writer(blocks_path)
+            with env.begin() as txn:
+                cursor = txn.cursor(blocks_db)
+                if args.key:
+                    cursor.set_key(bytearray.fromhex(args.key))
+                entries = cursor if delta is None else delta.blocks(txn, blocks_db)
+                count = export_blocks(
+                    txn, entries, lambda table: write_blocks(pqwriter, table)
                 )
-
-                if btype == Nanodb.EnumBlocktype.open:
-                    data_block[
-                        "previous"
-                    ] = "0000000000000000000000000000000000000000000000000000000000000000"
-                else:
-                    data_block[
-                        "previous"
-                    ] = block.block_value.block.previous.hex().upper()
-
-                if (
-                    btype == Nanodb.EnumBlocktype.receive
-                    or btype == Nanodb.EnumBlocktype.send
-                ):
-                    data_block["representative"] = None
-                else:
-                    data_block["representative"] = nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO,
-                        public_key=block.block_value.block.representative.hex(),
-                    )
-
-                if btype == Nanodb.EnumBlocktype.state:
-                    data_block["link"] = block.block_value.block.link.hex().upper()
-                    # TODO - Pairing send's block hash (open/receive), 0 (change) or destination public key (send)
-                    data_block["link_account"] = None
-                elif btype == Nanodb.EnumBlocktype.send:
-                    data_block[
-                        "link"
-                    ] = block.block_value.block.destination.hex().upper()
-                    data_block["link_account"] = nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO,
-                        public_key=block.block_value.block.destination.hex(),
-                    )
-                elif btype == Nanodb.EnumBlocktype.receive:
-                    data_block["link"] = block.block_value.block.source.hex().upper()
-                    data_block["link_account"] = None
-                    # TODO - use source has to get account
-                else:
-                    data_block["link"] = None
-                    data_block["link_account"] = None
-
-                data_block[
-                    "signature"
-                ] = block.block_value.block.signature.hex().upper()
-                data_block["work"] = hex(block.block_value.block.work)[2:]
-
-                try:
-                    confirmation_value = txn.get(
-                        account, default=None, db=confirmation_db
-                    )
-                    confirmation_valstream = KaitaiStream(
-                        io.BytesIO(confirmation_value)
-                    )
-                    height_info = Nanodb.ConfirmationHeightValue(
-                        confirmation_valstream, None, Nanodb(None)
-                    )
-                    height = height_info.height
-                except Exception as ex:
-                    print(ex)
-                    height = 0
-
-                if data_block["height"] > 1:
-                    previous = txn.get(
-                        block.block_value.block.previous, default=None, db=blocks_db
-                    )
-                    previous_valstream = KaitaiStream(io.BytesIO(previous))
-                    previous_block = Nanodb.BlocksValue(
-                        previous_valstream, None, Nanodb(None)
-                    )
-                    ptype = previous_block.block_type
-                    if (
-                        ptype == Nanodb.EnumBlocktype.state
-                        or ptype == Nanodb.EnumBlocktype.send
-                    ):
-                        previous_balance = nanolib.blocks.parse_hex_balance(
-                            previous_block.block_value.block.balance.hex().upper()
-                        )
-                    else:
-                        previous_balance = nanolib.blocks.parse_hex_balance(
-                            previous_block.block_value.sideband.balance.hex().upper()
-                        )
-                    data_block["amount"] = decimal.Decimal(
-                        abs(previous_balance - balance)
-                    )
-                else:
-                    data_block["amount"] = decimal.Decimal(balance)
-
-                data_block["confirmed"] = (
-                    True if height >= data_block["height"] else False
-                )
-
-                data_blocks.append(data_block)
-
-                if len(data_blocks) == batch_size:
-                    df_raw = pd.DataFrame(data_blocks)
-                    table = pa.Table.from_pandas(
-                        df_raw, schema=schema, preserve_index=False
-                    )
-                    pqwriter.write_table(table)
-                    data_blocks = []
-
-                count += 1
-
-                if count >= args.count:
-                    df_raw = pd.DataFrame(data_blocks)
-                    table = pa.Table.from_pandas(
-                        df_raw, schema=schema, preserve_index=False
-                    )
-                    pqwriter.write_table(table)
-                    break
-            cursor.close()
+                cursor.close()
+            pqwriter.close()
         if count == 0:
             print("(empty)\n")
 
-    pqwriter.close()
     env.close()
+    monitor.stop()
+    if delta is not None:
+        if error_count:
+            print("State not saved, the next run exports these changes again")
+        else:
+            delta.state.save(args.state)
+            print("saved: [{}] accounts to [{}]".format(len(delta.state), args.state))
 except Exception as ex:
     print(ex)
@@ -1,19 +1,23 @@
-import io
 import sys
 import os.path
-import datetime
 import argparse
+import shutil
+import tempfile
 import ipaddress
 import lmdb
-import nanolib
+import nano_account
 import json
 import math
-from nanodb import Nanodb
-from kaitaistruct import KaitaiStream
+import block_stats
+import checkpoint
+import ledger_index
+import lmdb_delta
+import lmdb_shards
+import pipeline
+import nanodb_fast
+import pg_copy
 import psycopg2
 import multiprocessing
-from joblib import Parallel, delayed
-import dill as pickle
 
 with open("config.json") as json_data_file:
     config = json.load(json_data_file)
@@ -27,6 +31,20 @@ accounts_disable_index = "UPDATE pg_index SET indisready=false WHERE indrelid =
 accounts_enable_index = "UPDATE pg_index SET indisready=true WHERE indrelid = (SELECT oid FROM pg_class WHERE relname='accounts'); REINDEX TABLE accounts ;"
 
 
+blocks_conflict = (
+    "ON CONFLICT (hash) DO UPDATE SET amount=excluded.amount, balance=excluded.balance, height=excluded.height,"
+    "account=excluded.account, previous=excluded.previous, representative=excluded.representative, link=excluded.link,"
+    "link_account=excluded.link_account, signature=excluded.signature, work=excluded.work, subtype=excluded.subtype"
+)
+
+accounts_conflict = (
+    "ON CONFLICT (account) DO UPDATE SET frontier=excluded.frontier, open_block=excluded.open_block,"
+    "representative_block=excluded.representative_block, balance=excluded.balance,"
+    "modified_timestamp=excluded.modified_timestamp, block_count=excluded.block_count,"
+    "confirmation_height=excluded.confirmation_height,"
+    "confirmation_height_frontier=excluded.confirmation_height_frontier"
+)
+
 add_block = (
     "INSERT INTO blocks "
     "(hash, amount, balance, height, local_timestamp, confirmed,"
@@ -34,52 +52,148 @@ add_block = (
     "work, subtype) VALUES (%(hash)s, %(amount)s, %(balance)s, %(height)s,"
     "%(local_timestamp)s, %(confirmed)s, %(type)s, %(account)s, %(previous)s,"
     "%(representative)s, %(link)s, %(link_account)s, %(signature)s, %(work)s,"
-    "%(subtype)s)"
-    "ON CONFLICT (hash) DO UPDATE SET amount=excluded.amount, balance=excluded.balance, height=excluded.height,"
-    "account=excluded.account, previous=excluded.previous, representative=excluded.representative, link=excluded.link,"
-    "link_account=excluded.link_account, signature=excluded.signature, work=excluded.work, subtype=excluded.subtype"
+    "%(subtype)s) " + blocks_conflict
 )
 
 add_account = (
     "INSERT INTO accounts "
     "(account, frontier, open_block, representative_block, balance, modified_timestamp,"
     "block_count, confirmation_height, confirmation_height_frontier) VALUES (%s, %s, %s, %s,"
-    "%s, %s, %s, %s, %s) "
-    "ON CONFLICT (account) DO UPDATE SET frontier=excluded.frontier, open_block=excluded.open_block,"
-    "representative_block=excluded.representative_block, balance=excluded.balance,"
-    "modified_timestamp=excluded.modified_timestamp, block_count=excluded.block_count,"
-    "confirmation_height=excluded.confirmation_height,"
-    "confirmation_height_frontier=excluded.confirmation_height_frontier"
+    "%s, %s, %s, %s, %s) " + accounts_conflict
 )
 
+# Bulk load: each batch is streamed with binary COPY into a temporary
+# staging table (session local and not WAL logged) and merged with a single
+# INSERT ... SELECT ... ON CONFLICT.
+block_columns = [
+    ("hash", pg_copy.text),
+    ("amount", pg_copy.numeric),
+    ("balance", pg_copy.numeric),
+    ("height", pg_copy.int4),
+    ("local_timestamp", pg_copy.int4),
+    ("confirmed", pg_copy.int4),
+    ("type", pg_copy.int4),
+    ("account", pg_copy.text),
+    ("previous", pg_copy.text),
+    ("representative", pg_copy.text),
+    ("link", pg_copy.text),
+    ("link_account", pg_copy.text),
+    ("signature", pg_copy.text),
+    ("work", pg_copy.text),
+    ("subtype", pg_copy.int4),
+]
+
+account_columns = [
+    ("account", pg_copy.text),
+    ("frontier", pg_copy.text),
+    ("open_block", pg_copy.text),
+    ("representative_block", pg_copy.text),
+    ("balance", pg_copy.numeric),
+    ("modified_timestamp", pg_copy.int4),
+    ("block_count", pg_copy.int4),
+    ("confirmation_height", pg_copy.int4),
+    ("confirmation_height_frontier", pg_copy.text),
+]
+
+block_column_names = ", ".join(name for name, _ in block_columns)
+account_column_names = ", ".join(name for name, _ in account_columns)
+
+create_blocks_staging = "CREATE TEMP TABLE IF NOT EXISTS blocks_staging (LIKE blocks INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+create_accounts_staging = "CREATE TEMP TABLE IF NOT EXISTS accounts_staging (LIKE accounts INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+
+copy_blocks = "COPY blocks_staging ({}) FROM STDIN WITH (FORMAT binary)".format(
+    block_column_names
+)
+copy_accounts = "COPY accounts_staging ({}) FROM STDIN WITH (FORMAT binary)".format(
+    account_column_names
+)
+
+merge_blocks = "INSERT INTO blocks ({0}) SELECT {0} FROM blocks_staging {1}".format(
+    block_column_names, blocks_conflict
+)
+merge_accounts = (
+    "INSERT INTO accounts ({0}) SELECT {0} FROM accounts_staging {1}".format(
+        account_column_names, accounts_conflict
+    )
+)
+
+# The stats are loaded in one transaction at the end of the export, the
+# staging tables are emptied after each batch and dropped on commit.
+source_destination_stats_columns = [
+    ("source_account", pg_copy.text),
+    ("blocktype", pg_copy.text),
+    ("destination_account", pg_copy.text),
+    ("block_count", pg_copy.int8),
+    ("total_amount", pg_copy.numeric),
+]
+
+account_stats_columns = [
+    ("account", pg_copy.text),
+    ("blocktype", pg_copy.text),
+    ("block_count", pg_copy.int8),
+    ("total_amount", pg_copy.numeric),
+]
+
+source_destination_stats_column_names = ", ".join(
+    name for name, _ in source_destination_stats_columns
+)
+account_stats_column_names = ", ".join(name for name, _ in account_stats_columns)
+
+create_source_destination_stats_staging = "CREATE TEMP TABLE source_destination_stats_staging (LIKE source_destination_stats INCLUDING DEFAULTS) ON COMMIT DROP"
+create_account_stats_staging = "CREATE TEMP TABLE account_stats_staging (LIKE account_stats INCLUDING DEFAULTS) ON COMMIT DROP"
+
+copy_source_destination_stats = (
+    "COPY source_destination_stats_staging ({}) FROM STDIN WITH (FORMAT binary)".format(
+        source_destination_stats_column_names
+    )
+)
+copy_account_stats = (
+    "COPY account_stats_staging ({}) FROM STDIN WITH (FORMAT binary)".format(
+        account_stats_column_names
+    )
+)
+
+merge_source_destination_stats = "INSERT INTO source_destination_stats ({0}) SELECT {0} FROM source_destination_stats_staging {1}; TRUNCATE source_destination_stats_staging".format(
+    source_destination_stats_column_names,
+    block_stats.source_destination_stats_conflict,
+)
+merge_account_stats = "INSERT INTO account_stats ({0}) SELECT {0} FROM account_stats_staging {1}; TRUNCATE account_stats_staging".format(
+    account_stats_column_names, block_stats.account_stats_conflict
+)
+
+
+block_types = {
+    nanodb_fast.BLOCK_TYPE_STATE: "1",
+    nanodb_fast.BLOCK_TYPE_OPEN: "2",
+    nanodb_fast.BLOCK_TYPE_RECEIVE: "3",
+    nanodb_fast.BLOCK_TYPE_SEND: "4",
+    nanodb_fast.BLOCK_TYPE_CHANGE: "5",
+}
+
 
 def get_state_block(block):
-    if block.sideband.height == 1 and block.sideband.is_receive:
+    if block.height == 1 and block.is_receive:
         subtype = 1  # open
-    elif block.sideband.is_receive:
+    elif block.is_receive:
         subtype = 2  # receive
-    elif block.sideband.is_send:
+    elif block.is_send:
         subtype = 3  # send
-    elif block.sideband.is_epoch:
+    elif block.is_epoch:
         subtype = 5  # epoch
     else:
         subtype = 4  # change
 
     return {
-        "height": block.sideband.height,
-        "local_timestamp": datetime.datetime.utcfromtimestamp(
-            block.sideband.timestamp
-        ).strftime("%s"),
+        "height": block.height,
+        "local_timestamp": block.timestamp,
         "subtype": subtype,
     }
 
 
 def get_legacy_block(block):
     return {
-        "height": getattr(block.sideband, "height", 1),
-        "local_timestamp": datetime.datetime.utcfromtimestamp(
-            block.sideband.timestamp
-        ).strftime("%s"),
+        "height": block.height,
+        "local_timestamp": block.timestamp,
         "subtype": None,
     }
 
@@ -114,8 +228,7 @@ def enableIndex():
     postgresql_cursor.execute(accounts_enable_index)
 
 
-def processAccounts(data_in):
-    # export_counter = 0
+def connect():
     conn = psycopg2.connect(
         "host={} port={} dbname={} user={} password={}".format(
             postgresql_config["host"],
@@ -126,38 +239,325 @@ def processAccounts(data_in):
         )
     )
     conn.set_session(autocommit=False)
+    return conn
+
+
+def load_accounts(conn, data_in):
     postgresql_cursor = conn.cursor()
     # postgresql_cursor.execute("SET foreign_key_checks = 0")
     # postgresql_cursor.execute("SET unique_checks = 0")
-    for data_account in data_in:
-        postgresql_cursor.execute(add_account, data_account)
-        # export_counter += 1
-        # print("import_count : [{}]".format(export_counter))
+    if args.load == "copy":
+        postgresql_cursor.execute(create_accounts_staging)
+        postgresql_cursor.copy_expert(
+            copy_accounts,
+            pg_copy.copy_buffer(data_in, [encode for _, encode in account_columns]),
+        )
+        postgresql_cursor.execute(merge_accounts)
+        print("loaded: [{}] accounts".format(postgresql_cursor.rowcount))
+    else:
+        for data_account in data_in:
+            postgresql_cursor.execute(add_account, data_account)
+            # export_counter += 1
+            # print("import_count : [{}]".format(export_counter))
     conn.commit()
-    conn.close()
+    return len(data_in)
 
 
-def processBlocks(data_in):
-    # export_counter = 0
-    conn = psycopg2.connect(
-        "host={} port={} dbname={} user={} password={}".format(
-            postgresql_config["host"],
-            postgresql_config["port"],
-            postgresql_config["dbname"],
-            postgresql_config["user"],
-            postgresql_config["password"],
-        )
-    )
-    conn.set_session(autocommit=False)
+def load_blocks(conn, data_in):
     postgresql_cursor = conn.cursor()
     # postgresql_cursor.execute("SET foreign_key_checks = 0")
     # postgresql_cursor.execute("SET unique_checks = 0")
-    for data_blocks in data_in:
-        postgresql_cursor.execute(add_block, data_blocks)
-        # export_counter += 1
-        # print("import_count : [{}]".format(export_counter))
+    if args.load == "copy":
+        postgresql_cursor.execute(create_blocks_staging)
+        rows = (
+            [data_block[name] for name, _ in block_columns] for data_block in data_in
+        )
+        postgresql_cursor.copy_expert(
+            copy_blocks,
+            pg_copy.copy_buffer(rows, [encode for _, encode in block_columns]),
+        )
+        postgresql_cursor.execute(merge_blocks)
+        print("loaded: [{}] blocks".format(postgresql_cursor.rowcount))
+    else:
+        for data_blocks in data_in:
+            postgresql_cursor.execute(add_block, data_blocks)
+            # export_counter += 1
+            # print("import_count : [{}]".format(export_counter))
     conn.commit()
+    return len(data_in)
+
+
+def copy_stats(cursor, copy, merge, columns, groups):
+    count = 0
+    for batch in pipeline.read_batches(groups, 100000):
+        cursor.copy_expert(
+            copy, pg_copy.copy_buffer(batch, [encode for _, encode in columns])
+        )
+        cursor.execute(merge)
+        count += len(batch)
+    return count
+
+
+def load_stats(replace):
+    """Merge the spilled stats into the stats tables, replacing them if replace."""
+    conn = connect()
+    postgresql_cursor = conn.cursor()
+    postgresql_cursor.execute(block_stats.create_account_stats)
+    postgresql_cursor.execute(block_stats.create_account_stats_index)
+    postgresql_cursor.execute(block_stats.create_source_destination_stats)
+    postgresql_cursor.execute(block_stats.create_source_destination_stats_index)
+    postgresql_cursor.execute(block_stats.create_stats_watermarks)
+    postgresql_cursor.execute(block_stats.delete_stats_watermarks)
+    if replace:
+        postgresql_cursor.execute("TRUNCATE account_stats, source_destination_stats")
+    postgresql_cursor.execute(create_source_destination_stats_staging)
+    postgresql_cursor.execute(create_account_stats_staging)
+    pairs = copy_stats(
+        postgresql_cursor,
+        copy_source_destination_stats,
+        merge_source_destination_stats,
+        source_destination_stats_columns,
+        stats.merge(),
+    )
+    accounts = copy_stats(
+        postgresql_cursor,
+        copy_account_stats,
+        merge_account_stats,
+        account_stats_columns,
+        block_stats.account_totals(stats.merge()),
+    )
+    conn.commit()
+    conn.close()
+    return pairs, accounts
+
+
+def get_confirmation_height(txn, account):
+    if confirmed_heights is not None:
+        height = confirmed_heights.get(account)
+        if height is not None:
+            return height
+    confirmation_value = txn.get(account, default=None, db=confirmation_db)
+    return decode_confirmation_height(confirmation_value).height
+
+
+def get_previous_balance(txn, previous):
+    if block_balances is not None:
+        balance = block_balances.get(previous)
+        if balance is not None:
+            return balance
+    value = txn.get(previous, default=None, db=blocks_db)
+    if value is None:
+        return None
+    try:
+        return int.from_bytes(decode_block(value).balance, "big")
+    except Exception as ex:
+        print(ex)
+        return None
+
+
+def get_source_account(txn, source):
+    """nano_ account of the send block with hash source, None if it is not in the ledger or can not be decoded."""
+    account = None
+    if source_accounts is not None:
+        account = source_accounts.get(source)
+    if account is None:
+        value = txn.get(source, default=None, db=blocks_db)
+        if value is None:
+            return None
+        try:
+            account = decode_block(value).account
+        except Exception as ex:
+            print(ex)
+            return None
+    return nano_account.account_id(account)
+
+
+def get_block_row(txn, key, block):
+    btype = block.block_type
+
+    if btype == nanodb_fast.BLOCK_TYPE_STATE:
+        data_block = get_state_block(block)
+    else:
+        data_block = get_legacy_block(block)
+    data_block["type"] = block_types[btype]
+
+    data_block["hash"] = key.hex().upper()
+    balance = int.from_bytes(block.balance, "big")
+
+    data_block["balance"] = balance
+    data_block["confirmed"] = "1"
+    data_block["account"] = nano_account.account_id(block.account)
+
+    if btype == nanodb_fast.BLOCK_TYPE_OPEN:
+        data_block[
+            "previous"
+        ] = "0000000000000000000000000000000000000000000000000000000000000000"
+    else:
+        data_block["previous"] = block.previous.hex().upper()
+
+    if block.representative is None:
+        data_block["representative"] = None
+    else:
+        data_block["representative"] = nano_account.account_id(block.representative)
+
+    if btype == nanodb_fast.BLOCK_TYPE_STATE:
+        data_block["link"] = block.link.hex().upper()
+        if block.is_send:
+            data_block["link_account"] = nano_account.account_id(block.link)
+        elif block.is_receive:
+            data_block["link_account"] = get_source_account(txn, block.link)
+        else:
+            data_block["link_account"] = None
+    elif btype == nanodb_fast.BLOCK_TYPE_SEND:
+        data_block["link"] = block.link.hex().upper()
+        data_block["link_account"] = nano_account.account_id(block.link)
+    elif btype == nanodb_fast.BLOCK_TYPE_RECEIVE:
+        data_block["link"] = block.link.hex().upper()
+        data_block["link_account"] = get_source_account(txn, block.link)
+    else:
+        data_block["link"] = None
+        data_block["link_account"] = None
+
+    data_block["signature"] = block.signature.hex().upper()
+    data_block["work"] = hex(block.work)[2:]
+
+    try:
+        height = get_confirmation_height(txn, block.account)
+    except Exception as ex:
+        print(ex)
+        height = 0
+
+    if data_block["height"] > 1:
+        previous_balance = get_previous_balance(txn, block.previous)
+
+        if previous_balance is None:
+            data_block["amount"] = None
+        else:
+            data_block["amount"] = abs(previous_balance - balance)
+    else:
+        data_block["amount"] = balance
+
+    data_block["confirmed"] = "1" if height >= data_block["height"] else "0"
+
+    return data_block
+
+
+def add_block_stats(block, data_block):
+    direction = block_stats.blocktype(int(data_block["type"]), data_block["subtype"])
+    if direction is None:
+        return
+    # A delta emits again the blocks exported unconfirmed, only the ones above
+    # the height of the last export are new to the stats
+    if state is not None and block.height <= state.get(block.account)[0]:
+        return
+    stats.add(
+        data_block["account"],
+        direction,
+        data_block["link_account"],
+        data_block["amount"] or 0,
+    )
+
+
+def get_block_rows(txn, items):
+    data_blocks = []
+    error_count = 0
+    for key, value in items:
+        try:
+            block = decode_block(value)
+        except Exception as ex:
+            print(ex)
+            continue
+
+        try:
+            data_block = get_block_row(txn, key, block)
+            data_blocks.append(data_block)
+            if stats is not None:
+                add_block_stats(block, data_block)
+        except Exception as ex:
+            print(ex)
+            error_count += 1
+    return data_blocks, error_count
+
+
+def export_blocks(txn, entries, load_blocks):
+    count = 0
+    error_count = 0
+    for items in pipeline.read_batches(entries, 10000, args.count):
+        data_blocks, errors = get_block_rows(txn, items)
+        load_blocks(data_blocks, items)
+        reader.add(len(items))
+        count += len(items)
+        error_count += errors
+        print("count: {} hashes".format(count), end="\r")
+    return count, error_count
+
+
+def put_batch(load, data, table, last_key, count):
+    """Queue a batch for the loaders, recorded by the checkpoint when there is one."""
+    tag = None
+    if progress is not None and count:
+        tag = table, last_key
+        progress.add(tag, count)
+    loaders.put(load, data, tag)
+
+
+def resume_entries(cursor, table):
+    """The cursor, moved after the checkpointed key when resuming table."""
+    if resume is None or resume[0] != table:
+        return cursor
+    if not checkpoint.seek_after(cursor, resume[1]):
+        return []
+    return cursor
+
+
+class DecoderTransaction(lmdb_shards.ReadTransaction):
+    def close(self):
+        # The stats of this decoder are merged by the main process
+        if stats is not None:
+            stats.spill()
+        super().close()
+
+
+def open_decoder():
+    global blocks_db, confirmation_db
+    env = lmdb_shards.open_env(filename)
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+    return DecoderTransaction(env)
+
+
+def decode_blocks(reader, items):
+    # Runs in a decoder process, the rows go straight to the loader queue
+    data_blocks, errors = get_block_rows(reader.txn, items)
+    if errors:
+        print("[{}] block(s) failed to decode".format(errors))
+        decode_errors.add(errors)
+    tag = None if progress is None else ("blocks", items[-1][0])
+    loaders.put(load_blocks, data_blocks, tag)
+    return len(items)
+
+
+def export_blocks_shard(shard, start, end):
+    global blocks_db, confirmation_db
+    env = lmdb_shards.open_env(filename)
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+
+    # Each shard loads its own batches over one connection
+    conn = connect()
+    with env.begin() as txn:
+        cursor = txn.cursor(blocks_db)
+        counts = export_blocks(
+            txn,
+            lmdb_shards.iter_range(cursor, start, end),
+            lambda data_blocks, items: load_blocks(conn, data_blocks),
+        )
+        cursor.close()
     conn.close()
+    env.close()
+    if stats is not None:
+        stats.spill()
+    return counts
 
 
 # Parse arguments
@@ -184,7 +584,139 @@ parser.add_argument(
     type=str,
     help="Start iterating at this exact key. This must be a byte array in hex representation.",
 )
+parser.add_argument(
+    "--decoder",
+    type=str,
+    default="struct",
+    choices=["struct", "kaitai"],
+    help="Decoder of the blocks, accounts and confirmation heights: fixed-offset struct layouts (fast) or the generated Kaitai classes.",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Scan the blocks table in this many key ranges in parallel, each worker loads its own rows.",
+)
+parser.add_argument(
+    "--load",
+    type=str,
+    default="copy",
+    choices=["copy", "insert"],
+    help="Load each batch with binary COPY into a staging table merged with one INSERT ... ON CONFLICT (fast), or with one INSERT per row.",
+)
+parser.add_argument(
+    "--loaders",
+    type=int,
+    default=multiprocessing.cpu_count(),
+    help="Number of loader processes, each keeps one database connection for the whole run.",
+)
+parser.add_argument(
+    "--queue-size",
+    type=int,
+    help="Number of 10000 row batches waiting for each stage before reading blocks, twice the number of its processes if omitted.",
+)
+parser.add_argument(
+    "--decoders",
+    type=int,
+    default=0,
+    help="Decode blocks in this many processes between the reader and the loaders. 0 decodes in the reading process.",
+)
+parser.add_argument(
+    "--report-interval",
+    type=float,
+    default=10,
+    help="Seconds between throughput and queue depth reports of the read, decode and load stages, 0 to disable.",
+)
+parser.add_argument(
+    "--amount",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Take the balance of the previous block from the ledger for each block (lookup) or from a hash to balance index built with one sequential scan first (index, about 24 bytes of memory per block, no random reads).",
+)
+parser.add_argument(
+    "--confirmation-height",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Read the confirmation height of the account of each block from the ledger (lookup) or from an account to height index loaded with one scan of the confirmation_height table first (index, about 16 bytes of memory per account).",
+)
+parser.add_argument(
+    "--link-account",
+    type=str,
+    default="lookup",
+    choices=["lookup", "index"],
+    help="Take the sending account of receive blocks (link_account) from the send block read from the ledger (lookup) or from a send hash to account index built with one sequential scan first (index, about 40 bytes of memory per send block, no random reads).",
+)
+parser.add_argument(
+    "--state",
+    type=str,
+    help="Incremental export: only the accounts changed since the run that saved this state file and their new blocks, then save the new state. A missing file exports everything and creates it.",
+)
+parser.add_argument(
+    "--checkpoint",
+    type=str,
+    default="lmdb-to-postgresql.checkpoint.json",
+    help="File recording the last lmdb key below which every batch is committed, with the entry and row totals. A failed batch holds it back, --resume exports it again. Saved every --checkpoint-interval seconds and removed once the export completes without errors.",
+)
+parser.add_argument(
+    "--checkpoint-interval",
+    type=float,
+    default=10,
+    help="Minimum number of seconds between two saves of the checkpoint file.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Restart after the key recorded in the --checkpoint file of an interrupted run instead of at the first key.",
+)
+parser.add_argument(
+    "--stats",
+    action="store_true",
+    help="Also count the blocks and sum the amounts per (source, destination, SEND or RECEIVE) while exporting and load account_stats and source_destination_stats at the end, instead of create-postgresql-stats-tables.py. A full export replaces them, a --state export adds its new blocks to them.",
+)
+parser.add_argument(
+    "--stats-groups",
+    type=int,
+    default=1000000,
+    help="Number of --stats groups each process holds in memory (about 300 bytes each) before spilling them sorted to a file in --spill-dir.",
+)
+parser.add_argument(
+    "--spill-dir",
+    type=str,
+    help="Directory of the --stats run files, the system temporary directory if omitted.",
+)
 args = parser.parse_args()
+if args.workers > 1 and (args.key or args.count != math.inf):
+    parser.error("--key and --count can not be combined with --workers")
+if args.workers > 1 and args.decoders:
+    parser.error("--decoders can not be combined with --workers")
+if args.state and (
+    args.table != "all" or args.workers > 1 or args.key or args.count != math.inf
+):
+    parser.error(
+        "--state exports all tables and can not be combined with --workers, --key or --count"
+    )
+if args.resume and (args.workers > 1 or args.state or args.key):
+    parser.error("--resume can not be combined with --workers, --state or --key")
+if args.stats and (
+    args.table not in ("all", "blocks")
+    or args.resume
+    or args.key
+    or args.count != math.inf
+):
+    parser.error(
+        "--stats needs all the blocks and can not be combined with --table accounts, --resume, --key or --count"
+    )
+
+if args.decoder == "kaitai":
+    decode_block = nanodb_fast.decode_block_kaitai
+    decode_confirmation_height = nanodb_fast.decode_confirmation_height_kaitai
+    decode_account_info = nanodb_fast.decode_account_info_kaitai
+else:
+    decode_block = nanodb_fast.decode_block
+    decode_confirmation_height = nanodb_fast.decode_confirmation_height
+    decode_account_info = nanodb_fast.decode_account_info
 
 
 try:
@@ -195,53 +727,119 @@ try:
     if not os.path.isfile(filename):
         raise Exception("Database doesn't exist")
 
-    env = lmdb.open(filename, subdir=False, readonly=True, lock=False, max_dbs=100)
-    num_cores = multiprocessing.cpu_count()
+    # Built before the stages are forked, the workers share them copy-on-write
+    block_balances = None
+    if args.amount == "index" and (args.table == "all" or args.table == "blocks"):
+        print("Indexing block balances")
+        block_balances = ledger_index.BalanceIndex.from_ledger(filename)
+        print("indexed: [{}] blocks".format(len(block_balances)))
+    confirmed_heights = None
+    if args.confirmation_height == "index" and (
+        args.table == "all" or args.table == "blocks"
+    ):
+        print("Indexing confirmation heights")
+        confirmed_heights = ledger_index.ConfirmationHeightIndex.from_ledger(filename)
+        print("indexed: [{}] accounts".format(len(confirmed_heights)))
+    source_accounts = None
+    if args.link_account == "index" and (args.table == "all" or args.table == "blocks"):
+        print("Indexing send accounts")
+        source_accounts = ledger_index.SourceAccountIndex.from_ledger(filename)
+        print("indexed: [{}] sends".format(len(source_accounts)))
+
     print("Disable Indexes for faster inserts")
     disableIndex()
+    delta = None
+    state = None
+    error_count = 0
+    if args.state:
+        state = lmdb_delta.ExportState.load(args.state)
+        delta = lmdb_delta.Delta.from_ledger(filename, state)
+        print(
+            "changed: [{}] of [{}] accounts since [{}]".format(
+                len(delta.accounts), len(delta.state), state.modified
+            )
+        )
+
+    # Batches are only checkpointed in read order from a single reader
+    progress = None
+    resume = None
+    if args.workers == 1 and delta is None:
+        if args.resume:
+            progress = checkpoint.Checkpoint.load(
+                args.checkpoint, args.checkpoint_interval
+            )
+            if progress is None:
+                print(
+                    "No checkpoint in [{}], starting at the first key".format(
+                        args.checkpoint
+                    )
+                )
+            else:
+                resume = progress.table, progress.key
+                print(
+                    "resuming: {} after [{}], [{}] entries exported before".format(
+                        progress.table, progress.key.hex().upper(), progress.count
+                    )
+                )
+        if progress is None:
+            progress = checkpoint.Checkpoint(args.checkpoint, args.checkpoint_interval)
+
+    stats = None
+    if args.stats:
+        spill_dir = tempfile.mkdtemp(prefix="stats-", dir=args.spill_dir)
+        stats = block_stats.StatsAggregate(spill_dir, args.stats_groups)
+
+    # The stages are forked before this process opens the environment, lmdb
+    # does not allow a child to use or reopen an environment open in its parent.
+    reader = pipeline.Counter("read")
+    # Rows the decoders failed to export, a failed batch is counted by the stage
+    decode_errors = pipeline.Counter("decode errors")
+    loaders = pipeline.Stage("load", connect, args.loaders, args.queue_size)
+    stages = [reader, loaders]
+    if args.decoders and (args.table == "all" or args.table == "blocks"):
+        decoders = pipeline.Stage(
+            "decode", open_decoder, args.decoders, args.queue_size
+        )
+        stages.insert(1, decoders)
+    if progress is not None:
+        progress.watch(loaders)
+    monitor = pipeline.Monitor(stages, args.report_interval)
+    if args.report_interval > 0:
+        monitor.start()
+
+    env = lmdb.open(filename, subdir=False, readonly=True, lock=False, max_dbs=100)
 
     # Accounts table
-    if args.table == "all" or args.table == "accounts":
+    if resume is not None and resume[0] == "blocks":
+        print("Accounts already exported, resuming at the blocks")
+    elif args.table == "all" or args.table == "accounts":
         print("Importing Accounts")
         accounts_db = env.open_db("accounts".encode())
         confirmation_db = env.open_db("confirmation_height".encode())
-        error_count = 0
         count = 0
         with env.begin() as txn:
             cursor = txn.cursor(accounts_db)
             if args.key:
                 cursor.set_key(bytearray.fromhex(args.key))
-            mem_cache = []
             tmp = []
+            key = None
+            batch_start = 0
 
-            for key, value in cursor:
+            entries = (
+                resume_entries(cursor, "accounts") if delta is None else delta.accounts
+            )
+            for key, value in entries:
                 try:
-                    keystream = KaitaiStream(io.BytesIO(key))
-                    valstream = KaitaiStream(io.BytesIO(value))
+                    account_info = decode_account_info(value)
 
-                    account_key = Nanodb.AccountsKey(keystream)
-                    account_info = Nanodb.AccountsValue(valstream)
+                    balance = int.from_bytes(account_info.balance, "big")
 
-                    balance = nanolib.blocks.parse_hex_balance(
-                        account_info.balance.hex().upper()
-                    )
-
-                    confirmation_value = txn.get(
-                        account_key.account, default=None, db=confirmation_db
-                    )
-                    confirmation_valstream = KaitaiStream(
-                        io.BytesIO(confirmation_value)
-                    )
-                    height_info = Nanodb.ConfirmationHeightValue(
-                        confirmation_valstream, None, Nanodb(None)
-                    )
+                    confirmation_value = txn.get(key, default=None, db=confirmation_db)
+                    height_info = decode_confirmation_height(confirmation_value)
 
                     data_account = (
                         # account
-                        nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=account_key.account.hex(),
-                        ),
+                        nano_account.account_id(key),
                         # frontier
                         account_info.head.hex().upper(),
                         # open_block
@@ -251,9 +849,7 @@ try:
                         # balance
                         balance,
                         # #modified_timestamp
-                        datetime.datetime.utcfromtimestamp(
-                            account_info.modified
-                        ).strftime("%s"),
+                        account_info.modified,
                         # #block_count
                         account_info.block_count,
                         # #confirmation_height
@@ -267,9 +863,7 @@ try:
                     print(ex)
                     error_count += 1
                 print(
-                    "count: {} acocunts ".format(
-                        count  # , account_key.account.hex().upper()
-                    ),
+                    "count: {} acocunts ".format(count),
                     end="\r",
                 )
                 count += 1
@@ -277,24 +871,16 @@ try:
                 if count >= args.count:
                     break
                 if count % 10000 == 0:
-                    mem_cache.append(tmp)
+                    put_batch(load_accounts, tmp, "accounts", key, count - batch_start)
                     tmp = []
-                if count % 500000 == 0:
-                    Parallel(n_jobs=num_cores)(
-                        delayed(processAccounts)(data_accounts)
-                        for data_accounts in mem_cache
-                    )
-                    mem_cache = []
+                    batch_start = count
             cursor.close()
 
-            # add the last batch of accounts to mysql
-            mem_cache.append(tmp)
-            Parallel(n_jobs=num_cores)(
-                delayed(processAccounts)(data_accounts) for data_accounts in mem_cache
-            )
+            # add the last batch of accounts
+            put_batch(load_accounts, tmp, "accounts", key, count - batch_start)
             print(
-                "exported: [{}] with [{}] error(s), last mysql batch size: [{}]".format(
-                    count, error_count, sum(len(x) for x in mem_cache)
+                "exported: [{}] with [{}] error(s), last batch size: [{}]".format(
+                    count, error_count, len(tmp)
                 )
             )
 
@@ -305,207 +891,108 @@ try:
     if args.table == "all" or args.table == "blocks":
 
         print("Importing State Blocks")
-        blocks_db = env.open_db("blocks".encode())
-        confirmation_db = env.open_db("confirmation_height".encode())
-
-        with env.begin() as txn:
-            cursor = txn.cursor(blocks_db)
-            if args.key:
-                cursor.set_key(bytearray.fromhex(args.key))
-
-            count = 0
-            error_count = 0
-            mem_cache = []
-            tmp = []
-            for key, value in cursor:
-                try:
-                    keystream = KaitaiStream(io.BytesIO(key))
-                    valstream = KaitaiStream(io.BytesIO(value))
-
-                    try:
-                        block_key = Nanodb.BlocksKey(keystream)
-                        block = Nanodb.BlocksValue(valstream, None, Nanodb(None))
-                    except Exception as ex:
-                        print(ex)
-                        continue
-
-                    btype = block.block_type
-
-                    if btype == Nanodb.EnumBlocktype.change:
-                        data_block = get_legacy_block(block.block_value)
-                        data_block["type"] = "5"
-                    elif btype == Nanodb.EnumBlocktype.send:
-                        data_block = get_legacy_block(block.block_value)
-                        data_block["type"] = "4"
-                    elif btype == Nanodb.EnumBlocktype.receive:
-                        data_block = get_legacy_block(block.block_value)
-                        data_block["type"] = "3"
-                    elif btype == Nanodb.EnumBlocktype.state:
-                        data_block = get_state_block(block.block_value)
-                        data_block["type"] = "1"
-                    elif btype == Nanodb.EnumBlocktype.open:
-                        data_block = get_legacy_block(block.block_value)
-                        data_block["type"] = "2"
-
-                    data_block["hash"] = block_key.hash.hex().upper()
-                    if (
-                        btype == Nanodb.EnumBlocktype.state
-                        or btype == Nanodb.EnumBlocktype.send
-                    ):
-                        balance = nanolib.blocks.parse_hex_balance(
-                            block.block_value.block.balance.hex().upper()
-                        )
-                    else:
-                        balance = nanolib.blocks.parse_hex_balance(
-                            block.block_value.sideband.balance.hex().upper()
-                        )
-
-                    data_block["balance"] = balance
-                    data_block["confirmed"] = "1"
-                    if (
-                        btype == Nanodb.EnumBlocktype.send
-                        or btype == Nanodb.EnumBlocktype.receive
-                        or btype == Nanodb.EnumBlocktype.change
-                    ):
-                        account = block.block_value.sideband.account
-                    else:
-                        account = block.block_value.block.account
-
-                    data_block["account"] = nanolib.accounts.get_account_id(
-                        prefix=nanolib.AccountIDPrefix.NANO, public_key=account.hex()
-                    )
-
-                    if btype == Nanodb.EnumBlocktype.open:
-                        data_block[
-                            "previous"
-                        ] = "0000000000000000000000000000000000000000000000000000000000000000"
-                    else:
-                        data_block[
-                            "previous"
-                        ] = block.block_value.block.previous.hex().upper()
-
-                    if (
-                        btype == Nanodb.EnumBlocktype.receive
-                        or btype == Nanodb.EnumBlocktype.send
-                    ):
-                        data_block["representative"] = None
-                    else:
-                        data_block["representative"] = nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=block.block_value.block.representative.hex(),
-                        )
-
-                    if btype == Nanodb.EnumBlocktype.state:
-                        data_block["link"] = block.block_value.block.link.hex().upper()
-                        data_block["link_account"] = None
-                        # TODO
-                    elif btype == Nanodb.EnumBlocktype.send:
-                        data_block[
-                            "link"
-                        ] = block.block_value.block.destination.hex().upper()
-                        data_block["link_account"] = nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=block.block_value.block.destination.hex(),
-                        )
-                    elif btype == Nanodb.EnumBlocktype.receive:
-                        data_block[
-                            "link"
-                        ] = block.block_value.block.source.hex().upper()
-                        data_block["link_account"] = None
-                        # TODO - use source has to get account
-                    else:
-                        data_block["link"] = None
-                        data_block["link_account"] = None
-
-                    data_block[
-                        "signature"
-                    ] = block.block_value.block.signature.hex().upper()
-                    data_block["work"] = hex(block.block_value.block.work)[2:]
-
-                    try:
-                        confirmation_value = txn.get(
-                            account, default=None, db=confirmation_db
-                        )
-                        confirmation_valstream = KaitaiStream(
-                            io.BytesIO(confirmation_value)
-                        )
-                        height_info = Nanodb.ConfirmationHeightValue(
-                            confirmation_valstream, None, Nanodb(None)
-                        )
-                        height = height_info.height
-                    except Exception as ex:
-                        print(ex)
-                        height = 0
-
-                    if data_block["height"] > 1:
-                        previous = txn.get(
-                            block.block_value.block.previous, default=None, db=blocks_db
-                        )
-                        previous_valstream = KaitaiStream(io.BytesIO(previous))
-                        previous_block = Nanodb.BlocksValue(
-                            previous_valstream, None, Nanodb(None)
-                        )
-                        ptype = previous_block.block_type
-                        if (
-                            ptype == Nanodb.EnumBlocktype.state
-                            or ptype == Nanodb.EnumBlocktype.send
-                        ):
-                            previous_balance = nanolib.blocks.parse_hex_balance(
-                                previous_block.block_value.block.balance.hex().upper()
-                            )
-                        else:
-                            previous_balance = nanolib.blocks.parse_hex_balance(
-                                previous_block.block_value.sideband.balance.hex().upper()
-                            )
-
-                        data_block["amount"] = str(
-                            abs(int(previous_balance) - int(balance))
-                        )
-                    else:
-                        data_block["amount"] = balance
-
-                    data_block["confirmed"] = (
-                        "1" if height >= data_block["height"] else "0"
-                    )
-
-                    tmp.append(data_block)
-                except Exception as ex:
-                    print(ex)
-                    error_count += 1
-                print(
-                    "count: {} hashes".format(
-                        count  # , block_key.hash.hex().upper()),
-                    ),
-                    end="\r",
+        if args.workers > 1:
+            # lmdb does not allow opening an environment twice in a process,
+            # the forked workers open their own and load their batches.
+            env.close()
+            counts = lmdb_shards.map_shards(export_blocks_shard, args.workers)
+            count = sum(shard_count for shard_count, _ in counts)
+            errors = sum(shard_errors for _, shard_errors in counts)
+            error_count += errors
+            print(
+                "exported: [{}] with [{}] error(s) in [{}] shards".format(
+                    count, errors, len(counts)
                 )
-
-                count += 1
-                if count >= args.count:
-                    break
-                if count % 10000 == 0:
-                    mem_cache.append(tmp)
-                    tmp = []
-                if count % 500000 == 0:
-                    Parallel(n_jobs=num_cores)(
-                        delayed(processBlocks)(data_blocks) for data_blocks in mem_cache
-                    )
-                    mem_cache = []
-
-            cursor.close()
-            mem_cache.append(tmp)
-            Parallel(n_jobs=num_cores)(
-                delayed(processBlocks)(data_blocks) for data_blocks in mem_cache
             )
+        elif args.decoders:
+            blocks_db = env.open_db("blocks".encode())
+
+            with env.begin() as txn:
+                cursor = txn.cursor(blocks_db)
+                if args.key:
+                    cursor.set_key(bytearray.fromhex(args.key))
+                entries = (
+                    resume_entries(cursor, "blocks")
+                    if delta is None
+                    else delta.blocks(txn, blocks_db)
+                )
+                for items in pipeline.read_batches(entries, 10000, args.count):
+                    if progress is not None:
+                        progress.add(("blocks", items[-1][0]), len(items))
+                    decoders.put(decode_blocks, items)
+                    reader.add(len(items))
+                cursor.close()
+            count, failed_batches = decoders.close()
+            error_count += decode_errors.rows.value + failed_batches
             print(
-                "exported: [{}] with [{}] error(s), last mysql batch size: [{}]".format(
-                    count, error_count, sum(len(x) for x in mem_cache)
+                "exported: [{}] with [{}] error(s), [{}] failed batch(es)".format(
+                    count, decode_errors.rows.value, failed_batches
                 )
             )
+        else:
+            blocks_db = env.open_db("blocks".encode())
+            confirmation_db = env.open_db("confirmation_height".encode())
+
+            with env.begin() as txn:
+                cursor = txn.cursor(blocks_db)
+                if args.key:
+                    cursor.set_key(bytearray.fromhex(args.key))
+                entries = (
+                    resume_entries(cursor, "blocks")
+                    if delta is None
+                    else delta.blocks(txn, blocks_db)
+                )
+                count, errors = export_blocks(
+                    txn,
+                    entries,
+                    lambda data_blocks, items: put_batch(
+                        load_blocks, data_blocks, "blocks", items[-1][0], len(items)
+                    ),
+                )
+                cursor.close()
+                error_count += errors
+                print("exported: [{}] with [{}] error(s)".format(count, errors))
 
         if count == 0:
             print("(empty)\n")
 
     env.close()
+    loaded, failed = loaders.close()
+    monitor.stop()
+    print("loaded: [{}] rows, [{}] failed batch(es)".format(loaded, failed))
+    if progress is not None:
+        progress.close()
+        if resume is not None:
+            print(
+                "since the first run: [{}] entries, [{}] rows".format(
+                    progress.count, progress.loaded
+                )
+            )
+        if failed or error_count:
+            print(
+                "Checkpoint kept in [{}], --resume exports the failed batches again".format(
+                    args.checkpoint
+                )
+            )
+        else:
+            progress.remove()
+    if stats is not None:
+        if failed or error_count:
+            print("Stats not loaded, some blocks failed to export")
+        else:
+            pairs, accounts = load_stats(replace=delta is None)
+            print(
+                "stats: [{}] source/destination and [{}] account rows".format(
+                    pairs, accounts
+                )
+            )
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    if delta is not None:
+        if failed or error_count:
+            print("State not saved, the next run exports these changes again")
+        else:
+            delta.state.save(args.state)
+            print("saved: [{}] accounts to [{}]".format(len(delta.state), args.state))
     print("Re-Enable Indexes")
     enableIndex()
 
@@ -1,32 +1,59 @@
+import argparse
 import decimal
 import os
 import json
 import mysql.connector
-import pandas as pd
 import pyarrow as pa
-import pyarrow.parquet as pq
 
-select_accounts = "SELECT * FROM accounts LIMIT {0} OFFSET {1}"
+import mysql_parquet
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--schema",
+    type=str,
+    default="hex",
+    choices=["hex", "binary"],
+    help="Store block hashes as uppercase hex strings or as fixed size binary.",
+)
+args = parser.parse_args()
+
+if args.schema == "binary":
+    hash_type = pa.binary(32)
+else:
+    hash_type = pa.string()
 
 fields = [
     pa.field("account", pa.string()),
-    pa.field("frontier", pa.string()),
-    pa.field("open_block", pa.string()),
-    pa.field("representative_block", pa.string()),
+    pa.field("frontier", hash_type),
+    pa.field("open_block", hash_type),
+    pa.field("representative_block", hash_type),
     pa.field("balance", pa.decimal128(38, 0)),
     pa.field("modified_timestamp", pa.int64()),
     pa.field("block_count", pa.int64()),
     pa.field("confirmation_height", pa.int64()),
-    pa.field("confirmation_height_frontier", pa.string()),
+    pa.field("confirmation_height_frontier", hash_type),
     pa.field("representative", pa.string()),
     pa.field("weight", pa.decimal128(38, 0)),
     pa.field("pending", pa.decimal128(38, 0)),
 ]
 schema = pa.schema(fields)
-filepath = os.path.join(os.path.dirname(__file__), "../output/accounts.parquet")
-offset = 0
+dirpath = os.path.join(os.path.dirname(__file__), "../output/accounts")
 batch_size = 10000
 
+converters = {
+    "balance": decimal.Decimal,
+    "weight": decimal.Decimal,
+    "pending": decimal.Decimal,
+}
+if args.schema == "binary":
+    for name in [
+        "frontier",
+        "open_block",
+        "representative_block",
+        "confirmation_height_frontier",
+    ]:
+        converters[name] = bytes.fromhex
+
 with open("config.json") as json_data_file:
     config = json.load(json_data_file)
 
@@ -37,39 +64,37 @@ cnx = mysql.connector.connect(
     password=mysql_config["password"],
     database=mysql_config["database"],
 )
-cursor = cnx.cursor(dictionary=True)
+cursor = cnx.cursor()
 
-# get current size of parquet file
-try:
-    t = pq.read_metadata(filepath)
-    offset = t.num_rows
-except Exception as ex:
-    print("Unable to read {}".format(filepath))
+# Accounts are updated in place and new ones fall anywhere in the account
+# order, so every run writes all of them to a part replacing the snapshot
+snapshot = mysql_parquet.Snapshot(dirpath)
+if snapshot.parts:
+    print(
+        "Replacing [{}] rows in [{}] part(s)".format(snapshot.rows, len(snapshot.parts))
+    )
 
 # query mysql
-cursor.execute(select_accounts.format(batch_size, offset))
-result = cursor.fetchall()
+pages = mysql_parquet.iter_pages(
+    cursor, "accounts", schema.names, "account", batch_size
+)
+result = next(pages, [])
 if not len(result):
-    print("No new rows to append")
+    print("No accounts to export")
     cursor.close()
     quit()
 
-pqwriter = pq.ParquetWriter(filepath, schema)
+part = snapshot.open_part(schema)
 
 while len(result):
-    print("writing {} rows to file".format(len(result)))
-    # write / append to file
-    df_raw = pd.DataFrame(result)
-    df_raw["balance"] = df_raw["balance"].apply(lambda x: decimal.Decimal(x))
-    df_raw["weight"] = df_raw["weight"].apply(lambda x: decimal.Decimal(x))
-    df_raw["pending"] = df_raw["pending"].apply(lambda x: decimal.Decimal(x))
-    table = pa.Table.from_pandas(df_raw, schema=schema, preserve_index=False)
-    pqwriter.write_table(table)
+    print("writing {} rows to {}".format(len(result), part.name))
+    table = mysql_parquet.rows_to_table(result, schema, converters)
+    # account is the first column
+    part.write(table, result[0][0], result[-1][0])
 
     # load next batch
-    offset = offset + batch_size
-    cursor.execute(select_accounts.format(batch_size, offset))
-    result = cursor.fetchall()
+    result = next(pages, [])
 
+part.commit(replace=True)
 print("Done")
 cursor.close()
@@ -1,15 +1,40 @@
+import argparse
 import decimal
 import os
 import json
 import mysql.connector
-import pandas as pd
 import pyarrow as pa
-import pyarrow.parquet as pq
+import pyarrow.dataset as ds
 
-select_blocks = "SELECT * FROM blocks WHERE confirmed = 1 LIMIT {0} OFFSET {1}"
+import mysql_parquet
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--schema",
+    type=str,
+    default="hex",
+    choices=["hex", "binary"],
+    help="Store hashes and signatures as uppercase hex strings or as fixed size binary (with work as uint64).",
+)
+parser.add_argument(
+    "--window",
+    type=int,
+    default=86400,
+    help="Read again the blocks of the WINDOW seconds of local_timestamp before the last one exported and append those not exported yet, which were confirmed or inserted late. Blocks confirmed or inserted more than WINDOW seconds after their local_timestamp are never exported, export to a new directory to include them.",
+)
+args = parser.parse_args()
+
+if args.schema == "binary":
+    hash_type = pa.binary(32)
+    signature_type = pa.binary(64)
+    work_type = pa.uint64()
+else:
+    hash_type = pa.string()
+    signature_type = pa.string()
+    work_type = pa.string()
 
 fields = [
-    pa.field("hash", pa.string()),
+    pa.field("hash", hash_type),
     pa.field("amount", pa.decimal128(38, 0)),
     pa.field("balance", pa.decimal128(38, 0)),
     pa.field("height", pa.int64()),
@@ -17,19 +42,28 @@ fields = [
     pa.field("confirmed", pa.bool_()),
     pa.field("type", pa.int8()),
     pa.field("account", pa.string()),
-    pa.field("previous", pa.string()),
+    pa.field("previous", hash_type),
     pa.field("representative", pa.string()),
-    pa.field("link", pa.string()),
+    pa.field("link", hash_type),
     pa.field("link_account", pa.string()),
-    pa.field("signature", pa.string()),
-    pa.field("work", pa.string()),
+    pa.field("signature", signature_type),
+    pa.field("work", work_type),
     pa.field("subtype", pa.int8()),
 ]
 schema = pa.schema(fields)
-filepath = os.path.join(os.path.dirname(__file__), "../output/blocks.parquet")
-offset = 0
+dirpath = os.path.join(os.path.dirname(__file__), "../output/blocks")
 batch_size = 10000
 
+converters = {
+    "amount": decimal.Decimal,
+    "balance": decimal.Decimal,
+    "confirmed": bool,
+}
+if args.schema == "binary":
+    for name in ["hash", "previous", "link", "signature"]:
+        converters[name] = bytes.fromhex
+    converters["work"] = lambda x: int(x, 16)
+
 with open("config.json") as json_data_file:
     config = json.load(json_data_file)
 
@@ -40,38 +74,51 @@ cnx = mysql.connector.connect(
     password=mysql_config["password"],
     database=mysql_config["database"],
 )
-cursor = cnx.cursor(dictionary=True)
+cursor = cnx.cursor()
 
-# get current size of parquet file
-try:
-    t = pq.read_metadata(filepath)
-    offset = t.num_rows
-except Exception as ex:
-    print("Unable to read {}".format(filepath))
+# Hashes are random, the parts are keyed on the insertion order of the blocks.
+# Blocks are confirmed, and sometimes inserted, after their local_timestamp,
+# so a run reads again the --window before the last (local_timestamp, hash)
+# exported and skips the hashes the snapshot already holds.
+key = ["local_timestamp", "hash"]
+snapshot = mysql_parquet.Snapshot(dirpath, key)
+where = "`confirmed` = 1"
+exported = set()
+if snapshot.parts:
+    print(
+        "Appending to [{}] rows in [{}] part(s)".format(
+            snapshot.rows, len(snapshot.parts)
+        )
+    )
+    start = int(snapshot.last_key[0]) - args.window
+    where += " AND `local_timestamp` >= {}".format(start)
+    for value in snapshot.column("hash", ds.field("local_timestamp") >= start):
+        exported.add(value.hex().upper() if isinstance(value, bytes) else value)
 
 # query mysql
-cursor.execute(select_blocks.format(batch_size, offset))
-result = cursor.fetchall()
-if not len(result):
-    print("No new rows to append")
-    cursor.close()
-    quit()
-
-pqwriter = pq.ParquetWriter(filepath, schema)
-
-while len(result):
-    print("writing {} rows to file".format(len(result)))
-    # write / append to file
-    df_raw = pd.DataFrame(result)
-    df_raw["balance"] = df_raw["balance"].apply(lambda x: decimal.Decimal(x))
-    df_raw["amount"] = df_raw["amount"].apply(lambda x: decimal.Decimal(x))
-    table = pa.Table.from_pandas(df_raw, schema=schema, preserve_index=False)
-    pqwriter.write_table(table)
+pages = mysql_parquet.iter_pages(
+    cursor, "blocks", schema.names, key, batch_size, where=where
+)
 
-    # load next batch
-    offset = offset + batch_size
-    cursor.execute(select_blocks.format(batch_size, offset))
-    result = cursor.fetchall()
+part = None
+for page in pages:
+    # hash is the first column
+    result = [row for row in page if row[0] not in exported]
+    if not result:
+        continue
+    if part is None:
+        part = snapshot.open_part(schema)
+    print("writing {} rows to {}".format(len(result), part.name))
+    table = mysql_parquet.rows_to_table(result, schema, converters)
+    part.write(
+        table,
+        mysql_parquet.row_key(result[0], schema.names, key),
+        mysql_parquet.row_key(result[-1], schema.names, key),
+    )
 
-print("Done")
+if part is None:
+    print("No new rows to append")
+else:
+    part.commit()
+    print("Done")
 cursor.close()
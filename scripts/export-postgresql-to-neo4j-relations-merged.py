@@ -1,10 +1,11 @@
+import argparse
 import decimal
 import os
 import json
 import psycopg2
-from py2neo import Graph, Node, Relationship
-from py2neo.bulk import create_relationships
-from py2neo.bulk import merge_nodes
+import sys
+from py2neo import Graph
+import neo4j_import
 import time
 
 
@@ -27,9 +28,38 @@ select_nodes_relations = (
 )
 
 
-def clear_tmp():
-    return {"RECEIVED_FROM": [], "SENT_TO": [], "CHANGED_REP": [], "UPGRADED_EPOCH": []}
-
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--sessions",
+    type=int,
+    default=4,
+    help="Number of Neo4j transactions running at the same time, each on its own part of the relationships.",
+)
+parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=10000,
+    help="Number of nodes or relationships written by one UNWIND transaction.",
+)
+parser.add_argument(
+    "--read-size",
+    type=int,
+    default=50000,
+    help="Number of stats rows read from PostgreSQL before their nodes and relationships are queued.",
+)
+parser.add_argument(
+    "--retries",
+    type=int,
+    default=5,
+    help="Number of times a transaction failing with a transient error (a deadlock) is retried.",
+)
+parser.add_argument(
+    "--report-interval",
+    type=float,
+    default=10,
+    help="Minimum number of seconds between two reports of the relationships per second, 0 to disable.",
+)
+args = parser.parse_args()
 
 with open("config.json") as json_data_file:
     config = json.load(json_data_file)
@@ -46,7 +76,7 @@ conn = psycopg2.connect(
 )
 conn.set_session(autocommit=False)
 postgresql_cursor = conn.cursor("sel_all_relations")
-postgresql_cursor.itersize = 50000
+postgresql_cursor.itersize = args.read_size
 
 
 t0 = time.time()
@@ -55,14 +85,6 @@ postgresql_cursor.execute(select_nodes_relations)
 # rows = postgresql_cursor.fetchall()
 print("Exec SQL finished for {} nodes".format(postgresql_cursor.rowcount))
 
-mem_relations = clear_tmp()
-mem_nodes = []
-node_keys = ["address", "open_block", "balance", "block_count"]
-
-count = 0
-t0 = time.time()
-t1 = time.time()
-
 neo4j_config = config["neo4j"]["connection"]
 g = Graph(
     "bolt://{}:{}".format(neo4j_config["host"], neo4j_config["port"]),
@@ -73,70 +95,72 @@ g = Graph(
 # An equivalent constraint already exists, 'Constraint( id=x, name='constraint_xxx', type='UNIQUENESS', schema=(:Account {address}), ownedIndex=x )
 g.schema.create_uniqueness_constraint("Account", "address")
 
+importer = neo4j_import.Importer(
+    lambda query, rows: g.evaluate(query, rows=rows),
+    args.sessions,
+    args.batch_size,
+    args.retries,
+)
+mem_nodes = []
+mem_relations = {rel: [] for rel in neo4j_import.relationship_types.values()}
+count = 0
+last_report = time.time()
+
 for row in postgresql_cursor:
+    rel = neo4j_import.relationship_types.get(row[10])
+    if rel is None:
+        print("SKIP {} REL {}".format(row[0], row[10]))
+        continue
+
     bal1 = int(row[2] or 0) / 1e30
     bal2 = int(row[6] or 0) / 1e30
-    mem_nodes.append([row[0], row[1], bal1, row[3]])
+    mem_nodes.append(
+        {
+            "address": row[0],
+            "open_block": row[1],
+            "balance": bal1,
+            "block_count": row[3],
+        }
+    )
     if (
-        row[4] != None
+        row[4] == None
     ):  # Special case for Genesis : initial funding without RECEIVED block (=destination account is empty)
-        mem_nodes.append([row[4], row[5], bal2, row[7]])
-    rel = ""
-
-    if row[10] == "SEND":
-        rel = "SENT_TO"
-    elif row[10] == "RECEIVE":
-        rel = "RECEIVED_FROM"
-    else:
-        print("SKIP {} REL {}".format(row[0], row[10]))
         continue
-
+    mem_nodes.append(
+        {
+            "address": row[4],
+            "open_block": row[5],
+            "balance": bal2,
+            "block_count": row[7],
+        }
+    )
     mem_relations[rel].append(
-        (
-            row[0],
-            {"interaction_count": row[8], "total_amount": int(row[9]) / 1e30},
-            row[4],
-        )
+        {
+            "source": row[0],
+            "destination": row[4],
+            "interaction_count": row[8],
+            "total_amount": int(row[9]) / 1e30,
+        }
     )
 
-    if count % 1000 == 0:
-        print(
-            "count: {} relations ".format(count),
-            end="\r",
-        )
     count += 1
-    if count % 50000 == 0:
-        # create nodes
-        merge_nodes(g.auto(), mem_nodes, ("Account", "address"), keys=node_keys)
+    if count % args.read_size == 0:
+        importer.add(mem_nodes, mem_relations)
         mem_nodes = []
-        for batch_key in mem_relations.keys():
-            # create relations
-            try:
-                create_relationships(
-                    g.auto(),
-                    mem_relations[batch_key],
-                    batch_key,
-                    start_node_key=("Account", "address"),
-                    end_node_key=("Account", "address"),
-                )
-            except Exception as ex:
-                print(ex)
-            print(".", end="")
-        mem_relations = clear_tmp()
-        t1 = time.time()
-
-# create nodes
-merge_nodes(g.auto(), mem_nodes, ("Account", "address"), keys=node_keys)
-for batch_key in mem_relations.keys():
-    try:
-        create_relationships(
-            g.auto(),
-            mem_relations[batch_key],
-            batch_key,
-            start_node_key=("Account", "address"),
-            end_node_key=("Account", "address"),
-        )
-    except Exception as ex:
-        print(ex)
-
-print("Exported Everything in {} seconds".format(t1 - t0))
+        mem_relations = {rel: [] for rel in mem_relations}
+        if (
+            args.report_interval > 0
+            and time.time() - last_report >= args.report_interval
+        ):
+            print(importer.report())
+            last_report = time.time()
+
+importer.add(mem_nodes, mem_relations)
+importer.close()
+print("total: " + importer.report())
+if importer.held:
+    print("[{}] relationship(s) not written, their nodes failed".format(importer.held))
+
+print("Exported Everything in {} seconds".format(time.time() - t0))
+if importer.errors:
+    sys.exit(1)
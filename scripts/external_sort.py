@@ -0,0 +1,152 @@
+# External sort of Arrow tables with bounded memory. Tables are collected
+# until run_rows rows, sorted and spilled to an Arrow IPC file; close() merges
+# the sorted runs into the output writer. The merge holds one batch per run:
+# it takes the smallest of the last keys of the current batches as a cutoff,
+# every row up to the cutoff can be written, and refills the run(s) whose
+# batch is used up. Rows are only compared with Arrow compute kernels.
+#
+#   writer = SortedWriter(pq.ParquetWriter(path, schema), ["account", "height"])
+
+import os
+import shutil
+import tempfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def sort_table(table, keys):
+    return table.take(
+        pc.sort_indices(table, sort_keys=[(key, "ascending") for key in keys])
+    )
+
+
+def rows_up_to(table, keys, cutoff):
+    """Number of leading rows of a sorted table with keys <= the cutoff tuple."""
+    mask = None
+    for key, value in reversed(list(zip(keys, cutoff))):
+        column = table.column(key)
+        if mask is None:
+            mask = pc.less_equal(column, value)
+        else:
+            mask = pc.or_(
+                pc.less(column, value), pc.and_(pc.equal(column, value), mask)
+            )
+    return pc.sum(mask).as_py() or 0
+
+
+class Run:
+    """Sorted run spilled to an Arrow IPC file, read back one batch at a time."""
+
+    def __init__(self, path):
+        self.reader = pa.ipc.open_file(pa.memory_map(path))
+        self.next_batch = 0
+        self.table = None
+        self.load()
+
+    def load(self):
+        """Move on to the next batch, False when the run is exhausted."""
+        if self.next_batch == self.reader.num_record_batches:
+            self.table = None
+            return False
+        batch = self.reader.get_batch(self.next_batch)
+        self.next_batch += 1
+        self.table = pa.Table.from_batches([batch])
+        return True
+
+
+class SortedWriter:
+    """Write tables to writer sorted by keys, using spill files for large inputs.
+
+    `writer` is anything with write_table(table, row_group_size=None) and
+    close(), like a pq.ParquetWriter. At most run_rows rows are held before
+    they are spilled to spill_dir (a temporary directory by default) and the
+    output is written in tables of row_group_size rows.
+    """
+
+    def __init__(
+        self,
+        writer,
+        keys,
+        run_rows=1000000,
+        spill_dir=None,
+        batch_rows=65536,
+        row_group_size=None,
+    ):
+        self.writer = writer
+        self.keys = keys
+        self.run_rows = run_rows
+        self.batch_rows = batch_rows
+        self.row_group_size = row_group_size or run_rows
+        self.spill_dir = tempfile.mkdtemp(prefix="sort-", dir=spill_dir)
+        self.tables = []
+        self.rows = 0
+        self.runs = []
+
+    def write_table(self, table, row_group_size=None):
+        """Add a table; row_group_size is ignored, the output is written at close."""
+        self.tables.append(table)
+        self.rows += table.num_rows
+        if self.rows >= self.run_rows:
+            self.spill()
+
+    def spill(self):
+        if not self.rows:
+            return
+        table = sort_table(pa.concat_tables(self.tables), self.keys)
+        path = os.path.join(self.spill_dir, "run-{:05}.arrow".format(len(self.runs)))
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as spill_writer:
+                spill_writer.write_table(table, max_chunksize=self.batch_rows)
+        self.runs.append(path)
+        self.tables = []
+        self.rows = 0
+
+    def close(self):
+        try:
+            if not self.runs:
+                # Everything fits in one run, no need to go through the disk
+                if self.rows:
+                    self._write(sort_table(pa.concat_tables(self.tables), self.keys))
+            else:
+                self.spill()
+                self.merge()
+            self.writer.close()
+        finally:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _write(self, table):
+        for offset in range(0, table.num_rows, self.row_group_size):
+            self.writer.write_table(
+                table.slice(offset, self.row_group_size),
+                row_group_size=self.row_group_size,
+            )
+
+    def merge(self):
+        runs = [Run(path) for path in self.runs]
+        runs = [run for run in runs if run.table is not None]
+        pending = []
+        pending_rows = 0
+        while runs:
+            cutoff = min(
+                tuple(run.table.column(key)[-1].as_py() for key in self.keys)
+                for run in runs
+            )
+            parts = []
+            for run in runs:
+                count = rows_up_to(run.table, self.keys, cutoff)
+                if count:
+                    parts.append(run.table.slice(0, count))
+                    run.table = run.table.slice(count)
+            runs = [run for run in runs if run.table.num_rows or run.load()]
+            merged = sort_table(pa.concat_tables(parts), self.keys)
+            pending.append(merged)
+            pending_rows += merged.num_rows
+            if pending_rows >= self.row_group_size:
+                table = pa.concat_tables(pending)
+                full = pending_rows - pending_rows % self.row_group_size
+                self._write(table.slice(0, full))
+                pending = [table.slice(full)]
+                pending_rows -= full
+        if pending_rows:
+            self._write(pa.concat_tables(pending))
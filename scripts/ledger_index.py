@@ -0,0 +1,185 @@
+# In-memory indexes of lmdb tables keyed by 32 byte hashes or accounts, used
+# by the exporters instead of a random read and decode per block:
+#
+#   BalanceIndex             block hash -> balance (block amounts)
+#   ConfirmationHeightIndex  account -> confirmation height (confirmed flag)
+#   SourceAccountIndex       send block hash -> account (link_account of receives)
+#
+# Each index is built with one sequential scan and kept as NumPy columns
+# sorted by the first 8 bytes of the key, 8 bytes per entry plus its values.
+# Prefixes shared by more than one key are marked ambiguous and reported as
+# not found, the caller then falls back to reading the table.
+
+import numpy as np
+
+import lmdb_shards
+import nanodb_batch
+import pipeline
+
+
+def _prefixes(keys):
+    return np.ascontiguousarray(keys[:, :8]).view(">u8").ravel().astype(np.uint64)
+
+
+def _keys(items):
+    return np.frombuffer(b"".join(key for key, _ in items), np.uint8).reshape(-1, 32)
+
+
+class PrefixIndex:
+    """Value columns searchable by a 32 byte key.
+
+    Subclasses name their columns in `dtypes`, the lmdb table they index in
+    `table` and implement `decode(items)`, returning the (n, 32) key column
+    and a dict of value columns for (key, value) pairs of the table.
+    """
+
+    table = None
+    dtypes = {}
+
+    def __init__(self, prefixes, columns):
+        if len(prefixes) and np.any(prefixes[1:] < prefixes[:-1]):
+            order = np.argsort(prefixes, kind="stable")
+            prefixes = prefixes[order]
+            columns = {name: column[order] for name, column in columns.items()}
+        self.prefixes = prefixes
+        self.columns = columns
+        self.ambiguous = np.zeros(len(prefixes), np.bool_)
+        shared = prefixes[1:] == prefixes[:-1]
+        self.ambiguous[1:] |= shared
+        self.ambiguous[:-1] |= shared
+
+    @classmethod
+    def from_entries(cls, entries, batch_size=100000):
+        """Index (key, value) pairs of the table."""
+        prefixes = [np.zeros(0, np.uint64)]
+        chunks = {name: [np.zeros(0, dtype)] for name, dtype in cls.dtypes.items()}
+        for items in pipeline.read_batches(entries, batch_size):
+            keys, columns = cls.decode(items)
+            prefixes.append(_prefixes(keys))
+            for name, column in columns.items():
+                chunks[name].append(column)
+        return cls(
+            np.concatenate(prefixes),
+            {name: np.concatenate(chunk) for name, chunk in chunks.items()},
+        )
+
+    @classmethod
+    def from_ledger(cls, filename, batch_size=100000):
+        """Index the table of a ledger file with one sequential scan."""
+        env = lmdb_shards.open_env(filename)
+        db = env.open_db(cls.table.encode())
+        with env.begin() as txn:
+            cursor = txn.cursor(db)
+            index = cls.from_entries(cursor, batch_size)
+            cursor.close()
+        env.close()
+        return index
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    def find(self, keys):
+        """Value columns for a (n, 32) uint8 key column and the found mask.
+
+        Rows not found (missing or ambiguous prefix) are zero.
+        """
+        found = np.zeros(len(keys), np.bool_)
+        values = {
+            name: np.zeros(len(keys), dtype) for name, dtype in self.dtypes.items()
+        }
+        if not len(self):
+            return values, found
+        search = _prefixes(keys)
+        positions = np.minimum(np.searchsorted(self.prefixes, search), len(self) - 1)
+        found = (self.prefixes[positions] == search) & ~self.ambiguous[positions]
+        for name, column in self.columns.items():
+            values[name][found] = column[positions[found]]
+        return values, found
+
+    def position(self, key):
+        """Row of one key, None when it has to be read from the table."""
+        search = np.uint64(int.from_bytes(key[:8], "big"))
+        position = int(self.prefixes.searchsorted(search))
+        if (
+            position == len(self.prefixes)
+            or self.prefixes[position] != search
+            or self.ambiguous[position]
+        ):
+            return None
+        return position
+
+
+class BalanceIndex(PrefixIndex):
+    """Block hash -> balance, as (high, low) uint64 columns."""
+
+    table = "blocks"
+    dtypes = {"high": np.uint64, "low": np.uint64}
+
+    @staticmethod
+    def decode(items):
+        hashes, balance = nanodb_batch.decode_balance_columns(items)
+        high, low = nanodb_batch.balance_parts(balance)
+        return hashes, {"high": high, "low": low}
+
+    def lookup(self, hashes):
+        """Balances for a (n, 32) uint8 hash column as (high, low, found)."""
+        values, found = self.find(hashes)
+        return values["high"], values["low"], found
+
+    def get(self, block_hash):
+        """Balance of one block as an int, None when it has to be read from the ledger."""
+        position = self.position(block_hash)
+        if position is None:
+            return None
+        high, low = self.columns["high"], self.columns["low"]
+        return int(high[position]) << 64 | int(low[position])
+
+
+class ConfirmationHeightIndex(PrefixIndex):
+    """Account -> confirmation height."""
+
+    table = "confirmation_height"
+    dtypes = {"height": np.uint64}
+
+    @staticmethod
+    def decode(items):
+        # Values are the little endian height followed by the frontier hash
+        heights = np.frombuffer(b"".join(value[:8] for _, value in items), "<u8")
+        return _keys(items), {"height": heights.astype(np.uint64)}
+
+    def lookup(self, accounts):
+        """Heights for a (n, 32) uint8 account column as (heights, found)."""
+        values, found = self.find(accounts)
+        return values["height"], found
+
+    def get(self, account):
+        """Height of one account as an int, None when it has to be read from the ledger."""
+        position = self.position(account)
+        if position is None:
+            return None
+        return int(self.columns["height"][position])
+
+
+class SourceAccountIndex(PrefixIndex):
+    """Send block hash -> sending account, only send blocks are indexed."""
+
+    table = "blocks"
+    dtypes = {"account": np.dtype((np.uint8, 32))}
+
+    @staticmethod
+    def decode(items):
+        columns = nanodb_batch.decode_block_columns(items)
+        sends = nanodb_batch.is_send(columns)
+        return columns["hash"][sends], {"account": columns["account"][sends]}
+
+    def lookup(self, hashes):
+        """Accounts for a (n, 32) uint8 hash column as ((n, 32) accounts, found)."""
+        values, found = self.find(hashes)
+        return values["account"], found
+
+    def get(self, block_hash):
+        """Account of one send block, None when it has to be read from the ledger."""
+        position = self.position(block_hash)
+        if position is None:
+            return None
+        return self.columns["account"][position].tobytes()
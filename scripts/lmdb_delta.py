@@ -0,0 +1,138 @@
+# Incremental export of the lmdb tables. An ExportState saved by the last run
+# holds the highest accounts.modified seen (the watermark) and, per account,
+# the height exported and its confirmation height at that time. A Delta scans
+# the accounts table once against it and keeps the accounts that changed;
+# their new blocks are found by walking each chain back from its head with
+# `previous` down to the stored height, so only those blocks are read.
+#
+# Blocks above the stored confirmation height were exported unconfirmed, they
+# are emitted again once the account's confirmation height has passed them.
+
+import os
+
+import numpy as np
+
+import lmdb_shards
+import nanodb_fast
+
+
+class ExportState:
+    """Watermark and per account heights of the last export, sorted by account."""
+
+    def __init__(self, modified=0, accounts=None, heights=None, confirmed=None):
+        self.modified = modified
+        self.accounts = np.zeros((0, 32), np.uint8) if accounts is None else accounts
+        self.heights = np.zeros(0, np.uint64) if heights is None else heights
+        self.confirmed = np.zeros(0, np.uint64) if confirmed is None else confirmed
+        self._keys = np.ascontiguousarray(self.accounts).view("S32").ravel()
+
+    @classmethod
+    def load(cls, path):
+        """State saved at path, an empty state (export everything) if there is none."""
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            return cls(
+                int(data["modified"]),
+                data["accounts"],
+                data["heights"],
+                data["confirmed"],
+            )
+
+    def save(self, path):
+        # Replace the file only once it is complete, a failed run keeps the old one
+        with open(path + ".tmp", "wb") as state_file:
+            np.savez(
+                state_file,
+                modified=np.uint64(self.modified),
+                accounts=self.accounts,
+                heights=self.heights,
+                confirmed=self.confirmed,
+            )
+        os.replace(path + ".tmp", path)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def get(self, account):
+        """(exported height, confirmation height) of an account, (0, 0) if new."""
+        position = int(self._keys.searchsorted(np.bytes_(account)))
+        if position == len(self) or self.accounts[position].tobytes() != account:
+            return 0, 0
+        return int(self.heights[position]), int(self.confirmed[position])
+
+
+class Delta:
+    """Accounts changed since an ExportState and the chains to walk for them.
+
+    `accounts` holds the (key, value) pairs of the changed accounts, `state`
+    the ExportState to save once they are exported.
+    """
+
+    def __init__(self, txn, accounts_db, confirmation_db, state):
+        self.accounts = []
+        self.walks = []
+        keys, heights, confirmed = [], [], []
+        modified = state.modified
+        for key, value in txn.cursor(accounts_db):
+            info = nanodb_fast.decode_account_info(value)
+            confirmation_value = txn.get(key, default=None, db=confirmation_db)
+            if confirmation_value is None:
+                height = 0
+            else:
+                height = nanodb_fast.decode_confirmation_height(
+                    confirmation_value
+                ).height
+            exported, exported_confirmed = state.get(key)
+            newly_confirmed = (
+                height > exported_confirmed and exported > exported_confirmed
+            )
+            if (
+                info.modified > state.modified
+                or info.block_count != exported
+                or newly_confirmed
+            ):
+                self.accounts.append((key, value))
+                bound = exported
+                if newly_confirmed:
+                    bound = min(bound, exported_confirmed)
+                # The chain got shorter (rolled back), export all of it again
+                if info.block_count < bound:
+                    bound = 0
+                self.walks.append((info.head, bound))
+            keys.append(key)
+            heights.append(info.block_count)
+            confirmed.append(height)
+            modified = max(modified, info.modified)
+        self.state = ExportState(
+            modified,
+            np.frombuffer(b"".join(keys), np.uint8).reshape(-1, 32),
+            np.array(heights, np.uint64),
+            np.array(confirmed, np.uint64),
+        )
+
+    @classmethod
+    def from_ledger(cls, filename, state):
+        env = lmdb_shards.open_env(filename)
+        accounts_db = env.open_db("accounts".encode())
+        confirmation_db = env.open_db("confirmation_height".encode())
+        with env.begin() as txn:
+            delta = cls(txn, accounts_db, confirmation_db, state)
+        env.close()
+        return delta
+
+    def blocks(self, txn, blocks_db):
+        """Yield the (key, value) pairs of the blocks above each walk's bound."""
+        for head, bound in self.walks:
+            block_hash = head
+            while True:
+                value = txn.get(block_hash, default=None, db=blocks_db)
+                if value is None:
+                    break
+                block = nanodb_fast.decode_block(value)
+                if block.height <= bound:
+                    break
+                yield block_hash, value
+                if block.height == 1:
+                    break
+                block_hash = block.previous
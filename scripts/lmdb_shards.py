@@ -0,0 +1,74 @@
+# Key range sharding for parallel scans of the lmdb tables. Block hashes are
+# uniformly distributed, so splitting the keyspace on the two leading bytes
+# gives ranges holding about the same number of blocks. Each worker process
+# opens its own read-only environment and scans one range with set_range.
+
+import multiprocessing
+
+import lmdb
+
+PREFIX_SPACE = 1 << 16
+
+
+def key_ranges(workers):
+    """Split the keyspace into `workers` (start, end) ranges.
+
+    `start` is inclusive and `end` exclusive; the first start and the last
+    end are None, meaning the beginning and the end of the table.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    bounds = [
+        (PREFIX_SPACE * shard // workers).to_bytes(2, "big")
+        for shard in range(1, workers)
+    ]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def iter_range(cursor, start=None, end=None):
+    """Yield the (key, value) pairs of a cursor with start <= key < end."""
+    if start is None:
+        positioned = cursor.first()
+    else:
+        positioned = cursor.set_range(start)
+    if not positioned:
+        return
+    for key, value in cursor:
+        if end is not None and key >= end:
+            return
+        yield key, value
+
+
+def open_env(filename):
+    # The scripts open the environment of a node snapshot, nothing writes to
+    # it while exporting so the lock table is not needed.
+    return lmdb.open(filename, subdir=False, readonly=True, lock=False, max_dbs=100)
+
+
+def map_shards(function, workers):
+    """Call function(shard, start, end) for each key range in its own process.
+
+    The exporters are plain scripts without a __main__ guard, so the workers
+    are forked and inherit the parsed arguments instead of re-running them.
+    """
+    ranges = key_ranges(workers)
+    context = multiprocessing.get_context("fork")
+    with context.Pool(workers) as pool:
+        return pool.starmap(
+            function, [(shard, start, end) for shard, (start, end) in enumerate(ranges)]
+        )
+
+
+class ReadTransaction:
+    """A read transaction kept open for the life of a worker process.
+
+    Closing it aborts the transaction and closes its environment.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.txn = env.begin()
+
+    def close(self):
+        self.txn.abort()
+        self.env.close()
@@ -0,0 +1,194 @@
+# Paged reads of MySQL tables for the export-mysql-to-parquet scripts. Pages
+# are selected by key (WHERE key > last ORDER BY key LIMIT n) on a unique
+# index, so each page is one index range scan and the export is linear in the
+# size of the table, where OFFSET pages scan every skipped row again. Rows are
+# fetched as tuples and each column is built into an Arrow array directly.
+#
+# A key is one column or a tuple of columns compared as a row, e.g.
+# (local_timestamp, hash) pages in insertion order, which an index on
+# local_timestamp serves.
+#
+# The output is a Snapshot directory of part files, a run appends one part
+# with the rows after the last key exported:
+#
+#   output/blocks/_manifest.json
+#   output/blocks/part-00000.parquet
+#   output/blocks/part-00001.parquet
+#
+#   pyarrow.dataset.dataset("output/blocks", format="parquet").to_table()
+
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+MANIFEST = "_manifest.json"
+
+
+def key_columns(key):
+    return (key,) if isinstance(key, str) else tuple(key)
+
+
+def select_page(table, columns, key, where=None, first=False):
+    """SELECT of one page of columns ordered by key, after a key value unless first."""
+    key = key_columns(key)
+    names = ", ".join("`{}`".format(column) for column in key)
+    conditions = [] if where is None else [where]
+    if not first:
+        if len(key) == 1:
+            conditions.append("{} > %s".format(names))
+        else:
+            conditions.append("({}) > ({})".format(names, ", ".join(["%s"] * len(key))))
+    return "SELECT {} FROM `{}`{} ORDER BY {} LIMIT %s".format(
+        ", ".join("`{}`".format(column) for column in columns),
+        table,
+        " WHERE " + " AND ".join(conditions) if conditions else "",
+        names,
+    )
+
+
+def row_key(row, columns, key):
+    """Key value of a row tuple, a tuple for a key of several columns."""
+    if isinstance(key, str):
+        return row[columns.index(key)]
+    return tuple(row[columns.index(column)] for column in key)
+
+
+def iter_pages(cursor, table, columns, key, batch_size, after=None, where=None):
+    """Yield lists of row tuples ordered by key, starting after the key value after."""
+    while True:
+        if after is None:
+            cursor.execute(
+                select_page(table, columns, key, where, first=True), (batch_size,)
+            )
+        else:
+            after_values = (after,) if isinstance(key, str) else tuple(after)
+            cursor.execute(
+                select_page(table, columns, key, where), after_values + (batch_size,)
+            )
+        rows = cursor.fetchall()
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = row_key(rows[-1], columns, key)
+
+
+def rows_to_table(rows, schema, converters=None):
+    """pa.Table of row tuples holding the schema columns in order.
+
+    `converters` maps a column name to a function applied to its non null
+    values before the column is built.
+    """
+    converters = converters or {}
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        convert = converters.get(field.name)
+        if convert is not None:
+            values = [None if value is None else convert(value) for value in values]
+        arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class Snapshot:
+    """Directory dataset of numbered part files and a manifest of their key ranges.
+
+    Every run appends a part holding the rows after the last key in the
+    manifest, earlier parts are never rewritten. Appending only finds the new
+    rows when key grows with every insert; a run can also read again a range
+    before the last key and leave out the rows already in `column`. A part
+    committed with replace instead becomes the only part of the snapshot. A part is renamed into
+    place before it is added to the manifest; a part left out of the manifest
+    (by a run that died in between) gets overwritten by the next one. Readers
+    open the directory with pyarrow.dataset, which skips the _manifest.json
+    file.
+    """
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = None if key is None else list(key_columns(key))
+        self.parts = []
+        manifest = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as manifest_file:
+                saved = json.load(manifest_file)
+            self.parts = saved["parts"]
+            if self.key is not None and self.parts and saved.get("key") != self.key:
+                raise ValueError(
+                    "{} is keyed on {}, not {}: export to a new directory".format(
+                        path, saved.get("key"), self.key
+                    )
+                )
+
+    @property
+    def last_key(self):
+        # Parts of rows found late end before the parts written earlier
+        return max(part["last_key"] for part in self.parts) if self.parts else None
+
+    @property
+    def rows(self):
+        return sum(part["rows"] for part in self.parts)
+
+    def column(self, name, filter=None):
+        """Values of a column in the committed parts, with an optional dataset filter."""
+        if not self.parts:
+            return []
+        dataset = ds.dataset(
+            [os.path.join(self.path, part["file"]) for part in self.parts],
+            format="parquet",
+        )
+        return dataset.to_table(columns=[name], filter=filter).column(0).to_pylist()
+
+    def open_part(self, schema):
+        os.makedirs(self.path, exist_ok=True)
+        # Numbered after the last part, which is not len(parts) after a replace
+        number = int(self.parts[-1]["file"][5:10]) + 1 if self.parts else 0
+        return Part(self, "part-{:05}.parquet".format(number), schema)
+
+    def add(self, part, replace=False):
+        replaced = self.parts if replace else []
+        if replace:
+            self.parts = []
+        self.parts.append(
+            {
+                "file": part.name,
+                "rows": part.rows,
+                "first_key": part.first_key,
+                "last_key": part.last_key,
+            }
+        )
+        manifest = os.path.join(self.path, MANIFEST)
+        with open(manifest + ".tmp", "w") as manifest_file:
+            json.dump({"key": self.key, "parts": self.parts}, manifest_file, indent=1)
+        os.replace(manifest + ".tmp", manifest)
+        for old in replaced:
+            os.remove(os.path.join(self.path, old["file"]))
+
+
+class Part:
+    """Part file of a Snapshot, written under a hidden name until committed."""
+
+    def __init__(self, snapshot, name, schema):
+        self.snapshot = snapshot
+        self.name = name
+        self.temp_path = os.path.join(snapshot.path, "." + name)
+        self.writer = pq.ParquetWriter(self.temp_path, schema)
+        self.rows = 0
+        self.first_key = None
+        self.last_key = None
+
+    def write(self, table, first_key, last_key):
+        """Write a table holding the rows from first_key to last_key."""
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+        if self.first_key is None:
+            self.first_key = first_key
+        self.last_key = last_key
+
+    def commit(self, replace=False):
+        """Add the part to the snapshot, as its only part with replace."""
+        self.writer.close()
+        os.replace(self.temp_path, os.path.join(self.snapshot.path, self.name))
+        self.snapshot.add(self, replace)
@@ -0,0 +1,329 @@
+# Columnar decoder for batches of raw blocks table entries. Values of the same
+# block type have a fixed size, so each type is decoded with a single
+# np.frombuffer call and the columns are handed to Arrow without building a
+# Python object per row.
+
+import numpy as np
+import pyarrow as pa
+
+import nano_account
+import nanodb_fast
+
+# Raw balances are unsigned 128 bit integers (up to 39 digits), which is more
+# than decimal128 can hold.
+BALANCE_TYPE = pa.decimal256(39, 0)
+
+_dtypes = {
+    nanodb_fast.BLOCK_TYPE_SEND: np.dtype(
+        [
+            ("block_type", "u1"),
+            ("previous", "u1", 32),
+            ("link", "u1", 32),
+            ("balance", "u1", 16),
+            ("signature", "u1", 64),
+            ("work", "<u8"),
+            ("successor", "u1", 32),
+            ("account", "u1", 32),
+            ("height", ">u8"),
+            ("timestamp", ">u8"),
+        ]
+    ),
+    nanodb_fast.BLOCK_TYPE_RECEIVE: np.dtype(
+        [
+            ("block_type", "u1"),
+            ("previous", "u1", 32),
+            ("link", "u1", 32),
+            ("signature", "u1", 64),
+            ("work", "<u8"),
+            ("successor", "u1", 32),
+            ("account", "u1", 32),
+            ("height", ">u8"),
+            ("balance", "u1", 16),
+            ("timestamp", ">u8"),
+        ]
+    ),
+    nanodb_fast.BLOCK_TYPE_OPEN: np.dtype(
+        [
+            ("block_type", "u1"),
+            ("link", "u1", 32),
+            ("representative", "u1", 32),
+            ("account", "u1", 32),
+            ("signature", "u1", 64),
+            ("work", "<u8"),
+            ("successor", "u1", 32),
+            ("balance", "u1", 16),
+            ("timestamp", ">u8"),
+        ]
+    ),
+    nanodb_fast.BLOCK_TYPE_CHANGE: np.dtype(
+        [
+            ("block_type", "u1"),
+            ("previous", "u1", 32),
+            ("representative", "u1", 32),
+            ("signature", "u1", 64),
+            ("work", "<u8"),
+            ("successor", "u1", 32),
+            ("account", "u1", 32),
+            ("height", ">u8"),
+            ("balance", "u1", 16),
+            ("timestamp", ">u8"),
+        ]
+    ),
+    nanodb_fast.BLOCK_TYPE_STATE: np.dtype(
+        [
+            ("block_type", "u1"),
+            ("account", "u1", 32),
+            ("previous", "u1", 32),
+            ("representative", "u1", 32),
+            ("balance", "u1", 16),
+            ("link", "u1", 32),
+            ("signature", "u1", 64),
+            ("work", ">u8"),
+            ("successor", "u1", 32),
+            ("height", ">u8"),
+            ("timestamp", ">u8"),
+            ("flags", "u1"),
+        ]
+    ),
+}
+
+_widths = {
+    "hash": 32,
+    "account": 32,
+    "previous": 32,
+    "representative": 32,
+    "balance": 16,
+    "link": 32,
+    "signature": 64,
+    "successor": 32,
+}
+
+# Fields that only some block types carry. Missing previous (open blocks) is
+# left as zeros, the others become nulls.
+_nullable = ("representative", "link")
+
+_hex_digits = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+
+
+def decode_block_columns(items):
+    """Decode (key, value) pairs of the blocks table into a dict of NumPy columns.
+
+    Binary fields are (n, width) uint8 arrays, `balance` is the raw 16 byte
+    big endian value, `<field>_valid` masks mark the rows carrying
+    representative and link, and `subtype` is 0 for legacy blocks.
+    """
+    count = len(items)
+    keys = [key for key, _ in items]
+    values = [value for _, value in items]
+    columns = {
+        name: np.zeros((count, width), np.uint8) for name, width in _widths.items()
+    }
+    columns["hash"][:] = np.frombuffer(b"".join(keys), np.uint8).reshape(count, 32)
+    columns["block_type"] = np.zeros(count, np.uint8)
+    columns["work"] = np.zeros(count, np.uint64)
+    columns["height"] = np.ones(count, np.uint64)
+    columns["timestamp"] = np.zeros(count, np.uint64)
+    columns["flags"] = np.zeros(count, np.uint8)
+    for name in _nullable:
+        columns[name + "_valid"] = np.zeros(count, np.bool_)
+
+    block_types = np.fromiter((value[0] for value in values), np.uint8, count)
+    for block_type in np.unique(block_types):
+        try:
+            dtype = _dtypes[block_type]
+        except KeyError:
+            raise ValueError("unsupported block type {}".format(block_type))
+        rows = np.flatnonzero(block_types == block_type)
+        data = b"".join(values[row][: dtype.itemsize] for row in rows)
+        records = np.frombuffer(data, dtype)
+        for name in dtype.names:
+            columns[name][rows] = records[name]
+        for name in _nullable:
+            if name in dtype.names:
+                columns[name + "_valid"][rows] = True
+
+    columns["subtype"] = block_subtypes(columns)
+    return columns
+
+
+def decode_balance_columns(items):
+    """Hash and raw balance columns of (key, value) pairs, nothing else is decoded."""
+    count = len(items)
+    values = [value for _, value in items]
+    hashes = np.frombuffer(b"".join(key for key, _ in items), np.uint8).reshape(
+        count, 32
+    )
+    balance = np.zeros((count, 16), np.uint8)
+    block_types = np.fromiter((value[0] for value in values), np.uint8, count)
+    for block_type in np.unique(block_types):
+        try:
+            dtype = _dtypes[block_type]
+        except KeyError:
+            raise ValueError("unsupported block type {}".format(block_type))
+        rows = np.flatnonzero(block_types == block_type)
+        data = b"".join(values[row][: dtype.itemsize] for row in rows)
+        balance[rows] = np.frombuffer(data, dtype)["balance"]
+    return hashes, balance
+
+
+def block_subtypes(columns):
+    flags = columns["flags"]
+    is_send = flags & 0x80 != 0
+    is_receive = flags & 0x40 != 0
+    is_epoch = flags & 0x20 != 0
+    subtype = np.select(
+        [
+            is_receive & (columns["height"] == 1),
+            is_receive,
+            is_send,
+            is_epoch,
+        ],
+        [1, 2, 3, 5],
+        4,
+    ).astype(np.int8)
+    subtype[columns["block_type"] != nanodb_fast.BLOCK_TYPE_STATE] = 0
+    return subtype
+
+
+def is_send(columns):
+    """Mask of legacy send blocks and state blocks flagged as sends."""
+    state = columns["block_type"] == nanodb_fast.BLOCK_TYPE_STATE
+    return (columns["block_type"] == nanodb_fast.BLOCK_TYPE_SEND) | (
+        state & (columns["flags"] & 0x80 != 0)
+    )
+
+
+def is_receive(columns):
+    """Mask of legacy receive blocks and state blocks flagged as receives (or opens).
+
+    Their link is the hash of the send block they receive. Legacy open
+    blocks are left out, their source is not exported as link.
+    """
+    state = columns["block_type"] == nanodb_fast.BLOCK_TYPE_STATE
+    return (columns["block_type"] == nanodb_fast.BLOCK_TYPE_RECEIVE) | (
+        state & (columns["flags"] & 0x40 != 0)
+    )
+
+
+def balance_parts(balance):
+    """Split raw 16 byte big endian balances into (high, low) uint64 columns."""
+    parts = np.ascontiguousarray(balance).view(">u8")
+    return parts[:, 0].astype(np.uint64), parts[:, 1].astype(np.uint64)
+
+
+def absolute_difference(a, b):
+    """|a - b| for balances given as (high, low) uint64 column pairs."""
+    a_high, a_low = a
+    b_high, b_low = b
+    swap = (a_high < b_high) | ((a_high == b_high) & (a_low < b_low))
+    high = np.where(swap, b_high, a_high)
+    low = np.where(swap, b_low, a_low)
+    sub_high = np.where(swap, a_high, b_high)
+    sub_low = np.where(swap, a_low, b_low)
+    borrow = (low < sub_low).astype(np.uint64)
+    return high - sub_high - borrow, low - sub_low
+
+
+def _validity(valid):
+    if valid is None or valid.all():
+        return None, 0
+    return pa.py_buffer(np.packbits(valid, bitorder="little")), int((~valid).sum())
+
+
+def fixed_size_binary_array(raw, valid=None):
+    validity, null_count = _validity(valid)
+    return pa.Array.from_buffers(
+        pa.binary(raw.shape[1]),
+        len(raw),
+        [validity, pa.py_buffer(np.ascontiguousarray(raw))],
+        null_count,
+    )
+
+
+def hex_string_array(raw, valid=None):
+    """Uppercase hex strings for a (n, width) uint8 column."""
+    count, width = raw.shape
+    digits = np.empty((count, width * 2), np.uint8)
+    digits[:, 0::2] = _hex_digits[raw >> 4]
+    digits[:, 1::2] = _hex_digits[raw & 0x0F]
+    offsets = np.arange(count + 1, dtype=np.int32) * (width * 2)
+    validity, null_count = _validity(valid)
+    return pa.Array.from_buffers(
+        pa.string(),
+        count,
+        [validity, pa.py_buffer(offsets), pa.py_buffer(digits)],
+        null_count,
+    )
+
+
+def unique_rows(raw):
+    """Distinct rows of a (n, width) uint8 column and the index of each row."""
+    rows = np.ascontiguousarray(raw).view(np.dtype((np.void, raw.shape[1])))
+    unique, inverse = np.unique(rows.ravel(), return_inverse=True)
+    return [row.tobytes() for row in unique], inverse.ravel()
+
+
+def account_id_array(raw, valid=None):
+    """nano_ addresses for a (n, 32) uint8 column of public keys."""
+    count = len(raw)
+    chars = nano_account.account_id_chars(raw)
+    offsets = np.arange(count + 1, dtype=np.int32) * nano_account.ADDRESS_LENGTH
+    validity, null_count = _validity(valid)
+    return pa.Array.from_buffers(
+        pa.string(),
+        count,
+        [validity, pa.py_buffer(offsets), pa.py_buffer(chars)],
+        null_count,
+    )
+
+
+def balance_array(parts, valid=None):
+    """Arrow decimal column from (high, low) uint64 balance columns."""
+    high, low = parts
+    data = np.zeros((len(high), 4), "<u8")
+    data[:, 0] = low
+    data[:, 1] = high
+    validity, null_count = _validity(valid)
+    return pa.Array.from_buffers(
+        BALANCE_TYPE, len(high), [validity, pa.py_buffer(data)], null_count
+    )
+
+
+def decode_blocks(items):
+    """Decode (key, value) pairs of the blocks table into a pa.RecordBatch."""
+    columns = decode_block_columns(items)
+    is_state = columns["block_type"] == nanodb_fast.BLOCK_TYPE_STATE
+    return pa.RecordBatch.from_arrays(
+        [
+            fixed_size_binary_array(columns["hash"]),
+            pa.array(columns["block_type"], pa.uint8()),
+            pa.array(columns["subtype"], pa.int8(), mask=~is_state),
+            fixed_size_binary_array(columns["account"]),
+            fixed_size_binary_array(columns["previous"]),
+            fixed_size_binary_array(
+                columns["representative"], columns["representative_valid"]
+            ),
+            balance_array(balance_parts(columns["balance"])),
+            fixed_size_binary_array(columns["link"], columns["link_valid"]),
+            fixed_size_binary_array(columns["signature"]),
+            pa.array(columns["work"], pa.uint64()),
+            fixed_size_binary_array(columns["successor"]),
+            pa.array(columns["height"], pa.uint64()),
+            pa.array(columns["timestamp"], pa.uint64()),
+        ],
+        [
+            "hash",
+            "block_type",
+            "subtype",
+            "account",
+            "previous",
+            "representative",
+            "balance",
+            "link",
+            "signature",
+            "work",
+            "successor",
+            "height",
+            "local_timestamp",
+        ],
+    )
@@ -0,0 +1,344 @@
+# Fixed-offset decoder for the lmdb tables used by the exporters. Produces the
+# same values as the generated Kaitai classes in nanodb.py without building a
+# tree of stream objects per record.
+
+import io
+import struct
+from collections import namedtuple
+
+from nanodb import Nanodb
+from kaitaistruct import KaitaiStream
+
+BLOCK_TYPE_SEND = Nanodb.EnumBlocktype.send.value
+BLOCK_TYPE_RECEIVE = Nanodb.EnumBlocktype.receive.value
+BLOCK_TYPE_OPEN = Nanodb.EnumBlocktype.open.value
+BLOCK_TYPE_CHANGE = Nanodb.EnumBlocktype.change.value
+BLOCK_TYPE_STATE = Nanodb.EnumBlocktype.state.value
+
+# Flattened blocks value. Fields that do not exist for a block type are None:
+# `link` holds the destination (send) or source (receive/open) hash of legacy
+# blocks, `account` and `balance` are taken from the sideband when the block
+# itself does not carry them and `height` is 1 for legacy open blocks.
+Block = namedtuple(
+    "Block",
+    [
+        "block_type",
+        "account",
+        "previous",
+        "representative",
+        "balance",
+        "link",
+        "signature",
+        "work",
+        "successor",
+        "height",
+        "timestamp",
+        "is_send",
+        "is_receive",
+        "is_epoch",
+        "epoch",
+    ],
+)
+
+ConfirmationHeight = namedtuple("ConfirmationHeight", ["height", "frontier"])
+
+AccountInfo = namedtuple(
+    "AccountInfo",
+    ["head", "representative", "open_block", "balance", "modified", "block_count"],
+)
+
+# Legacy block bodies store work little endian, sidebands and state blocks
+# are big endian.
+_send_block = struct.Struct("<32s32s16s64sQ")
+_send_sideband = struct.Struct(">32s32sQQ")
+_receive_block = struct.Struct("<32s32s64sQ")
+_receive_sideband = struct.Struct(">32s32sQ16sQ")
+_open_block = struct.Struct("<32s32s32s64sQ")
+_open_sideband = struct.Struct(">32s16sQ")
+_change_block = struct.Struct("<32s32s64sQ")
+_change_sideband = struct.Struct(">32s32sQ16sQ")
+_state_block = struct.Struct(">32s32s32s16s32s64sQ")
+_state_sideband = struct.Struct(">32sQQB")
+
+_confirmation_height = struct.Struct("<Q32s")
+_account_info = struct.Struct("<32s32s32s16sQQ")
+
+
+def _decode_send(value):
+    previous, destination, balance, signature, work = _send_block.unpack_from(value, 1)
+    successor, account, height, timestamp = _send_sideband.unpack_from(
+        value, 1 + _send_block.size
+    )
+    return Block(
+        BLOCK_TYPE_SEND,
+        account,
+        previous,
+        None,
+        balance,
+        destination,
+        signature,
+        work,
+        successor,
+        height,
+        timestamp,
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def _decode_receive(value):
+    previous, source, signature, work = _receive_block.unpack_from(value, 1)
+    successor, account, height, balance, timestamp = _receive_sideband.unpack_from(
+        value, 1 + _receive_block.size
+    )
+    return Block(
+        BLOCK_TYPE_RECEIVE,
+        account,
+        previous,
+        None,
+        balance,
+        source,
+        signature,
+        work,
+        successor,
+        height,
+        timestamp,
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def _decode_open(value):
+    source, representative, account, signature, work = _open_block.unpack_from(value, 1)
+    successor, balance, timestamp = _open_sideband.unpack_from(
+        value, 1 + _open_block.size
+    )
+    return Block(
+        BLOCK_TYPE_OPEN,
+        account,
+        None,
+        representative,
+        balance,
+        source,
+        signature,
+        work,
+        successor,
+        1,
+        timestamp,
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def _decode_change(value):
+    previous, representative, signature, work = _change_block.unpack_from(value, 1)
+    successor, account, height, balance, timestamp = _change_sideband.unpack_from(
+        value, 1 + _change_block.size
+    )
+    return Block(
+        BLOCK_TYPE_CHANGE,
+        account,
+        previous,
+        representative,
+        balance,
+        None,
+        signature,
+        work,
+        successor,
+        height,
+        timestamp,
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def _decode_state(value):
+    (
+        account,
+        previous,
+        representative,
+        balance,
+        link,
+        signature,
+        work,
+    ) = _state_block.unpack_from(value, 1)
+    successor, height, timestamp, flags = _state_sideband.unpack_from(
+        value, 1 + _state_block.size
+    )
+    return Block(
+        BLOCK_TYPE_STATE,
+        account,
+        previous,
+        representative,
+        balance,
+        link,
+        signature,
+        work,
+        successor,
+        height,
+        timestamp,
+        flags & 0x80 != 0,
+        flags & 0x40 != 0,
+        flags & 0x20 != 0,
+        flags & 0x1F,
+    )
+
+
+_decoders = {
+    BLOCK_TYPE_SEND: _decode_send,
+    BLOCK_TYPE_RECEIVE: _decode_receive,
+    BLOCK_TYPE_OPEN: _decode_open,
+    BLOCK_TYPE_CHANGE: _decode_change,
+    BLOCK_TYPE_STATE: _decode_state,
+}
+
+
+def decode_block(value):
+    """Decode a raw value of the blocks table into a Block."""
+    try:
+        decoder = _decoders[value[0]]
+    except KeyError:
+        raise ValueError("unsupported block type {}".format(value[0]))
+    return decoder(value)
+
+
+def decode_confirmation_height(value):
+    return ConfirmationHeight._make(_confirmation_height.unpack_from(value))
+
+
+def decode_account_info(value):
+    return AccountInfo._make(_account_info.unpack_from(value))
+
+
+def block_from_kaitai(blocks_value):
+    """Flatten a Nanodb.BlocksValue into the Block produced by decode_block."""
+    btype = blocks_value.block_type
+    if getattr(btype, "value", btype) not in _decoders:
+        raise ValueError("unsupported block type {}".format(btype))
+    block = blocks_value.block_value.block
+    sideband = blocks_value.block_value.sideband
+
+    if btype == Nanodb.EnumBlocktype.state:
+        return Block(
+            btype.value,
+            block.account,
+            block.previous,
+            block.representative,
+            block.balance,
+            block.link,
+            block.signature,
+            block.work,
+            sideband.successor,
+            sideband.height,
+            sideband.timestamp,
+            sideband.is_send,
+            sideband.is_receive,
+            sideband.is_epoch,
+            getattr(sideband.epoch, "value", sideband.epoch),
+        )
+    if btype == Nanodb.EnumBlocktype.send:
+        return Block(
+            btype.value,
+            sideband.account,
+            block.previous,
+            None,
+            block.balance,
+            block.destination,
+            block.signature,
+            block.work,
+            sideband.successor,
+            sideband.height,
+            sideband.timestamp,
+            None,
+            None,
+            None,
+            None,
+        )
+    if btype == Nanodb.EnumBlocktype.receive:
+        return Block(
+            btype.value,
+            sideband.account,
+            block.previous,
+            None,
+            sideband.balance,
+            block.source,
+            block.signature,
+            block.work,
+            sideband.successor,
+            sideband.height,
+            sideband.timestamp,
+            None,
+            None,
+            None,
+            None,
+        )
+    if btype == Nanodb.EnumBlocktype.open:
+        return Block(
+            btype.value,
+            block.account,
+            None,
+            block.representative,
+            sideband.balance,
+            block.source,
+            block.signature,
+            block.work,
+            sideband.successor,
+            1,
+            sideband.timestamp,
+            None,
+            None,
+            None,
+            None,
+        )
+    return Block(
+        btype.value,
+        sideband.account,
+        block.previous,
+        block.representative,
+        sideband.balance,
+        None,
+        block.signature,
+        block.work,
+        sideband.successor,
+        sideband.height,
+        sideband.timestamp,
+        None,
+        None,
+        None,
+        None,
+    )
+
+
+def decode_block_kaitai(value):
+    """Decode a raw value of the blocks table with the generated Kaitai classes."""
+    blocks_value = Nanodb.BlocksValue(
+        KaitaiStream(io.BytesIO(value)), None, Nanodb(None)
+    )
+    return block_from_kaitai(blocks_value)
+
+
+def decode_confirmation_height_kaitai(value):
+    height_info = Nanodb.ConfirmationHeightValue(
+        KaitaiStream(io.BytesIO(value)), None, Nanodb(None)
+    )
+    return ConfirmationHeight(height_info.height, height_info.frontier)
+
+
+def decode_account_info_kaitai(value):
+    account_info = Nanodb.AccountsValue(KaitaiStream(io.BytesIO(value)))
+    return AccountInfo(
+        account_info.head,
+        account_info.representative,
+        account_info.open_block,
+        account_info.balance,
+        account_info.modified,
+        account_info.block_count,
+    )
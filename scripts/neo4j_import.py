@@ -0,0 +1,172 @@
+# Concurrent import of Account nodes and their relationships into Neo4j.
+# Rows are written with parameterized `UNWIND $rows ...` statements of
+# batch_size rows, each in its own transaction, by a pool of `sessions`
+# threads. Nodes are deduplicated with a set of the addresses already sent
+# (about 100 bytes per account). The nodes of a batch are merged before its
+# relationships are queued, so the MATCH of both ends always finds them;
+# the relationships of a batch are split between the threads and run
+# while the next batches are read. The nodes of a failed transaction are
+# sent again with the next batch and the relationships ending on them are
+# held back until they are written.
+#
+# Concurrent transactions creating relationships on the same nodes can
+# deadlock, Neo4j then fails one of them with a transient error and it is
+# retried after a random backoff.
+
+import concurrent.futures
+import random
+import threading
+import time
+
+# blocktype of the source_destination_stats rows
+relationship_types = {"SEND": "SENT_TO", "RECEIVE": "RECEIVED_FROM"}
+
+merge_accounts = (
+    "UNWIND $rows AS row "
+    "MERGE (a:Account {address: row.address}) "
+    "SET a.open_block = row.open_block, a.balance = row.balance, "
+    "a.block_count = row.block_count "
+    "RETURN count(a)"
+)
+
+# The type of a relationship can not be a parameter
+create_relationships = (
+    "UNWIND $rows AS row "
+    "MATCH (s:Account {{address: row.source}}) "
+    "MATCH (d:Account {{address: row.destination}}) "
+    "CREATE (s)-[r:{}]->(d) "
+    "SET r.interaction_count = row.interaction_count, r.total_amount = row.total_amount "
+    "RETURN count(r)"
+)
+
+
+def is_transient(ex):
+    """Whether a Neo4j error is transient (a deadlock) and worth retrying."""
+    code = str(getattr(ex, "code", None) or "")
+    return code.startswith("Neo.TransientError") or any(
+        cls.__name__ == "TransientError" for cls in type(ex).__mro__
+    )
+
+
+def chunks(rows, size):
+    for offset in range(0, len(rows), size):
+        yield rows[offset : offset + size]
+
+
+class Importer:
+    """Write nodes and relationships with run(query, rows) on a thread pool.
+
+    run must be thread safe and return the count of the query, like py2neo's
+    Graph.evaluate with rows as the $rows parameter. A transaction still
+    failing after retries is printed and counted in `errors`, relationships
+    never written because their nodes failed are counted in `held`.
+    """
+
+    def __init__(self, run, sessions=4, batch_size=10000, retries=5, retry_wait=0.1):
+        self.run = run
+        self.sessions = sessions
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_wait = retry_wait
+        self.executor = concurrent.futures.ThreadPoolExecutor(sessions)
+        self.seen = set()
+        self.pending = []
+        self.held_nodes = []
+        self.held_relationships = {}
+        self.lock = threading.Lock()
+        self.nodes = 0
+        self.relationships = 0
+        self.retried = 0
+        self.errors = 0
+        self.held = 0
+        self.started = time.perf_counter()
+
+    def _write(self, query, rows):
+        """Count written by the query, None when it failed."""
+        for attempt in range(self.retries + 1):
+            try:
+                return self.run(query, rows) or 0
+            except Exception as ex:
+                if attempt == self.retries or not is_transient(ex):
+                    print(ex)
+                    with self.lock:
+                        self.errors += 1
+                    return None
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.retry_wait * 2**attempt * random.uniform(0.5, 1.5))
+
+    def _write_relationships(self, query, rows):
+        written = self._write(query, rows)
+        with self.lock:
+            self.relationships += written or 0
+
+    def add(self, nodes, relationships):
+        """Queue a batch: node dicts and {type: relationship dicts}.
+
+        Blocks until the new nodes are written and while more than twice
+        `sessions` relationship transactions are waiting.
+        """
+        new = []
+        for node in self.held_nodes + nodes:
+            if node["address"] not in self.seen:
+                self.seen.add(node["address"])
+                new.append(node)
+        node_futures = [
+            (rows, self.executor.submit(self._write, merge_accounts, rows))
+            for rows in chunks(new, self.batch_size)
+        ]
+        self.held_nodes = []
+        failed = set()
+        for rows, future in node_futures:
+            written = future.result()
+            if written is None:
+                # Sent again with the next batch
+                self.seen.difference_update(node["address"] for node in rows)
+                self.held_nodes += rows
+                failed.update(node["address"] for node in rows)
+            else:
+                self.nodes += written
+
+        held, self.held_relationships = self.held_relationships, {}
+        for relationship_type in {**held, **relationships}:
+            rows = []
+            waiting = []
+            for row in held.get(relationship_type, []) + relationships.get(
+                relationship_type, []
+            ):
+                if row["source"] in failed or row["destination"] in failed:
+                    waiting.append(row)
+                else:
+                    rows.append(row)
+            if waiting:
+                self.held_relationships[relationship_type] = waiting
+            query = create_relationships.format(relationship_type)
+            # Split so that every thread gets a part of a large batch
+            size = max(1, min(self.batch_size, -(-len(rows) // self.sessions)))
+            for part in chunks(rows, size):
+                self.pending.append(
+                    self.executor.submit(self._write_relationships, query, part)
+                )
+        while len(self.pending) > 2 * self.sessions:
+            self.pending.pop(0).result()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        return "relationships: [{}] at [{:.0f}]/s, nodes: [{}], retried: [{}], failed: [{}] transaction(s)".format(
+            self.relationships,
+            self.relationships / max(elapsed, 1e-9),
+            self.nodes,
+            self.retried,
+            self.errors,
+        )
+
+    def close(self):
+        """Retry the held nodes, wait for the queued transactions and stop the threads."""
+        if self.held_nodes:
+            self.add([], {})
+        self.held = sum(len(rows) for rows in self.held_relationships.values())
+        for future in self.pending:
+            future.result()
+        self.pending = []
+        self.executor.shutdown()
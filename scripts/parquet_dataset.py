@@ -0,0 +1,111 @@
+# Hive partitioned parquet datasets of the blocks table. Rows are partitioned
+# by the UTC day of local_timestamp and/or (sub)type, so a query for one day or
+# one type only reads the files under its directories:
+#
+#   blocks/day=2021-03-04/type=1/part-0-0.parquet
+#
+#   pyarrow.dataset.dataset("blocks", format="parquet", partitioning="hive")
+#
+# Every batch is sorted by its partition columns and local_timestamp (or the
+# sort_by columns) before it is written, so the row group statistics of
+# local_timestamp stay narrow.
+
+import queue
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+PARTITION_COLUMNS = ("day", "type", "subtype")
+
+
+def add_day(table):
+    """Table with a date32 day column for the UTC day of local_timestamp."""
+    days = table.column("local_timestamp").to_numpy() // 86400
+    return table.append_column("day", pa.array(days.astype(np.int32)).cast(pa.date32()))
+
+
+class DatasetWriter:
+    """Write tables into a partitioned dataset with pyarrow.dataset.write_dataset.
+
+    write_dataset consumes an iterator of batches, so it runs in a thread fed
+    by write_table and the writer can be used like a pq.ParquetWriter. Files
+    are named after basename_template ("{i}" is the file counter); existing
+    files with other names are left alone, so runs with different templates
+    add to the same dataset. row_group_size is both the number of rows
+    buffered per partition before a row group is written and the largest row
+    group.
+    """
+
+    def __init__(
+        self,
+        base_dir,
+        schema,
+        partition_by,
+        basename_template,
+        row_group_size=None,
+        compression="snappy",
+        compression_level=None,
+        sort_by=("local_timestamp",),
+    ):
+        self.partition_by = list(partition_by)
+        if "day" in self.partition_by:
+            schema = schema.append(pa.field("day", pa.date32()))
+        self.schema = schema
+        self.sort_keys = [
+            (name, "ascending") for name in self.partition_by + list(sort_by)
+        ]
+        self.queue = queue.Queue(maxsize=2)
+        self.error = None
+        options = dict(
+            basename_template=basename_template,
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([schema.field(name) for name in self.partition_by]),
+                flavor="hive",
+            ),
+            schema=schema,
+            file_options=ds.ParquetFileFormat().make_write_options(
+                compression=compression, compression_level=compression_level
+            ),
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        if row_group_size:
+            options["min_rows_per_group"] = row_group_size
+            options["max_rows_per_group"] = row_group_size
+        self.thread = threading.Thread(
+            target=self._write, args=(base_dir, options), daemon=True
+        )
+        self.thread.start()
+
+    def _batches(self):
+        while True:
+            table = self.queue.get()
+            if table is None:
+                return
+            yield from table.to_batches()
+
+    def _write(self, base_dir, options):
+        try:
+            ds.write_dataset(self._batches(), base_dir, **options)
+        except Exception as ex:
+            self.error = ex
+            # Keep taking tables so write_table and close don't block
+            while self.queue.get() is not None:
+                pass
+
+    def write_table(self, table, row_group_size=None):
+        """Queue a table; row_group_size is ignored, it is set for the dataset."""
+        if self.error is not None:
+            raise self.error
+        if "day" in self.partition_by:
+            table = add_day(table)
+        self.queue.put(table.take(pc.sort_indices(table, sort_keys=self.sort_keys)))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,74 @@
+# Read parquet files written with --schema binary and render the fixed size
+# binary columns (hashes, keys, signatures) as uppercase hex strings. Columns
+# are converted one record batch at a time, only when they are read.
+#
+#   python parquet_hex.py blocks.parquet --columns hash,previous,work --limit 10
+
+import argparse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import nanodb_batch
+
+
+def hex_column(array):
+    """Uppercase hex strings for a fixed size binary array, other arrays as is."""
+    if not pa.types.is_fixed_size_binary(array.type):
+        return array
+    if isinstance(array, pa.ChunkedArray):
+        return pa.chunked_array(
+            [hex_column(chunk) for chunk in array.chunks], pa.string()
+        )
+
+    width = array.type.byte_width
+    data = np.frombuffer(array.buffers()[1], np.uint8)
+    raw = data[array.offset * width : (array.offset + len(array)) * width]
+    valid = None
+    if array.null_count:
+        valid = array.is_valid().to_numpy(zero_copy_only=False)
+    return nanodb_batch.hex_string_array(raw.reshape(len(array), width), valid)
+
+
+def hex_view(data):
+    """Copy of a pa.Table or pa.RecordBatch with binary columns rendered as hex."""
+    columns = [hex_column(column) for column in data.columns]
+    if isinstance(data, pa.RecordBatch):
+        return pa.RecordBatch.from_arrays(columns, data.schema.names)
+    return pa.Table.from_arrays(columns, data.schema.names)
+
+
+def iter_hex_batches(path, columns=None, batch_size=65536):
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield hex_view(batch)
+
+
+def read_hex(path, columns=None):
+    return hex_view(pq.read_table(path, columns=columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", type=str, help="Path to the parquet file")
+    parser.add_argument(
+        "--columns",
+        type=str,
+        help="Comma separated list of columns to read, all columns if omitted.",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=10, help="Number of rows to display"
+    )
+    args = parser.parse_args()
+
+    columns = args.columns.split(",") if args.columns else None
+    remaining = args.limit
+    for batch in iter_hex_batches(
+        args.filename, columns=columns, batch_size=min(args.limit, 65536)
+    ):
+        for row in batch.slice(0, remaining).to_pylist():
+            print(row)
+        remaining -= min(remaining, batch.num_rows)
+        if remaining <= 0:
+            break
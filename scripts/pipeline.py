@@ -0,0 +1,199 @@
+# Pipeline stages for the lmdb exporters. A Stage is a pool of forked worker
+# processes fed through a bounded queue. Each worker calls setup() once (to
+# open a database connection, a parquet writer or an lmdb transaction) and
+# then function(state, data) for every batch, so setup is paid once per
+# worker. put() blocks while the queue is full: a slow stage holds back the
+# stages feeding it instead of letting batches pile up in memory.
+#
+#   reader (main process) -> decode stage -> load / write stage
+#
+# A Monitor thread prints the throughput, busy time and queue depth of every
+# stage, the stage with a full input queue and ~100% busy is the bottleneck.
+
+import math
+import multiprocessing
+import queue
+import threading
+import time
+
+
+def read_batches(entries, batch_size, limit=math.inf):
+    """Group (key, value) pairs into lists of batch_size, stopping after limit."""
+    batch = []
+    count = 0
+    for entry in entries:
+        batch.append(entry)
+        count += 1
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+        if count >= limit:
+            break
+    if batch:
+        yield batch
+
+
+class Counter:
+    """Rows handled in the calling process, reported like a Stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = multiprocessing.Value("q", 0)
+
+    def add(self, rows):
+        with self.rows.get_lock():
+            self.rows.value += rows
+
+
+class Stage:
+    """Forked worker processes applying function(state, data) to queued batches.
+
+    `setup()` is called once in every worker, its result is passed to every
+    function call and closed (when it has a close method) when the stage is
+    closed. `function` returns the number of rows it handled; a batch that
+    raises is counted as an error (and rolled back when the state has a
+    rollback method). Batches put with a tag are reported as (tag, rows,
+    errors) on the `done` queue once handled, which the caller must drain.
+    The exporters are plain scripts without a __main__ guard, so the workers
+    are forked and `function` must be a module level function.
+    """
+
+    def __init__(self, name, setup, workers, queue_size=None):
+        context = multiprocessing.get_context("fork")
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size or 2 * workers
+        self.queue = context.Queue(maxsize=self.queue_size)
+        self.done = context.Queue()
+        self.rows = context.Value("q", 0)
+        self.errors = context.Value("q", 0)
+        self.busy = context.Value("d", 0.0)
+        self.processes = [
+            context.Process(target=self._run, args=(setup,), daemon=True)
+            for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def _add(self, value, amount):
+        with value.get_lock():
+            value.value += amount
+
+    def _run(self, setup):
+        try:
+            state = setup()
+        except Exception as ex:
+            print(ex)
+            self._add(self.errors, 1)
+            return
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                break
+            function, data, tag = batch
+            start = time.perf_counter()
+            try:
+                rows, errors = function(state, data), 0
+            except Exception as ex:
+                print(ex)
+                rows, errors = 0, 1
+                rollback = getattr(state, "rollback", None)
+                if rollback is not None:
+                    rollback()
+            self._add(self.rows, rows)
+            self._add(self.errors, errors)
+            self._add(self.busy, time.perf_counter() - start)
+            if tag is not None:
+                self.done.put((tag, rows, errors))
+        close = getattr(state, "close", None)
+        if close is not None:
+            close()
+
+    def put(self, function, data, tag=None):
+        """Queue a batch, blocking while the queue is full."""
+        self._put((function, data, tag))
+
+    def _put(self, item):
+        while True:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not any(process.is_alive() for process in self.processes):
+                    raise RuntimeError("all {} workers exited".format(self.name))
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def close(self):
+        """Wait for the queued batches, returns the (rows, errors) totals."""
+        for _ in self.processes:
+            try:
+                self._put(None)
+            except RuntimeError:
+                break
+        for process in self.processes:
+            process.join()
+        return self.rows.value, self.errors.value
+
+    def terminate(self):
+        for process in self.processes:
+            process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.terminate()
+
+
+class Monitor(threading.Thread):
+    """Print the throughput, busy share and queue depth of stages every interval."""
+
+    def __init__(self, stages, interval=10):
+        super().__init__(daemon=True)
+        self.stages = stages
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.started = self.last_time = time.perf_counter()
+        self.last = [self._sample(stage) for stage in stages]
+
+    def _sample(self, stage):
+        busy = getattr(stage, "busy", None)
+        return stage.rows.value, busy.value if busy is not None else None
+
+    def report(self, since_start=False):
+        now = time.perf_counter()
+        parts = []
+        for index, stage in enumerate(self.stages):
+            rows, busy = self._sample(stage)
+            if since_start:
+                elapsed, last_rows, last_busy = now - self.started, 0, 0.0
+            else:
+                elapsed = now - self.last_time
+                last_rows, last_busy = self.last[index]
+            self.last[index] = rows, busy
+            part = "{} {:.0f} rows/s".format(
+                stage.name, (rows - last_rows) / max(elapsed, 1e-9)
+            )
+            if busy is not None:
+                part += ", {:.0f}% busy, queue {}/{}".format(
+                    100 * (busy - last_busy) / max(elapsed * stage.workers, 1e-9),
+                    stage.depth(),
+                    stage.queue_size,
+                )
+            parts.append(part)
+        self.last_time = now
+        return " | ".join(parts)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            print(self.report())
+
+    def stop(self):
+        """Stop reporting and print the averages over the whole run."""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        print("total: " + self.report(since_start=True))
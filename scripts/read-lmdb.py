@@ -6,6 +6,7 @@ import argparse
 import ipaddress
 import lmdb
 import nanolib
+import nano_account
 from nanodb import Nanodb
 from kaitaistruct import KaitaiStream
 
@@ -14,18 +15,13 @@ def print_state_block(block, level, sideband=None):
     print(
         "{}account         : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO, public_key=block.account.hex()
-            ),
+            nano_account.account_id(block.account),
         )
     )
     print(
         "{}representative  : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO,
-                public_key=block.representative.hex(),
-            ),
+            nano_account.account_id(block.representative),
         )
     )
     print("{}previous        : {}".format(" " * level, block.previous.hex().upper()))
@@ -38,9 +34,7 @@ def print_state_block(block, level, sideband=None):
     print(
         "{}link as account : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO, public_key=block.link.hex()
-            ),
+            nano_account.account_id(block.link),
         )
     )
     print("{}signature       : {}".format(" " * level, block.signature.hex().upper()))
@@ -65,9 +59,7 @@ def print_send_block(block, level, sideband=None):
     print(
         "{}destination     : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO, public_key=block.destination.hex()
-            ),
+            nano_account.account_id(block.destination),
         )
     )
     print(
@@ -82,12 +74,7 @@ def print_send_block(block, level, sideband=None):
         print("  sideband:")
         print("    successor     : {}".format(sideband.successor.hex().upper()))
         print(
-            "    account       : {}".format(
-                nanolib.accounts.get_account_id(
-                    prefix=nanolib.AccountIDPrefix.NANO,
-                    public_key=sideband.account.hex(),
-                )
-            )
+            "    account       : {}".format(nano_account.account_id(sideband.account))
         )
         print("    height        : {}".format(sideband.height))
         print(
@@ -107,12 +94,7 @@ def print_receive_block(block, level, sideband=None):
         print("  sideband:")
         print("    successor     : {}".format(sideband.successor.hex().upper()))
         print(
-            "    account       : {}".format(
-                nanolib.accounts.get_account_id(
-                    prefix=nanolib.AccountIDPrefix.NANO,
-                    public_key=sideband.account.hex(),
-                )
-            )
+            "    account       : {}".format(nano_account.account_id(sideband.account))
         )
         print("    height        : {}".format(sideband.height))
         print(
@@ -131,19 +113,14 @@ def print_open_block(block, level, sideband=None):
     print(
         "{}account         : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO, public_key=block.account.hex()
-            ),
+            nano_account.account_id(block.account),
         )
     )
     print("{}source hash     : {}".format(" " * level, block.source.hex().upper()))
     print(
         "{}representative  : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO,
-                public_key=block.representative.hex(),
-            ),
+            nano_account.account_id(block.representative),
         )
     )
     print("{}signature       : {}".format(" " * level, block.signature.hex().upper()))
@@ -169,10 +146,7 @@ def print_change_block(block, level, sideband=None):
     print(
         "{}representative  : {}".format(
             " " * level,
-            nanolib.accounts.get_account_id(
-                prefix=nanolib.AccountIDPrefix.NANO,
-                public_key=block.representative.hex(),
-            ),
+            nano_account.account_id(block.representative),
         )
     )
     print("{}signature       : {}".format(" " * level, block.signature.hex().upper()))
@@ -182,12 +156,7 @@ def print_change_block(block, level, sideband=None):
         print("  sideband:")
         print("    successor     : {}".format(sideband.successor.hex().upper()))
         print(
-            "    account       : {}".format(
-                nanolib.accounts.get_account_id(
-                    prefix=nanolib.AccountIDPrefix.NANO,
-                    public_key=sideband.account.hex(),
-                )
-            )
+            "    account       : {}".format(nano_account.account_id(sideband.account))
         )
         print("    height        : {}".format(sideband.height))
         print(
@@ -267,10 +236,7 @@ try:
                 if balance > 0:
                     print(
                         "account          : {}".format(
-                            nanolib.accounts.get_account_id(
-                                prefix=nanolib.AccountIDPrefix.NANO,
-                                public_key=account_key.account.hex(),
-                            )
+                            nano_account.account_id(account_key.account)
                         )
                     )
                     print(
@@ -290,10 +256,7 @@ try:
                     )
                     print(
                         "  representative : {}".format(
-                            nanolib.accounts.get_account_id(
-                                prefix=nanolib.AccountIDPrefix.NANO,
-                                public_key=account_info.representative.hex(),
-                            )
+                            nano_account.account_id(account_info.representative)
                         )
                     )
                     print("")
@@ -370,10 +333,7 @@ try:
 
                 print(
                     "vote account      : {}".format(
-                        nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=vote_key.account.hex(),
-                        )
+                        nano_account.account_id(vote_key.account)
                     )
                 )
                 print(
@@ -470,10 +430,7 @@ try:
                 print("key hash          : {}".format(pending_key.hash.hex().upper()))
                 print(
                     "  source          : {}".format(
-                        nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=pending_info.source.hex(),
-                        )
+                        nano_account.account_id(pending_info.source)
                     )
                 )
                 print(
@@ -582,10 +539,7 @@ try:
                 # height timestamp is stored in microseconds since epoch
                 print(
                     "account          : {}".format(
-                        nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=height_key.account.hex(),
-                        )
+                        nano_account.account_id(height_key.account)
                     )
                 )
                 print("confirmed height : {}".format(height_info.height))
@@ -623,10 +577,7 @@ try:
                 print("hash      : {}".format(frontiers_key.hash.hex().upper()))
                 print(
                     "account   : {}".format(
-                        nanolib.accounts.get_account_id(
-                            prefix=nanolib.AccountIDPrefix.NANO,
-                            public_key=frontiers_info.account.hex(),
-                        )
+                        nano_account.account_id(frontiers_info.account)
                     )
                 )
                 print("")
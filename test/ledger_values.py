@@ -0,0 +1,166 @@
+# Builders for raw lmdb values in the layout read by scripts/nanodb.py.
+
+import os
+import random
+import struct
+
+SEND = 2
+RECEIVE = 3
+OPEN = 4
+CHANGE = 5
+STATE = 6
+
+
+def random_bytes(length):
+    return os.urandom(length)
+
+
+def random_balance():
+    return random.getrandbits(127).to_bytes(16, "big")
+
+
+def send_value(
+    previous, destination, balance, successor, account, height, timestamp, work=None
+):
+    work = random.getrandbits(64) if work is None else work
+    return (
+        bytes([SEND])
+        + struct.pack(
+            "<32s32s16s64sQ", previous, destination, balance, random_bytes(64), work
+        )
+        + struct.pack(">32s32sQQ", successor, account, height, timestamp)
+    )
+
+
+def receive_value(previous, source, successor, account, height, balance, timestamp):
+    return (
+        bytes([RECEIVE])
+        + struct.pack(
+            "<32s32s64sQ", previous, source, random_bytes(64), random.getrandbits(64)
+        )
+        + struct.pack(">32s32sQ16sQ", successor, account, height, balance, timestamp)
+    )
+
+
+def open_value(source, representative, account, successor, balance, timestamp):
+    return (
+        bytes([OPEN])
+        + struct.pack(
+            "<32s32s32s64sQ",
+            source,
+            representative,
+            account,
+            random_bytes(64),
+            random.getrandbits(64),
+        )
+        + struct.pack(">32s16sQ", successor, balance, timestamp)
+    )
+
+
+def change_value(
+    previous, representative, successor, account, height, balance, timestamp
+):
+    return (
+        bytes([CHANGE])
+        + struct.pack(
+            "<32s32s64sQ",
+            previous,
+            representative,
+            random_bytes(64),
+            random.getrandbits(64),
+        )
+        + struct.pack(">32s32sQ16sQ", successor, account, height, balance, timestamp)
+    )
+
+
+def state_value(
+    account,
+    previous,
+    representative,
+    balance,
+    link,
+    successor,
+    height,
+    timestamp,
+    is_send=False,
+    is_receive=False,
+    is_epoch=False,
+    epoch=2,
+):
+    flags = (is_send << 7) | (is_receive << 6) | (is_epoch << 5) | epoch
+    return (
+        bytes([STATE])
+        + struct.pack(
+            ">32s32s32s16s32s64sQ",
+            account,
+            previous,
+            representative,
+            balance,
+            link,
+            random_bytes(64),
+            random.getrandbits(64),
+        )
+        + struct.pack(">32sQQB", successor, height, timestamp, flags)
+    )
+
+
+def confirmation_height_value(height, frontier):
+    return struct.pack("<Q32s", height, frontier)
+
+
+def account_value(head, representative, open_block, balance, modified, block_count):
+    return struct.pack(
+        "<32s32s32s16sQQ",
+        head,
+        representative,
+        open_block,
+        balance,
+        modified,
+        block_count,
+    )
+
+
+def random_values():
+    """One value of every block type with random contents."""
+    r = random_bytes
+    return [
+        send_value(r(32), r(32), random_balance(), r(32), r(32), 7, 1600000000),
+        receive_value(r(32), r(32), r(32), r(32), 8, random_balance(), 1600000001),
+        open_value(r(32), r(32), r(32), r(32), random_balance(), 0),
+        change_value(r(32), r(32), bytes(32), r(32), 9, random_balance(), 1600000002),
+        state_value(
+            r(32),
+            r(32),
+            r(32),
+            random_balance(),
+            r(32),
+            r(32),
+            10,
+            1650000000,
+            is_send=True,
+        ),
+        state_value(
+            r(32),
+            bytes(32),
+            r(32),
+            random_balance(),
+            r(32),
+            r(32),
+            1,
+            1650000001,
+            is_receive=True,
+            epoch=4,
+        ),
+        state_value(
+            r(32),
+            r(32),
+            r(32),
+            random_balance(),
+            r(32),
+            bytes(32),
+            2**40,
+            2**63,
+            is_epoch=True,
+            epoch=3,
+        ),
+    ]
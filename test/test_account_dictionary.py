@@ -0,0 +1,62 @@
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+import account_dictionary
+import nano_account
+import nanodb_fast
+from ledger_values import random_bytes, random_values
+
+
+def key_column(keys):
+    return np.frombuffer(b"".join(keys), np.uint8).reshape(-1, 32)
+
+
+def test_ids_are_kept_across_saves(tmp_path):
+    prefix = random_bytes(8)
+    keys = [random_bytes(32) for _ in range(5)] + [prefix + random_bytes(24)] * 2
+    keys.append(prefix + random_bytes(24))
+    dictionary = account_dictionary.AccountDictionary()
+    assert dictionary.add(key_column(keys)) == 7
+    assert [dictionary.get(key) for key in keys] == [0, 1, 2, 3, 4, 5, 5, 6]
+
+    path = str(tmp_path / "accounts_dictionary.parquet")
+    dictionary.save(path)
+    dictionary = account_dictionary.AccountDictionary.load(path)
+    new = random_bytes(32)
+    assert dictionary.add(key_column([new, keys[6], new])) == 1
+    ids, found = dictionary.lookup(key_column(keys + [new, random_bytes(32)]))
+    assert list(ids) == [0, 1, 2, 3, 4, 5, 5, 6, 7, 0]
+    assert list(found) == [True] * 9 + [False]
+
+    dictionary.save(path)
+    table = pq.read_table(path)
+    assert table.column("account").to_pylist()[-1] == nano_account.account_id(new)
+    with pytest.raises(KeyError):
+        dictionary.get(random_bytes(32))
+
+
+def test_referenced_accounts_and_id_array():
+    items = [(random_bytes(32), value) for value in random_values()]
+    blocks = [nanodb_fast.decode_block(value) for _, value in items]
+    expected = {block.account for block in blocks}
+    expected |= {block.representative for block in blocks if block.representative}
+    expected |= {
+        block.link
+        for block in blocks
+        if block.block_type == nanodb_fast.BLOCK_TYPE_SEND or block.is_send
+    }
+    referenced = account_dictionary.referenced_accounts(items)
+    assert {row.tobytes() for row in referenced} == expected
+
+    dictionary = account_dictionary.AccountDictionary()
+    dictionary.add(referenced)
+    raw = key_column([block.representative or bytes(32) for block in blocks])
+    valid = np.array([block.representative is not None for block in blocks])
+    array = dictionary.array(raw, valid)
+    assert array.to_pylist() == [
+        dictionary.get(key) if key else None
+        for key in (block.representative for block in blocks)
+    ]
+    with pytest.raises(KeyError):
+        dictionary.array(raw)
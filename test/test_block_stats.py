@@ -0,0 +1,77 @@
+import collections
+import random
+
+import block_stats
+import nano_account
+from ledger_values import random_bytes
+
+
+def test_blocktype_follows_the_stats_queries():
+    assert block_stats.blocktype(4, None) == block_stats.SEND
+    assert block_stats.blocktype(1, 3) == block_stats.SEND
+    assert block_stats.blocktype(2, None) == block_stats.RECEIVE
+    assert block_stats.blocktype(3, None) == block_stats.RECEIVE
+    assert block_stats.blocktype(1, 1) == block_stats.RECEIVE
+    assert block_stats.blocktype(1, 2) == block_stats.RECEIVE
+    assert block_stats.blocktype(1, 4) is None
+    assert block_stats.blocktype(1, 5) is None
+    assert block_stats.blocktype(5, None) is None
+
+
+def test_spilled_groups_of_several_processes_are_merged(tmp_path):
+    accounts = ["nano_{}".format(letter) for letter in "abcdefgh"]
+    directions = [block_stats.SEND, block_stats.RECEIVE]
+    blocks = [
+        (
+            random.choice(accounts),
+            random.choice(directions),
+            random.choice(accounts + [None]),
+            random.randrange(10**30),
+        )
+        for _ in range(2000)
+    ]
+    expected = collections.defaultdict(lambda: [0, 0])
+    for source, direction, destination, amount in blocks:
+        expected[source, direction, destination][0] += 1
+        expected[source, direction, destination][1] += amount
+
+    # One aggregate per process, all spilling to the same directory
+    aggregates = [block_stats.StatsAggregate(str(tmp_path), 10) for _ in range(3)]
+    for index, block in enumerate(blocks):
+        aggregates[index % 3].add(*block)
+    for aggregate in aggregates[1:]:
+        aggregate.spill()
+    assert len(aggregates[0].runs()) > 3
+
+    groups = list(aggregates[0].merge())
+    assert [group[:3] for group in groups] == sorted(
+        expected, key=lambda key: (key[0], key[1], key[2] or "")
+    )
+    assert {group[:3]: list(group[3:]) for group in groups} == dict(expected)
+
+    totals = collections.defaultdict(lambda: [0, 0])
+    for source, direction, _, amount in blocks:
+        totals[source, direction][0] += 1
+        totals[source, direction][1] += amount
+    account_totals = list(block_stats.account_totals(iter(groups)))
+    assert [row[:2] for row in account_totals] == sorted(totals)
+    assert {row[:2]: list(row[2:]) for row in account_totals} == dict(totals)
+
+
+def test_account_ranges_split_accounts_evenly():
+    accounts = sorted(
+        nano_account.account_id(random_bytes(32)) for _ in range(3000)
+    ) + ["xrb_1111", "nano_1"]
+    ranges = block_stats.account_ranges(5)
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    counts = [
+        sum(
+            1
+            for account in accounts
+            if (low is None or account >= low) and (high is None or account < high)
+        )
+        for low, high in ranges
+    ]
+    assert sum(counts) == len(accounts)
+    assert min(counts) > 450
+    assert block_stats.account_ranges(1) == [(None, None)]
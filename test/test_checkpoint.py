@@ -0,0 +1,86 @@
+import lmdb
+
+import checkpoint
+
+
+def test_checkpoint_advances_over_committed_batches(tmp_path):
+    path = str(tmp_path / "export.checkpoint.json")
+    progress = checkpoint.Checkpoint(path, interval=0)
+    progress.add(("accounts", b"\x01"), 10)
+    progress.add(("accounts", b"\x02"), 10)
+    progress.add(("blocks", b"\x03"), 5)
+
+    # Committed out of order, the first batch still holds the checkpoint back
+    progress.done(("accounts", b"\x02"), 10, 0)
+    assert progress.key is None
+    progress.done(("accounts", b"\x01"), 10, 0)
+    assert (progress.table, progress.key) == ("accounts", b"\x02")
+    assert (progress.count, progress.loaded) == (20, 20)
+
+    saved = checkpoint.Checkpoint.load(path)
+    assert (saved.table, saved.key, saved.count) == ("accounts", b"\x02", 20)
+
+    progress.done(("blocks", b"\x03"), 5, 0)
+    progress.remove()
+    assert checkpoint.Checkpoint.load(path) is None
+
+
+def export(env, progress, resume=None, failing=frozenset()):
+    """Load batches of two entries like the exporters, failing the given keys."""
+    loaded = []
+    with env.begin() as txn:
+        cursor = txn.cursor()
+        if resume is None:
+            more = cursor.first()
+        else:
+            more = checkpoint.seek_after(cursor, resume[1])
+        while more:
+            batch = []
+            while more and len(batch) < 2:
+                batch.append(cursor.key())
+                more = cursor.next()
+            tag = "blocks", batch[-1]
+            progress.add(tag, len(batch))
+            if failing.intersection(batch):
+                progress.done(tag, 0, 1)
+            else:
+                loaded.extend(batch)
+                progress.done(tag, len(batch), 0)
+    progress.close()
+    return loaded
+
+
+def test_resume_exports_the_failed_batches(tmp_path):
+    path = str(tmp_path / "export.checkpoint.json")
+    env = lmdb.open(str(tmp_path / "data.ldb"), subdir=False)
+    keys = [bytes([key]) for key in range(1, 9)]
+    with env.begin(write=True) as txn:
+        for key in keys:
+            txn.put(key, b"")
+
+    progress = checkpoint.Checkpoint(path, interval=0)
+    first = export(env, progress, failing={b"\x03", b"\x07"})
+    assert first == [b"\x01", b"\x02", b"\x05", b"\x06"]
+
+    # The checkpoint holds at the batch before the first failure
+    progress = checkpoint.Checkpoint.load(path)
+    assert (progress.table, progress.key, progress.count) == ("blocks", b"\x02", 2)
+    second = export(env, progress, resume=(progress.table, progress.key))
+    assert sorted(set(first + second)) == keys
+    assert (progress.key, progress.count, progress.loaded) == (b"\x08", 8, 8)
+    env.close()
+
+
+def test_seek_after(tmp_path):
+    env = lmdb.open(str(tmp_path / "data.ldb"), subdir=False)
+    with env.begin(write=True) as txn:
+        for key in (b"\x01", b"\x03", b"\x05"):
+            txn.put(key, b"")
+    with env.begin() as txn:
+        cursor = txn.cursor()
+        assert checkpoint.seek_after(cursor, b"\x03")
+        assert [key for key, _ in cursor] == [b"\x05"]
+        assert checkpoint.seek_after(cursor, b"\x02")
+        assert cursor.key() == b"\x03"
+        assert not checkpoint.seek_after(cursor, b"\x05")
+    env.close()
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+
+import lmdb
+import pyarrow.parquet as pq
+import pytest
+
+from ledger_values import (
+    account_value,
+    confirmation_height_value,
+    open_value,
+    random_bytes,
+    send_value,
+    state_value,
+)
+
+SCRIPT = os.path.join(
+    os.path.dirname(__file__), "..", "scripts", "export-lmdb-to-parquet.py"
+)
+
+# Raw sideband and accounts.modified values, exported as is in any time zone
+TIMESTAMPS = {"state": 1650000000, "open": 1600000000, "send": 1600003600}
+MODIFIED = {"state": 1650000001, "legacy": 1600003601}
+
+
+def write_ledger(path):
+    env = lmdb.open(path, subdir=False, max_dbs=10)
+    accounts_db = env.open_db("accounts".encode())
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+    state_account, legacy_account = random_bytes(32), random_bytes(32)
+    state_hash, open_hash, send_hash = (random_bytes(32) for _ in range(3))
+    balance = (10**30).to_bytes(16, "big")
+    with env.begin(write=True) as txn:
+        txn.put(
+            state_hash,
+            state_value(
+                state_account,
+                bytes(32),
+                state_account,
+                balance,
+                send_hash,
+                bytes(32),
+                1,
+                TIMESTAMPS["state"],
+                is_receive=True,
+            ),
+            db=blocks_db,
+        )
+        txn.put(
+            open_hash,
+            open_value(
+                random_bytes(32),
+                legacy_account,
+                legacy_account,
+                send_hash,
+                (2 * 10**30).to_bytes(16, "big"),
+                TIMESTAMPS["open"],
+            ),
+            db=blocks_db,
+        )
+        txn.put(
+            send_hash,
+            send_value(
+                open_hash,
+                state_account,
+                balance,
+                bytes(32),
+                legacy_account,
+                2,
+                TIMESTAMPS["send"],
+            ),
+            db=blocks_db,
+        )
+        for account, head, open_block, modified, count in [
+            (state_account, state_hash, state_hash, MODIFIED["state"], 1),
+            (legacy_account, send_hash, open_hash, MODIFIED["legacy"], 2),
+        ]:
+            info = account_value(head, account, open_block, balance, modified, count)
+            txn.put(account, info, db=accounts_db)
+            txn.put(account, confirmation_height_value(count, head), db=confirmation_db)
+    env.close()
+
+
+@pytest.mark.parametrize("decoder", ["columnar", "struct"])
+def test_timestamps_do_not_depend_on_the_time_zone(tmp_path, decoder):
+    ledger = str(tmp_path / "data.ldb")
+    write_ledger(ledger)
+    subprocess.run(
+        [
+            sys.executable,
+            SCRIPT,
+            "--filename",
+            ledger,
+            "--decoder",
+            decoder,
+            "--report-interval",
+            "0",
+        ],
+        cwd=str(tmp_path),
+        env=dict(os.environ, TZ="America/New_York"),
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+    blocks = pq.read_table(str(tmp_path / "blocks.parquet"))
+    assert sorted(blocks.column("local_timestamp").to_pylist()) == sorted(
+        TIMESTAMPS.values()
+    )
+    accounts = pq.read_table(str(tmp_path / "accounts.parquet"))
+    assert sorted(accounts.column("modified_timestamp").to_pylist()) == sorted(
+        MODIFIED.values()
+    )
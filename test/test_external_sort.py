@@ -0,0 +1,60 @@
+import random
+
+import pyarrow as pa
+
+import external_sort
+
+
+class TableWriter:
+    def __init__(self):
+        self.tables = []
+        self.closed = False
+
+    def write_table(self, table, row_group_size=None):
+        assert table.num_rows <= row_group_size
+        self.tables.append(table)
+
+    def close(self):
+        self.closed = True
+
+
+def test_sorted_writer_merges_spilled_runs(tmp_path):
+    rows = [(random.choice("abcdefg"), height) for height in range(1, 500)] * 2
+    random.shuffle(rows)
+    schema = pa.schema(
+        [pa.field("account", pa.string()), pa.field("height", pa.int64())]
+    )
+
+    output = TableWriter()
+    writer = external_sort.SortedWriter(
+        output,
+        ["account", "height"],
+        run_rows=150,
+        spill_dir=str(tmp_path),
+        batch_rows=16,
+        row_group_size=100,
+    )
+    for offset in range(0, len(rows), 70):
+        chunk = rows[offset : offset + 70]
+        writer.write_table(
+            pa.table(
+                [[row[0] for row in chunk], [row[1] for row in chunk]], schema=schema
+            )
+        )
+    assert len(writer.runs) > 1
+    writer.close()
+
+    table = pa.concat_tables(output.tables)
+    assert list(
+        zip(table.column(0).to_pylist(), table.column(1).to_pylist())
+    ) == sorted(rows)
+    assert [table.num_rows for table in output.tables[:-1]] == [100] * 9
+    assert output.closed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rows_up_to():
+    table = pa.table({"account": ["a", "a", "b", "b", "c"], "height": [1, 5, 2, 3, 1]})
+    assert external_sort.rows_up_to(table, ["account", "height"], ("b", 2)) == 3
+    assert external_sort.rows_up_to(table, ["account", "height"], ("a", 0)) == 0
+    assert external_sort.rows_up_to(table, ["account", "height"], ("c", 1)) == 5
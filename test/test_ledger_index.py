@@ -0,0 +1,74 @@
+import random
+
+import numpy as np
+
+import ledger_index
+import nanodb_fast
+from ledger_values import confirmation_height_value, random_bytes, random_values
+
+
+def test_lookup_matches_decoded_balances():
+    items = [(random_bytes(32), value) for value in random_values() * 3]
+    index = ledger_index.BalanceIndex.from_entries(items, batch_size=7)
+    assert len(index) == len(items)
+
+    for key, value in items:
+        balance = nanodb_fast.decode_block(value).balance
+        assert index.get(key) == int.from_bytes(balance, "big")
+    assert index.get(random_bytes(32)) is None
+
+
+def test_shared_prefixes_are_not_found():
+    prefix = random_bytes(8)
+    items = [(prefix + random_bytes(24), value) for value in random_values()[:2]]
+    items += [(random_bytes(32), value) for value in random_values()]
+    random.shuffle(items)
+    index = ledger_index.BalanceIndex.from_entries(items)
+
+    hashes = np.frombuffer(b"".join(key for key, _ in items), np.uint8).reshape(-1, 32)
+    _, _, found = index.lookup(hashes)
+    assert list(found) == [not key.startswith(prefix) for key, _ in items]
+
+
+def test_empty_index():
+    index = ledger_index.BalanceIndex.from_entries([])
+    high, low, found = index.lookup(np.zeros((2, 32), np.uint8))
+    assert not found.any() and not high.any() and not low.any()
+
+
+def test_confirmation_heights():
+    items = sorted(
+        (random_bytes(32), confirmation_height_value(height, random_bytes(32)))
+        for height in range(1, 50)
+    )
+    index = ledger_index.ConfirmationHeightIndex.from_entries(items)
+
+    for key, value in items:
+        assert index.get(key) == nanodb_fast.decode_confirmation_height(value).height
+    accounts = np.frombuffer(b"".join(key for key, _ in items), np.uint8)
+    heights, found = index.lookup(accounts.reshape(-1, 32))
+    assert found.all()
+    assert list(heights) == [
+        nanodb_fast.decode_confirmation_height(value).height for _, value in items
+    ]
+    assert index.get(random_bytes(32)) is None
+
+
+def test_source_accounts_index_sends_only():
+    items = [(random_bytes(32), value) for value in random_values() * 2]
+    index = ledger_index.SourceAccountIndex.from_entries(items, batch_size=3)
+
+    blocks = [(key, nanodb_fast.decode_block(value)) for key, value in items]
+    sends = [
+        (key, block.account)
+        for key, block in blocks
+        if block.block_type == nanodb_fast.BLOCK_TYPE_SEND or block.is_send
+    ]
+    assert len(index) == len(sends) == 4
+    for key, block in blocks:
+        expected = block.account if (key, block.account) in sends else None
+        assert index.get(key) == expected
+    hashes = np.frombuffer(b"".join(key for key, _ in sends), np.uint8)
+    accounts, found = index.lookup(hashes.reshape(-1, 32))
+    assert found.all()
+    assert [row.tobytes() for row in accounts] == [account for _, account in sends]
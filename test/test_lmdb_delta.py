@@ -0,0 +1,92 @@
+import lmdb
+
+import lmdb_delta
+import nanodb_fast
+from ledger_values import (
+    account_value,
+    confirmation_height_value,
+    random_bytes,
+    state_value,
+)
+
+ACCOUNT = random_bytes(32)
+OTHER = random_bytes(32)
+HASHES = [random_bytes(32) for _ in range(10)]
+
+
+def write_ledger(path, chains):
+    """chains maps an account to (block count, confirmation height)."""
+    env = lmdb.open(path, subdir=False, max_dbs=10)
+    accounts_db = env.open_db("accounts".encode())
+    blocks_db = env.open_db("blocks".encode())
+    confirmation_db = env.open_db("confirmation_height".encode())
+    with env.begin(write=True) as txn:
+        for account, (count, confirmed) in chains.items():
+            hashes = HASHES if account == ACCOUNT else [account[::-1]]
+            for height in range(1, count + 1):
+                previous = hashes[height - 2] if height > 1 else bytes(32)
+                value = state_value(
+                    account,
+                    previous,
+                    account,
+                    bytes(16),
+                    bytes(32),
+                    bytes(32),
+                    height,
+                    1000 + height,
+                )
+                txn.put(hashes[height - 1], value, db=blocks_db)
+            info = account_value(
+                hashes[count - 1], account, hashes[0], bytes(16), 1000 + count, count
+            )
+            txn.put(account, info, db=accounts_db)
+            txn.put(
+                account,
+                confirmation_height_value(confirmed, hashes[confirmed - 1]),
+                db=confirmation_db,
+            )
+    env.close()
+
+
+def delta_blocks(path, state):
+    delta = lmdb_delta.Delta.from_ledger(path, state)
+    env = lmdb.open(path, subdir=False, readonly=True, lock=False, max_dbs=10)
+    blocks_db = env.open_db("blocks".encode())
+    with env.begin() as txn:
+        heights = sorted(
+            nanodb_fast.decode_block(value).height
+            for _, value in delta.blocks(txn, blocks_db)
+        )
+    env.close()
+    return delta, heights
+
+
+def test_delta_walks_new_and_newly_confirmed_blocks(tmp_path):
+    path = str(tmp_path / "data.ldb")
+    state_path = str(tmp_path / "state.npz")
+
+    write_ledger(path, {ACCOUNT: (5, 3), OTHER: (1, 1)})
+    delta, heights = delta_blocks(path, lmdb_delta.ExportState.load(state_path))
+    assert heights == [1, 1, 2, 3, 4, 5]
+    assert len(delta.accounts) == 2
+    delta.state.save(state_path)
+
+    state = lmdb_delta.ExportState.load(state_path)
+    assert state.modified == 1005
+    assert state.get(ACCOUNT) == (5, 3)
+    assert state.get(random_bytes(32)) == (0, 0)
+
+    # Nothing changed
+    delta, heights = delta_blocks(path, state)
+    assert heights == [] and delta.accounts == []
+
+    # Two new blocks
+    write_ledger(path, {ACCOUNT: (7, 3), OTHER: (1, 1)})
+    delta, heights = delta_blocks(path, state)
+    assert heights == [6, 7]
+    assert [key for key, _ in delta.accounts] == [ACCOUNT]
+
+    # Blocks 4 and 5 were exported unconfirmed, they are emitted again
+    write_ledger(path, {ACCOUNT: (7, 6), OTHER: (1, 1)})
+    delta, heights = delta_blocks(path, state)
+    assert heights == [4, 5, 6, 7]
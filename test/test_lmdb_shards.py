@@ -0,0 +1,42 @@
+import lmdb
+import pytest
+
+import lmdb_shards
+from ledger_values import random_bytes
+
+
+def test_key_ranges_cover_keyspace():
+    assert lmdb_shards.key_ranges(1) == [(None, None)]
+    ranges = lmdb_shards.key_ranges(3)
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    with pytest.raises(ValueError):
+        lmdb_shards.key_ranges(0)
+
+
+def test_iter_range_partitions_table(tmp_path):
+    path = str(tmp_path / "data.ldb")
+    keys = sorted(random_bytes(32) for _ in range(1000))
+    keys += [b"\x55\x55" + bytes(30), b"\xaa\xaa" + bytes(30)]
+    env = lmdb.open(path, subdir=False, max_dbs=10)
+    blocks_db = env.open_db("blocks".encode())
+    with env.begin(write=True, db=blocks_db) as txn:
+        for key in keys:
+            txn.put(key, key[::-1])
+    env.close()
+
+    env = lmdb_shards.open_env(path)
+    blocks_db = env.open_db("blocks".encode())
+    for workers in (1, 3, 7):
+        seen = []
+        with env.begin() as txn:
+            for start, end in lmdb_shards.key_ranges(workers):
+                cursor = txn.cursor(blocks_db)
+                for key, value in lmdb_shards.iter_range(cursor, start, end):
+                    assert value == key[::-1]
+                    assert start is None or key >= start
+                    assert end is None or key < end
+                    seen.append(key)
+        assert seen == sorted(keys)
+    env.close()
@@ -0,0 +1,170 @@
+import decimal
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+import mysql_parquet
+
+
+class PageCursor:
+    """Answers the keyset page queries from rows sorted by their first columns."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows)
+        self.queries = []
+
+    def execute(self, sql, params):
+        self.queries.append(sql)
+        *after, limit = params
+        rows = [
+            row for row in self.rows if not after or row[: len(after)] > tuple(after)
+        ]
+        self.result = rows[:limit]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_select_page():
+    assert mysql_parquet.select_page(
+        "blocks", ["hash", "height"], "hash", "`confirmed` = 1"
+    ) == (
+        "SELECT `hash`, `height` FROM `blocks` WHERE `confirmed` = 1 AND `hash` > %s"
+        " ORDER BY `hash` LIMIT %s"
+    )
+    assert mysql_parquet.select_page(
+        "accounts", ["account"], "account", first=True
+    ) == ("SELECT `account` FROM `accounts` ORDER BY `account` LIMIT %s")
+
+
+def test_iter_pages_resumes_after_key():
+    cursor = PageCursor([("{:02}".format(key), key) for key in range(25)])
+
+    pages = list(mysql_parquet.iter_pages(cursor, "t", ["k", "v"], "k", 10))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [row[1] for page in pages for row in page] == list(range(25))
+
+    pages = list(mysql_parquet.iter_pages(cursor, "t", ["k", "v"], "k", 5, "19"))
+    assert [row[1] for page in pages for row in page] == list(range(20, 25))
+    # The last full page needs one more query to find the end
+    assert len(cursor.queries) == 3 + 2
+
+
+def test_rows_to_table():
+    schema = pa.schema(
+        [
+            pa.field("hash", pa.binary(2)),
+            pa.field("balance", pa.decimal128(38, 0)),
+            pa.field("confirmed", pa.bool_()),
+        ]
+    )
+    rows = [("00FF", "12", 1), ("0100", None, 0)]
+
+    table = mysql_parquet.rows_to_table(
+        rows,
+        schema,
+        {"hash": bytes.fromhex, "balance": decimal.Decimal, "confirmed": bool},
+    )
+    assert table.to_pylist() == [
+        {"hash": b"\x00\xff", "balance": decimal.Decimal(12), "confirmed": True},
+        {"hash": b"\x01\x00", "balance": None, "confirmed": False},
+    ]
+
+
+def test_snapshot_appends_parts(tmp_path):
+    schema = pa.schema([pa.field("hash", pa.string()), pa.field("height", pa.int64())])
+    path = str(tmp_path / "blocks")
+
+    for first, last in ((0, 10), (10, 15)):
+        snapshot = mysql_parquet.Snapshot(path)
+        rows = [("{:02}".format(key), key) for key in range(first, last)]
+        assert snapshot.last_key == (None if first == 0 else "09")
+        part = snapshot.open_part(schema)
+        for page in (rows[:3], rows[3:]):
+            part.write(
+                mysql_parquet.rows_to_table(page, schema), page[0][0], page[-1][0]
+            )
+        part.commit()
+
+    snapshot = mysql_parquet.Snapshot(path)
+    assert [(part["file"], part["rows"]) for part in snapshot.parts] == [
+        ("part-00000.parquet", 10),
+        ("part-00001.parquet", 5),
+    ]
+    assert (snapshot.parts[1]["first_key"], snapshot.last_key) == ("10", "14")
+
+    # A part that was never committed is not read and gets replaced
+    snapshot.open_part(schema).writer.close()
+    table = ds.dataset(path, format="parquet").to_table()
+    assert sorted(table.column("height").to_pylist()) == list(range(15))
+
+
+def test_iter_pages_with_a_key_of_two_columns():
+    cursor = PageCursor(
+        [(timestamp // 3, "{:02}".format(timestamp)) for timestamp in range(12)]
+    )
+    assert mysql_parquet.select_page("blocks", ["t", "h"], ["t", "h"]) == (
+        "SELECT `t`, `h` FROM `blocks` WHERE (`t`, `h`) > (%s, %s) ORDER BY `t`, `h` LIMIT %s"
+    )
+    # The page ends inside the rows of a timestamp
+    pages = list(
+        mysql_parquet.iter_pages(cursor, "blocks", ["t", "h"], ["t", "h"], 4, [1, "04"])
+    )
+    assert [row[1] for page in pages for row in page] == [
+        "{:02}".format(timestamp) for timestamp in range(5, 12)
+    ]
+
+
+def test_snapshot_keys_and_replaced_parts(tmp_path):
+    schema = pa.schema([pa.field("account", pa.string())])
+    path = str(tmp_path / "accounts")
+
+    for accounts in (["a", "b"], ["a", "b", "c"], ["b"]):
+        snapshot = mysql_parquet.Snapshot(path)
+        part = snapshot.open_part(schema)
+        part.write(
+            mysql_parquet.rows_to_table([(account,) for account in accounts], schema),
+            accounts[0],
+            accounts[-1],
+        )
+        part.commit(replace=True)
+
+    snapshot = mysql_parquet.Snapshot(path)
+    assert [part["file"] for part in snapshot.parts] == ["part-00002.parquet"]
+    assert ds.dataset(path, format="parquet").to_table().column(0).to_pylist() == ["b"]
+
+    # A snapshot is only appended to with the key it was written with
+    with pytest.raises(ValueError):
+        mysql_parquet.Snapshot(path, ["local_timestamp", "hash"])
+
+
+def test_snapshot_column_of_late_parts(tmp_path):
+    schema = pa.schema(
+        [pa.field("hash", pa.string()), pa.field("local_timestamp", pa.int64())]
+    )
+    path = str(tmp_path / "blocks")
+    key = ["local_timestamp", "hash"]
+    # The second run found a block confirmed late, behind the last key
+    for rows in ([("B", 10), ("A", 20)], [("C", 15)]):
+        snapshot = mysql_parquet.Snapshot(path, key)
+        part = snapshot.open_part(schema)
+        part.write(
+            mysql_parquet.rows_to_table(rows, schema),
+            [rows[0][1], rows[0][0]],
+            [rows[-1][1], rows[-1][0]],
+        )
+        part.commit()
+    # Renamed into place but never added to the manifest
+    pq.write_table(
+        mysql_parquet.rows_to_table([("D", 30)], schema),
+        str(tmp_path / "blocks" / "part-00002.parquet"),
+    )
+
+    snapshot = mysql_parquet.Snapshot(path, key)
+    assert snapshot.last_key == [20, "A"]
+    assert sorted(snapshot.column("hash", ds.field("local_timestamp") >= 15)) == [
+        "A",
+        "C",
+    ]
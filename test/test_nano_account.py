@@ -0,0 +1,39 @@
+import nanolib
+import numpy as np
+import pytest
+
+import nano_account
+import nanodb_batch
+from ledger_values import random_bytes
+
+
+def reference(key):
+    return nanolib.accounts.get_account_id(
+        prefix=nanolib.AccountIDPrefix.NANO, public_key=key.hex()
+    )
+
+
+def test_account_id_matches_nanolib():
+    keys = [bytes(32), b"\xff" * 32] + [random_bytes(32) for _ in range(500)]
+    for key in keys:
+        assert nano_account.account_id(key) == reference(key)
+
+
+def test_account_id_rejects_short_keys():
+    with pytest.raises(ValueError):
+        nano_account.account_id(bytes(31))
+
+
+def test_account_ids_matches_nanolib():
+    keys = [random_bytes(32) for _ in range(500)]
+    raw = np.frombuffer(b"".join(keys), np.uint8).reshape(len(keys), 32)
+    assert nano_account.account_ids(raw) == [reference(key) for key in keys]
+    assert nano_account.account_ids(raw[:0]) == []
+
+
+def test_account_id_array_nulls():
+    keys = [random_bytes(32) for _ in range(4)]
+    raw = np.frombuffer(b"".join(keys), np.uint8).reshape(len(keys), 32)
+    valid = np.array([True, False, True, False])
+    array = nanodb_batch.account_id_array(raw, valid)
+    assert array.to_pylist() == [reference(keys[0]), None, reference(keys[2]), None]
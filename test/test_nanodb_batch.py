@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+import pyarrow as pa
+
+import nanodb_batch
+import nanodb_fast
+from ledger_values import random_bytes, random_values
+
+
+def random_items():
+    values = random_values() * 3
+    random.shuffle(values)
+    return [(random_bytes(32), value) for value in values]
+
+
+def test_decode_block_columns_matches_row_decoder():
+    items = random_items()
+    columns = nanodb_batch.decode_block_columns(items)
+
+    for row, (key, value) in enumerate(items):
+        block = nanodb_fast.decode_block(value)
+        assert columns["hash"][row].tobytes() == key
+        assert columns["block_type"][row] == block.block_type
+        assert columns["account"][row].tobytes() == block.account
+        assert columns["previous"][row].tobytes() == (block.previous or bytes(32))
+        assert columns["balance"][row].tobytes() == block.balance
+        assert columns["signature"][row].tobytes() == block.signature
+        assert columns["successor"][row].tobytes() == block.successor
+        assert columns["work"][row] == block.work
+        assert columns["height"][row] == block.height
+        assert columns["timestamp"][row] == block.timestamp
+        assert columns["representative_valid"][row] == (
+            block.representative is not None
+        )
+        if block.representative is not None:
+            assert columns["representative"][row].tobytes() == block.representative
+        assert columns["link_valid"][row] == (block.link is not None)
+        if block.link is not None:
+            assert columns["link"][row].tobytes() == block.link
+
+
+def test_absolute_difference():
+    a = [random.getrandbits(128) for _ in range(100)] + [0, 2**128 - 1]
+    b = [random.getrandbits(128) for _ in range(100)] + [2**128 - 1, 0]
+
+    def to_raw(values):
+        data = b"".join(value.to_bytes(16, "big") for value in values)
+        return np.frombuffer(data, np.uint8).reshape(-1, 16)
+
+    high, low = nanodb_batch.absolute_difference(
+        nanodb_batch.balance_parts(to_raw(a)), nanodb_batch.balance_parts(to_raw(b))
+    )
+
+    assert [int(h) << 64 | int(l) for h, l in zip(high, low)] == [
+        abs(x - y) for x, y in zip(a, b)
+    ]
+
+
+def test_decode_blocks_record_batch():
+    items = random_items()
+    batch = nanodb_batch.decode_blocks(items)
+
+    assert batch.num_rows == len(items)
+    assert batch.schema.field("hash").type == pa.binary(32)
+    assert batch.schema.field("signature").type == pa.binary(64)
+    assert batch.column(batch.schema.get_field_index("hash")).to_pylist() == [
+        key for key, _ in items
+    ]
+    balances = batch.column(batch.schema.get_field_index("balance")).to_pylist()
+    assert [int(balance) for balance in balances] == [
+        int.from_bytes(nanodb_fast.decode_block(value).balance, "big")
+        for _, value in items
+    ]
+
+
+def test_hex_string_array():
+    raw = np.frombuffer(random_bytes(64), np.uint8).reshape(2, 32)
+    valid = np.array([True, False])
+
+    assert nanodb_batch.hex_string_array(raw, valid).to_pylist() == [
+        raw[0].tobytes().hex().upper(),
+        None,
+    ]
@@ -0,0 +1,80 @@
+import io
+
+import pytest
+from kaitaistruct import KaitaiStream
+
+import nanodb_fast
+from nanodb import Nanodb
+from ledger_values import (
+    account_value,
+    confirmation_height_value,
+    random_bytes,
+    random_balance,
+    random_values,
+)
+
+
+@pytest.mark.parametrize("value", random_values())
+def test_decode_block_matches_kaitai(value):
+    fast = nanodb_fast.decode_block(value)
+    kaitai = nanodb_fast.decode_block_kaitai(value)
+
+    assert fast._asdict() == kaitai._asdict()
+
+
+@pytest.mark.parametrize("value", random_values())
+def test_decode_block_matches_kaitai_fields(value):
+    blocks_value = Nanodb.BlocksValue(
+        KaitaiStream(io.BytesIO(value)), None, Nanodb(None)
+    )
+    block = blocks_value.block_value.block
+    sideband = blocks_value.block_value.sideband
+    fast = nanodb_fast.decode_block(value)
+
+    assert fast.block_type == blocks_value.block_type.value
+    assert fast.signature == block.signature
+    assert fast.work == block.work
+    assert fast.successor == sideband.successor
+    assert fast.timestamp == sideband.timestamp
+    if blocks_value.block_type == Nanodb.EnumBlocktype.state:
+        assert fast.epoch == sideband.epoch.value
+        assert fast.is_send == sideband.is_send
+        assert fast.is_receive == sideband.is_receive
+        assert fast.is_epoch == sideband.is_epoch
+
+
+def test_decode_block_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        nanodb_fast.decode_block(bytes([1]) + random_bytes(300))
+
+
+def test_decode_confirmation_height_matches_kaitai():
+    value = confirmation_height_value(123456789, random_bytes(32))
+
+    assert nanodb_fast.decode_confirmation_height(
+        value
+    ) == nanodb_fast.decode_confirmation_height_kaitai(value)
+
+
+def test_decode_account_info_matches_kaitai():
+    value = account_value(
+        random_bytes(32),
+        random_bytes(32),
+        random_bytes(32),
+        random_balance(),
+        1650000000,
+        42,
+    )
+    account_info = Nanodb.AccountsValue(KaitaiStream(io.BytesIO(value)))
+
+    assert nanodb_fast.decode_account_info(value) == (
+        account_info.head,
+        account_info.representative,
+        account_info.open_block,
+        account_info.balance,
+        account_info.modified,
+        account_info.block_count,
+    )
+    assert nanodb_fast.decode_account_info(
+        value
+    ) == nanodb_fast.decode_account_info_kaitai(value)
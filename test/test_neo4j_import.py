@@ -0,0 +1,178 @@
+import os
+import random
+import threading
+
+import pytest
+
+import neo4j_import
+
+
+class TransientError(Exception):
+    code = "Neo.TransientError.Transaction.DeadlockDetected"
+
+
+class FakeGraph:
+    """Keeps the nodes and relationships written, fails a share of the transactions."""
+
+    def __init__(self, deadlocks=0.0):
+        self.deadlocks = deadlocks
+        self.lock = threading.Lock()
+        self.nodes = {}
+        self.relationships = []
+        self.transactions = 0
+
+    def run(self, query, rows):
+        with self.lock:
+            self.transactions += 1
+            if random.random() < self.deadlocks:
+                raise TransientError("deadlock")
+            if query == neo4j_import.merge_accounts:
+                for row in rows:
+                    self.nodes[row["address"]] = row
+                return len(rows)
+            relationship_type = query.split("[r:")[1].split("]")[0]
+            count = 0
+            for row in rows:
+                # MATCH of both ends
+                if row["source"] in self.nodes and row["destination"] in self.nodes:
+                    self.relationships.append(
+                        (relationship_type, row["source"], row["destination"])
+                    )
+                    count += 1
+            return count
+
+
+def batch(accounts, count):
+    nodes = []
+    relationships = {"SENT_TO": [], "RECEIVED_FROM": []}
+    for _ in range(count):
+        source, destination = random.sample(accounts, 2)
+        nodes += [{"address": source}, {"address": destination}]
+        relationships[random.choice(list(relationships))].append(
+            {"source": source, "destination": destination}
+        )
+    return nodes, relationships
+
+
+def test_nodes_are_sent_once_and_deadlocks_retried():
+    accounts = ["nano_{}".format(number) for number in range(200)]
+    graph = FakeGraph(deadlocks=0.2)
+    importer = neo4j_import.Importer(
+        graph.run, sessions=4, batch_size=30, retries=50, retry_wait=0
+    )
+    expected = []
+    for _ in range(10):
+        nodes, relationships = batch(accounts, 100)
+        expected += [
+            (relationship_type, row["source"], row["destination"])
+            for relationship_type, rows in relationships.items()
+            for row in rows
+        ]
+        importer.add(nodes, relationships)
+    importer.close()
+
+    assert sorted(graph.relationships) == sorted(expected)
+    assert importer.relationships == len(expected)
+    assert importer.nodes == len(graph.nodes) == len(importer.seen)
+    assert importer.retried > 0 and importer.errors == 0
+    assert "relationships: [1000]" in importer.report()
+
+
+def test_failed_transactions_are_counted():
+    def run(query, rows):
+        if query == neo4j_import.merge_accounts:
+            if rows[0]["address"] == "a":
+                raise ValueError("syntax")
+            return len(rows)
+        raise TransientError("deadlock")
+
+    importer = neo4j_import.Importer(
+        run, sessions=2, batch_size=1, retries=2, retry_wait=0
+    )
+    importer.add(
+        [{"address": "a"}, {"address": "b"}, {"address": "c"}],
+        {
+            "SENT_TO": [
+                {"source": "a", "destination": "b"},
+                {"source": "b", "destination": "c"},
+            ]
+        },
+    )
+    importer.close()
+    # a failed in the batch and again when retried by close, b -> c after retries
+    assert importer.errors == 3
+    assert importer.retried == 2
+    assert importer.relationships == 0
+    assert importer.nodes == 2
+    # a -> b is never sent without a
+    assert importer.held == 1
+    assert importer.seen == {"b", "c"}
+
+
+def test_relationships_wait_for_their_failed_nodes():
+    graph = FakeGraph()
+    failures = ["a"]
+
+    def run(query, rows):
+        if query == neo4j_import.merge_accounts and rows[0]["address"] in failures:
+            failures.remove(rows[0]["address"])
+            raise ValueError("connection reset")
+        return graph.run(query, rows)
+
+    importer = neo4j_import.Importer(run, sessions=2, batch_size=1, retry_wait=0)
+    importer.add(
+        [{"address": "a"}, {"address": "b"}],
+        {"SENT_TO": [{"source": "a", "destination": "b"}]},
+    )
+    assert graph.relationships == []
+    importer.add(
+        [{"address": "c"}], {"RECEIVED_FROM": [{"source": "c", "destination": "b"}]}
+    )
+    importer.close()
+    assert sorted(graph.relationships) == [
+        ("RECEIVED_FROM", "c", "b"),
+        ("SENT_TO", "a", "b"),
+    ]
+    assert importer.relationships == 2 and importer.nodes == 3
+    assert importer.errors == 1 and importer.held == 0
+
+
+def test_is_transient():
+    assert neo4j_import.is_transient(TransientError())
+    assert not neo4j_import.is_transient(ValueError())
+
+
+@pytest.mark.skipif(
+    "NEO4J_URI" not in os.environ,
+    reason="set NEO4J_URI (and NEO4J_USER, NEO4J_PASSWORD) to test against a Neo4j server",
+)
+def test_import_into_neo4j():
+    py2neo = pytest.importorskip("py2neo")
+    graph = py2neo.Graph(
+        os.environ["NEO4J_URI"],
+        auth=(
+            os.environ.get("NEO4J_USER", "neo4j"),
+            os.environ.get("NEO4J_PASSWORD", "neo4j"),
+        ),
+    )
+    label = "nano_import_test_{}".format(random.randrange(10**9))
+    accounts = ["{}_{}".format(label, number) for number in range(50)]
+    importer = neo4j_import.Importer(
+        lambda query, rows: graph.evaluate(query, rows=rows), sessions=4, batch_size=20
+    )
+    nodes, relationships = batch(accounts, 300)
+    try:
+        importer.add(nodes, relationships)
+        importer.close()
+        count = graph.evaluate(
+            "MATCH (s:Account)-[r]->(:Account) WHERE s.address STARTS WITH $label "
+            "RETURN count(r)",
+            label=label,
+        )
+        assert importer.errors == 0
+        assert count == importer.relationships == 300
+    finally:
+        graph.run(
+            "MATCH (a:Account) WHERE a.address STARTS WITH $label DETACH DELETE a",
+            label=label,
+        )
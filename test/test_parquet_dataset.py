@@ -0,0 +1,38 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import parquet_dataset
+
+
+def test_dataset_writer_partitions_by_day_and_type(tmp_path):
+    schema = pa.schema(
+        [
+            pa.field("local_timestamp", pa.int64()),
+            pa.field("type", pa.int8()),
+            pa.field("height", pa.int64()),
+        ]
+    )
+    path = str(tmp_path / "blocks")
+    writer = parquet_dataset.DatasetWriter(
+        path, schema, ["day", "type"], "part-0-{i}.parquet", 2, "zstd", 3
+    )
+    day = 86400
+    writer.write_table(
+        pa.table([[day + 5, 1, day + 1], [1, 1, 2], [1, 2, 3]], schema=schema)
+    )
+    writer.write_table(pa.table([[2 * day], [1], [4]], schema=schema))
+    writer.close()
+
+    table = ds.dataset(path, format="parquet", partitioning="hive").to_table()
+    rows = sorted(
+        (row["height"], str(row["day"]), row["type"]) for row in table.to_pylist()
+    )
+    assert rows == [
+        (1, "1970-01-02", 1),
+        (2, "1970-01-01", 1),
+        (3, "1970-01-02", 2),
+        (4, "1970-01-03", 1),
+    ]
+    assert (
+        tmp_path / "blocks" / "day=1970-01-02" / "type=1" / "part-0-0.parquet"
+    ).exists()
@@ -0,0 +1,20 @@
+import pyarrow as pa
+
+import parquet_hex
+from ledger_values import random_bytes
+
+
+def test_hex_view_renders_binary_columns():
+    hashes = [random_bytes(32), None, random_bytes(32), random_bytes(32)]
+    batch = pa.RecordBatch.from_arrays(
+        [pa.array(hashes, pa.binary(32)), pa.array([1, 2, 3, 4], pa.uint64())],
+        ["hash", "work"],
+    )
+
+    view = parquet_hex.hex_view(batch.slice(1))
+
+    assert view.schema.field("hash").type == pa.string()
+    assert view.column(0).to_pylist() == [
+        None if value is None else value.hex().upper() for value in hashes[1:]
+    ]
+    assert view.column(1).to_pylist() == [2, 3, 4]
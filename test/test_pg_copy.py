@@ -0,0 +1,62 @@
+import struct
+
+import pg_copy
+
+
+def read_numeric(data):
+    ndigits, weight, sign, dscale = struct.unpack_from(">hhhh", data)
+    digits = struct.unpack_from(">{}h".format(ndigits), data, 8)
+    value = 0
+    for position, digit in enumerate(digits):
+        value += digit * 10000 ** (weight - position)
+    return -value if sign == 0x4000 else value
+
+
+def read_copy(buffer, decoders):
+    data = buffer.getvalue()
+    assert data.startswith(pg_copy.HEADER)
+    offset = len(pg_copy.HEADER)
+    rows = []
+    while True:
+        (field_count,) = struct.unpack_from(">h", data, offset)
+        offset += 2
+        if field_count == -1:
+            break
+        assert field_count == len(decoders)
+        row = []
+        for decode in decoders:
+            (length,) = struct.unpack_from(">i", data, offset)
+            offset += 4
+            if length == -1:
+                row.append(None)
+                continue
+            row.append(decode(data[offset : offset + length]))
+            offset += length
+        rows.append(row)
+    assert offset == len(data)
+    return rows
+
+
+def test_numeric():
+    assert pg_copy.numeric(0) == struct.pack(">hhhh", 0, 0, 0, 0)
+    assert pg_copy.numeric(12345678) == struct.pack(">hhhhhh", 2, 1, 0, 0, 1234, 5678)
+    assert pg_copy.numeric(10**8) == struct.pack(">hhhhh", 1, 2, 0, 0, 1)
+    for value in [1, 9999, 10000, -42, 2**128 - 1, 10**38, "1000000000000000"]:
+        assert read_numeric(pg_copy.numeric(value)) == int(value)
+
+
+def test_copy_buffer_round_trip():
+    rows = [
+        ["A" * 64, 2**128 - 1, 1, "1", None],
+        ["B" * 64, 0, 2**31 - 1, "0", "nano_1"],
+    ]
+    encoders = [pg_copy.text, pg_copy.numeric, pg_copy.int4, pg_copy.int4, pg_copy.text]
+    decoders = [
+        bytes.decode,
+        read_numeric,
+        lambda data: struct.unpack(">i", data)[0],
+        lambda data: str(struct.unpack(">i", data)[0]),
+        bytes.decode,
+    ]
+    assert read_copy(pg_copy.copy_buffer(rows, encoders), decoders) == rows
+    assert read_copy(pg_copy.copy_buffer([], encoders), decoders) == []
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import pipeline
+
+
+class Connection:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def load_rows(connection, rows):
+    # Every batch of a worker reuses the connection opened in that worker
+    assert connection.pid == os.getpid()
+    return len(rows)
+
+
+def load_failing(connection, rows):
+    raise ValueError("load failed")
+
+
+def connect_failing():
+    raise ConnectionError("no database")
+
+
+def decode_rows(state, items):
+    loaders.put(load_rows, [key * 2 for key, _ in items])
+    return len(items)
+
+
+def test_read_batches():
+    entries = [(key, b"") for key in range(10)]
+    assert [len(batch) for batch in pipeline.read_batches(entries, 4)] == [4, 4, 2]
+    assert [len(batch) for batch in pipeline.read_batches(entries, 4, 5)] == [4, 1]
+    assert list(pipeline.read_batches([], 4)) == []
+
+
+def test_stage_totals():
+    stage = pipeline.Stage("load", Connection, 3, queue_size=1)
+    for size in range(20):
+        stage.put(load_rows, list(range(size)))
+    stage.put(load_failing, [1])
+    assert stage.close() == (sum(range(20)), 1)
+
+
+def test_stage_without_connection():
+    stage = pipeline.Stage("load", connect_failing, 2)
+    with pytest.raises(RuntimeError):
+        for _ in range(10):
+            stage.put(load_rows, [1])
+
+
+def test_chained_stages():
+    # Decoders forked after the loaders put their output on the loader queue
+    global loaders
+    loaders = pipeline.Stage("load", Connection, 2, queue_size=2)
+    decoders = pipeline.Stage("decode", Connection, 2, queue_size=2)
+    reader = pipeline.Counter("read")
+    monitor = pipeline.Monitor([reader, decoders, loaders], interval=60)
+    entries = [(key, b"") for key in range(1000)]
+    for items in pipeline.read_batches(entries, 64):
+        decoders.put(decode_rows, items)
+        reader.add(len(items))
+    assert decoders.close() == (1000, 0)
+    assert loaders.close() == (1000, 0)
+    report = monitor.report(since_start=True)
+    assert report.startswith("read ")
+    assert "decode " in report and "queue 0/2" in report